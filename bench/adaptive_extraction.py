@@ -0,0 +1,134 @@
+"""
+Benchmark de la extracción adaptativa (keyframes + interpolación / flujo óptico)
+contra la extracción completa (MediaPipe en todos los frames muestreados).
+
+Por configuración reporta frames/s, speedup, fracción de frames con inferencia y
+el error de los landmarks respecto de la extracción completa, en largos de
+torso (media, p95 y PCK@0.1 / PCK@0.2), contando solo articulaciones visibles
+en la referencia. Se usa el torso (hombros a caderas) y no el ancho de hombros
+porque en tiros de perfil los hombros casi se superponen. Ojo: MediaPipe suaviza
+y trackea entre llamadas, así que los keyframes tampoco coinciden exactamente
+con la pasada completa.
+Con --clips se usa un set de referencia real; sin clips se genera el video
+sintético de bench/run.py.
+
+Uso:
+    python bench/adaptive_extraction.py --clips clip1.mp4 clip2.mp4 --intervals 2 4 8 --modes interp flow
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ml"))
+
+from extract_keypoints import POSE_LANDMARK_NAMES, AdaptiveConfig, create_pose, extract_from_video  # type: ignore  # noqa: E402
+from keypoint_store import frames_to_keypoints  # type: ignore  # noqa: E402
+
+
+def _keypoints(data: Dict[str, Any]) -> np.ndarray:
+    return frames_to_keypoints(data["frames"], POSE_LANDMARK_NAMES)  # [T, J, 3]
+
+
+def landmark_errors(ref: Dict[str, Any], test: Dict[str, Any], min_visibility: float = 0.5) -> np.ndarray:
+    """
+    Error por articulación visible en la referencia, en largos de torso (mediana
+    del clip en la referencia, en pixeles: un frame mal detectado no cambia la escala).
+    """
+    size = np.array([ref["width"], ref["height"]], dtype=np.float64)
+    a, b = _keypoints(ref), _keypoints(test)
+    pa, pb = a[:, :, :2] * size, b[:, :, :2] * size
+    torso = np.linalg.norm(0.5 * (pa[:, 11] + pa[:, 12]) - 0.5 * (pa[:, 23] + pa[:, 24]), axis=-1)  # [T]
+    torso = torso[(a[:, [11, 12, 23, 24], 2] >= min_visibility).all(axis=1)]
+    if len(torso) == 0:
+        return np.zeros(0)
+    scale = max(float(np.median(torso)), 1e-6)
+    # frames sin detección en la prueba cuentan como error infinito (no se descartan)
+    detected = b[:, :, 2].max(axis=1) > 0
+    err = np.linalg.norm(pa - pb, axis=-1) / scale
+    err = np.where(detected[:, None], err, np.inf)
+    return err[a[:, :, 2] >= min_visibility]
+
+
+def _timed_extract(video: str, pose, stride: int, adaptive=None) -> tuple:
+    t0 = time.perf_counter()
+    data = extract_from_video(video, stride=stride, pose=pose, adaptive=adaptive)
+    return time.perf_counter() - t0, data
+
+
+def run(clips: List[str], intervals: List[int], modes: List[str], stride: int, model_complexity: int, base_cfg: AdaptiveConfig) -> Dict[str, Any]:
+    pose = create_pose(model_complexity=model_complexity)
+    try:
+        _timed_extract(clips[0], pose, stride)  # warm-up
+        refs = []
+        full_sec = 0.0
+        frames = 0
+        for clip in clips:
+            sec, data = _timed_extract(clip, pose, stride)
+            refs.append(data)
+            full_sec += sec
+            frames += len(data["frames"])
+        rows = [{"mode": "full", "keyframe_interval": 1, "frames_per_sec": round(frames / full_sec, 2), "speedup": 1.0,
+                 "inference_fraction": 1.0}]
+
+        for mode in modes:
+            for interval in intervals:
+                cfg = AdaptiveConfig(**{**base_cfg.__dict__, "mode": mode, "keyframe_interval": interval})
+                sec_total, keyframes, errors = 0.0, 0, []
+                for clip, ref in zip(clips, refs):
+                    sec, data = _timed_extract(clip, pose, stride, cfg)
+                    sec_total += sec
+                    keyframes += data.get("adaptive", {}).get("keyframes", len(data["frames"]))
+                    errors.append(landmark_errors(ref, data, cfg.min_visibility))
+                err = np.concatenate(errors) if errors else np.zeros(0)
+                finite = err[np.isfinite(err)]
+                rows.append({
+                    "mode": mode,
+                    "keyframe_interval": interval,
+                    "frames_per_sec": round(frames / sec_total, 2),
+                    "speedup": round(full_sec / sec_total, 2),
+                    "inference_fraction": round(keyframes / max(1, frames), 3),
+                    "error_mean": round(float(finite.mean()), 4) if len(finite) else None,
+                    "error_p95": round(float(np.percentile(err, 95, method="higher")), 4) if len(err) else None,
+                    "pck_0.1": round(float((err <= 0.1).mean()), 4) if len(err) else None,
+                    "pck_0.2": round(float((err <= 0.2).mean()), 4) if len(err) else None,
+                })
+    finally:
+        pose.close()
+    return {"clips": clips, "frames": frames, "stride": stride, "model_complexity": model_complexity, "results": rows}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extracción adaptativa vs. completa: throughput y error")
+    parser.add_argument("--clips", type=str, nargs="*", default=[])
+    parser.add_argument("--intervals", type=int, nargs="+", default=[2, 4, 8])
+    parser.add_argument("--modes", type=str, nargs="+", default=["interp", "flow"], choices=["interp", "flow"])
+    parser.add_argument("--stride", type=int, default=1)
+    parser.add_argument("--model_complexity", type=int, default=1)
+    parser.add_argument("--motion_threshold", type=float, default=AdaptiveConfig.motion_threshold)
+    parser.add_argument("--pose_motion_threshold", type=float, default=AdaptiveConfig.pose_motion_threshold)
+    parser.add_argument("--output", type=str, default="")
+    args = parser.parse_args()
+
+    clips = args.clips
+    if not clips:
+        from run import make_synthetic_video  # type: ignore
+
+        clips = [make_synthetic_video(os.path.join(tempfile.mkdtemp(prefix="bench_adaptive_"), "synthetic.mp4"))]
+
+    base_cfg = AdaptiveConfig(motion_threshold=args.motion_threshold, pose_motion_threshold=args.pose_motion_threshold)
+    report = run(clips, args.intervals, args.modes, args.stride, args.model_complexity, base_cfg)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""
+Benchmark de arranque en frío de pose-service: levanta `uvicorn main:app` en un
+proceso nuevo (como una instancia de Cloud Run que escala desde cero) y mide
+desde el arranque del proceso hasta:
+- health_ms: la primera respuesta de GET /health (uvicorn recién escucha cuando
+  termina el startup de FastAPI, warmup incluido)
+- ready_ms: /health con ready=true
+- first_pose_ms: la primera respuesta 200 de POST /pose
+Además reporta un segundo /pose con el proceso caliente (warm_pose_ms) y el
+tiempo de `import main` en un intérprete nuevo (import_main_ms).
+
+Cada repetición usa un proceso nuevo y se reporta la mediana. bench/run.py lo
+incluye como suite `cold_start`, así se compara contra el baseline.
+
+Uso:
+    python bench/cold_start.py --executors process thread --workers 1 2 --repeats 3
+"""
+import argparse
+import json
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+SERVICE_DIR = os.path.join(REPO_DIR, "pose-service")
+sys.path.insert(0, os.path.join(REPO_DIR, "ml"))
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _service_env(work_dir: str, executor: str, workers: int, extra: Dict[str, str]) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update({
+        # sin cache: el primer /pose de cada repetición tiene que extraer de verdad
+        "POSE_CACHE_ENABLED": "0",
+        "POSE_EXECUTOR": executor,
+        "POSE_WORKERS": str(workers),
+        "POSE_JOB_DB": os.path.join(work_dir, "jobs.sqlite3"),
+    })
+    env.update(extra)
+    return env
+
+
+def import_main_sec(env: Dict[str, str]) -> float:
+    code = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+    out = subprocess.check_output([sys.executable, "-c", code], cwd=SERVICE_DIR, env=env, stderr=subprocess.DEVNULL, text=True)
+    return float(out.strip().splitlines()[-1])
+
+
+def cold_start_once(video_url: str, target_frames: int, env: Dict[str, str], timeout: float) -> Dict[str, float]:
+    """Arranca el servicio y devuelve los tiempos (segundos desde el Popen)."""
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    cmd = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"]
+    with tempfile.TemporaryFile() as log:
+        t0 = time.perf_counter()
+        proc = subprocess.Popen(cmd, cwd=SERVICE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=log)
+        try:
+            out: Dict[str, float] = {}
+            with httpx.Client(base_url=base_url, timeout=timeout) as client:
+                while "ready" not in out:
+                    if proc.poll() is not None:
+                        log.seek(0)
+                        tail = log.read().decode("utf-8", "replace")[-2000:]
+                        raise RuntimeError(f"pose-service exited with code {proc.returncode}:\n{tail}")
+                    if time.perf_counter() - t0 > timeout:
+                        raise TimeoutError(f"pose-service not ready after {timeout}s")
+                    try:
+                        health = client.get("/health").json()
+                    except httpx.TransportError:
+                        time.sleep(0.01)
+                        continue
+                    out.setdefault("health", time.perf_counter() - t0)
+                    if health.get("ready"):
+                        out["ready"] = time.perf_counter() - t0
+                    else:
+                        time.sleep(0.01)
+
+                body = {"videoUrl": video_url, "targetFrames": target_frames}
+                resp = client.post("/pose", json=body)
+                if resp.status_code != 200:
+                    raise RuntimeError(f"/pose returned {resp.status_code}: {resp.text[:200]}")
+                out["first_pose"] = time.perf_counter() - t0
+                t1 = time.perf_counter()
+                resp = client.post("/pose", json=body)
+                if resp.status_code != 200:
+                    raise RuntimeError(f"/pose returned {resp.status_code}: {resp.text[:200]}")
+                out["warm_pose"] = time.perf_counter() - t1
+            return out
+        finally:
+            proc.terminate()
+            try:
+                proc.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.wait()
+
+
+def bench_cold_start(
+    video: str,
+    target_frames: int,
+    executors: List[str],
+    workers: List[int],
+    repeats: int,
+    extra_env: Optional[Dict[str, str]] = None,
+    timeout: float = 300.0,
+) -> Dict[str, Dict[str, float]]:
+    from run import serve_directory  # type: ignore
+
+    work_dir = tempfile.mkdtemp(prefix="bench_cold_start_")
+    server, base_url = serve_directory(os.path.dirname(os.path.abspath(video)))
+    out: Dict[str, Dict[str, float]] = {}
+    try:
+        url = f"{base_url}/{os.path.basename(video)}"
+        for executor in executors:
+            for n in workers:
+                env = _service_env(work_dir, executor, n, extra_env or {})
+                runs = [cold_start_once(url, target_frames, env, timeout) for _ in range(max(1, repeats))]
+                imports = [import_main_sec(env) for _ in range(max(1, repeats))]
+                row = {f"{k}_ms": round(1000 * statistics.median(r[k] for r in runs), 1) for k in runs[0]}
+                row["import_main_ms"] = round(1000 * statistics.median(imports), 1)
+                out[f"{executor}_w{n}"] = row
+    finally:
+        server.shutdown()
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return out
+
+
+def _parse_env(items: List[str]) -> Dict[str, str]:
+    out = {}
+    for item in items:
+        key, sep, value = item.partition("=")
+        if not sep:
+            raise argparse.ArgumentTypeError(f"invalid env override: {item!r} (expected KEY=VALUE)")
+        out[key] = value
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Arranque en frío de pose-service hasta el primer /pose")
+    parser.add_argument("--clip", type=str, default="", help="por defecto un video sintético")
+    parser.add_argument("--target_frames", type=int, default=16)
+    parser.add_argument("--executors", type=str, nargs="+", default=["process"], choices=["process", "thread"])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1])
+    parser.add_argument("--repeats", type=int, default=3, help="se reporta la mediana")
+    parser.add_argument("--env", type=str, nargs="*", default=[], help="variables extra del servicio, KEY=VALUE")
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--output", type=str, default="")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="bench_cold_clip_")
+    try:
+        clip = args.clip
+        if not clip:
+            from run import make_synthetic_video  # type: ignore
+
+            clip = make_synthetic_video(os.path.join(work_dir, "synthetic.mp4"))
+        results = bench_cold_start(
+            clip, args.target_frames, args.executors, args.workers, args.repeats, _parse_env(args.env), args.timeout
+        )
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {"cpu_count": os.cpu_count(), "clip": args.clip or "synthetic", "target_frames": args.target_frames, "results": results}
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Benchmark de los backends de video_decoder: OpenCV (cv2.VideoCapture) vs. PyAV
+con distintos threads de decodificación y escalado en el decoder.
+
+Por clip y configuración reporta frames/s entregados (decode + conversión a BGR
++ escalado), frames leídos del contenedor y speedup contra OpenCV a resolución
+completa. Además compara los dos backends a resolución completa: diferencia
+media de píxeles y diferencia máxima entre el tiempo por PTS (pyav) y
+index / fps (opencv), que en videos de frame rate variable muestra el error del
+tMs anterior.
+
+Uso:
+    python bench/decoder_backends.py --clips clip1.mp4 clip2.mp4 --threads 1 0 --long_sides 0 640 --strides 1 4
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ml"))
+
+from video_decoder import av, open_video  # type: ignore  # noqa: E402
+
+
+def _decode(video_path: str, backend: str, threads: int, long_side: int, stride: int) -> tuple:
+    t0 = time.perf_counter()
+    with open_video(video_path, backend, long_side, threads) as dec:
+        used = sum(1 for _ in dec.frames(itertools.count(0, stride)))
+        decoded = dec.frames_decoded
+    return time.perf_counter() - t0, used, decoded
+
+
+def _timed(fn, repeats: int) -> tuple:
+    # mediana de `repeats` corridas
+    runs = [fn() for _ in range(max(1, repeats))]
+    sec = float(np.median([r[0] for r in runs]))
+    return (sec,) + runs[0][1:]
+
+
+def compare_backends(video_path: str) -> Dict[str, Any]:
+    with open_video(video_path, "opencv") as a, open_video(video_path, "pyav") as b:
+        fa = list(a.frames(itertools.count()))
+        fb = list(b.frames(itertools.count()))
+    n = min(len(fa), len(fb))
+    pixel = [float(np.abs(x[2].astype(np.int16) - y[2].astype(np.int16)).mean()) for x, y in zip(fa[:n], fb[:n]) if x[2].shape == y[2].shape]
+    return {
+        "frames_opencv": len(fa),
+        "frames_pyav": len(fb),
+        "pixel_mean_abs_diff": round(float(np.mean(pixel)), 4) if pixel else None,
+        "shape_mismatches": n - len(pixel),
+        "max_time_diff_ms": round(1000 * max((abs(x[1] - y[1]) for x, y in zip(fa[:n], fb[:n])), default=0.0), 2),
+    }
+
+
+def bench_clip(video_path: str, threads: List[int], long_sides: List[int], strides: List[int], repeats: int) -> Dict[str, Any]:
+    configs = [("opencv", 1, s) for s in long_sides]
+    if av is not None:
+        configs += [("pyav", t, s) for t in threads for s in long_sides]
+
+    rows = []
+    for stride in strides:
+        base_sec = None
+        for backend, n_threads, long_side in configs:
+            sec, used, decoded = _timed(lambda: _decode(video_path, backend, n_threads, long_side, stride), repeats)
+            if backend == "opencv" and long_side == 0:
+                base_sec = sec
+            rows.append({
+                "backend": backend,
+                "threads": n_threads if backend == "pyav" else 1,
+                "max_long_side": long_side,
+                "stride": stride,
+                "frames_used": used,
+                "frames_decoded": decoded,
+                "frames_per_sec": round(used / sec, 2) if sec > 0 else None,
+                "speedup": round(base_sec / sec, 2) if base_sec and sec > 0 else None,
+            })
+
+    with open_video(video_path, "opencv") as dec:
+        info = dec.info.__dict__
+    report = {"clip": video_path, "info": info, "results": rows}
+    if av is not None:
+        report["agreement"] = compare_backends(video_path)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de decoders: OpenCV vs. PyAV")
+    parser.add_argument("--clips", type=str, nargs="*", default=[])
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 0], help="threads de pyav (0 = automático)")
+    parser.add_argument("--long_sides", type=int, nargs="+", default=[0, 640], help="0 = resolución completa")
+    parser.add_argument("--strides", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--repeats", type=int, default=3, help="se reporta la mediana")
+    parser.add_argument("--output", type=str, default="")
+    args = parser.parse_args()
+
+    if av is None:
+        print("PyAV no está instalado: solo se mide OpenCV (pip install av)", file=sys.stderr)
+
+    clips = args.clips
+    if not clips:
+        from run import make_synthetic_video  # type: ignore
+
+        clips = [make_synthetic_video(os.path.join(tempfile.mkdtemp(prefix="bench_decoder_"), "synthetic.mp4"), width=1280, height=720)]
+
+    report = {
+        "cpu_count": os.cpu_count(),
+        "pyav": getattr(av, "__version__", None),
+        "clips": [bench_clip(p, args.threads, args.long_sides, args.strides, args.repeats) for p in clips],
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Benchmark de carga de datos: samples/s de PoseSequenceDataset (JSON y npy)
+contra PackedPoseDataset (shards con memmap), con DataLoader multi-worker.
+
+Uso:
+    python bench/loader_throughput.py --synthetic 2000 --workers 0 4
+    python bench/loader_throughput.py --data_dir ml_data --packed_dir ml_packed --split train
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ml"))
+
+from torch.utils.data import DataLoader  # noqa: E402
+
+from datasets import POSE_NAMES, PackedPoseDataset, PoseSequenceDataset  # type: ignore  # noqa: E402
+from keypoint_store import convert_json_file  # type: ignore  # noqa: E402
+from pack_shards import pack_split  # type: ignore  # noqa: E402
+
+
+def make_synthetic(root: str, split: str, n: int, min_t: int = 24, max_t: int = 96, seed: int = 0) -> None:
+    """JSON con el mismo formato que extract_keypoints + labels/targets."""
+    rng = np.random.default_rng(seed)
+    out_dir = os.path.join(root, split)
+    os.makedirs(out_dir, exist_ok=True)
+    for i in range(n):
+        T = int(rng.integers(min_t, max_t + 1))
+        kps = rng.random((T, len(POSE_NAMES), 3))
+        frames = [
+            {
+                "index": t,
+                "time_sec": t / 30.0,
+                "keypoints": [
+                    {"name": name, "x": float(x), "y": float(y), "v": float(v)}
+                    for name, (x, y, v) in zip(POSE_NAMES, kps[t])
+                ],
+            }
+            for t in range(T)
+        ]
+        sample = {
+            "version": 1,
+            "fps": 30.0,
+            "width": 1920,
+            "height": 1080,
+            "frames": frames,
+            "labels": {k: int(rng.integers(0, 2)) for k in ("a", "b", "c", "d")},
+            "targets": {"ite": float(rng.random()), "delay_ms": float(rng.random() * 100)},
+        }
+        with open(os.path.join(out_dir, f"sample_{i:05d}.json"), "w", encoding="utf-8") as f:
+            json.dump(sample, f)
+
+
+def throughput(ds, workers: int, max_samples: int) -> float:
+    loader = DataLoader(ds, batch_size=None, shuffle=True, num_workers=workers)
+    n = 0
+    t0 = time.perf_counter()
+    for _ in loader:
+        n += 1
+        if n >= max_samples:
+            break
+    return n / (time.perf_counter() - t0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de loaders de keypoints")
+    parser.add_argument("--data_dir", type=str, default="")
+    parser.add_argument("--npy_dir", type=str, default="")
+    parser.add_argument("--packed_dir", type=str, default="")
+    parser.add_argument("--split", type=str, default="train")
+    parser.add_argument("--synthetic", type=int, default=0, help="generar N muestras sintéticas")
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 4])
+    parser.add_argument("--max_samples", type=int, default=2000)
+    parser.add_argument("--output", type=str, default="")
+    args = parser.parse_args()
+
+    data_dir, npy_dir, packed_dir = args.data_dir, args.npy_dir, args.packed_dir
+    if args.synthetic:
+        work = tempfile.mkdtemp(prefix="bench_loader_")
+        data_dir = os.path.join(work, "json")
+        make_synthetic(data_dir, args.split, args.synthetic)
+    if not data_dir:
+        parser.error("--data_dir o --synthetic es requerido")
+
+    if not npy_dir:
+        npy_dir = tempfile.mkdtemp(prefix="bench_npy_")
+        src = os.path.join(data_dir, args.split)
+        for name in sorted(os.listdir(src)):
+            if name.endswith(".json"):
+                convert_json_file(os.path.join(src, name), os.path.join(npy_dir, args.split, name[: -len(".json")]))
+    if not packed_dir:
+        packed_dir = tempfile.mkdtemp(prefix="bench_packed_")
+        pack_split(data_dir, args.split, packed_dir)
+
+    datasets = {
+        "json": PoseSequenceDataset(data_dir, split=args.split, fmt="json"),
+        "npy": PoseSequenceDataset(npy_dir, split=args.split, fmt="npy"),
+        "packed": PackedPoseDataset(packed_dir, split=args.split),
+    }
+    report = {"split": args.split, "num_samples": len(datasets["json"]), "results": []}
+    for workers in args.workers:
+        row = {"workers": workers}
+        for name, ds in datasets.items():
+            row[f"{name}_samples_per_sec"] = round(throughput(ds, workers, args.max_samples), 1)
+        row["packed_vs_json"] = round(row["packed_samples_per_sec"] / row["json_samples_per_sec"], 2)
+        report["results"].append(row)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
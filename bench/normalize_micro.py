@@ -0,0 +1,106 @@
+"""
+Micro-benchmark de normalize_sequence_xy y del decode de keypoints JSON:
+implementación anterior (loops de Python) vs. versiones vectorizadas (NumPy y
+torch batch). Verifica además que los resultados sean numéricamente iguales.
+
+Uso:
+    python bench/normalize_micro.py --lengths 32 64 128 256 1024 --batch 16
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ml"))
+
+import torch  # noqa: E402
+
+from datasets import NAME_TO_IDX, POSE_NAMES, normalize_sequence_xy, normalize_sequence_xy_torch  # type: ignore  # noqa: E402
+from keypoint_store import frames_to_keypoints  # type: ignore  # noqa: E402
+
+
+def normalize_loop(seq_xy: np.ndarray) -> np.ndarray:
+    # implementación anterior, frame a frame
+    out = seq_xy.copy()
+    lh, rh = NAME_TO_IDX["left_hip"], NAME_TO_IDX["right_hip"]
+    ls, rs = NAME_TO_IDX["left_shoulder"], NAME_TO_IDX["right_shoulder"]
+    for t in range(out.shape[0]):
+        scale = 1.0
+        pelvis = 0.5 * (out[t, lh, :2] + out[t, rh, :2])
+        d = np.linalg.norm(out[t, ls, :2] - out[t, rs, :2])
+        if d > 1e-6:
+            scale = d
+        out[t, :, :2] = (out[t, :, :2] - pelvis) / max(scale, 1e-3)
+    return out
+
+
+def decode_loop(frames) -> np.ndarray:
+    # implementación anterior del llenado en PoseSequenceDataset.__getitem__
+    T, J = len(frames), len(POSE_NAMES)
+    out = np.zeros((T, J, 3), dtype=np.float32)
+    for t, fr in enumerate(frames):
+        for kp in fr["keypoints"]:
+            j = NAME_TO_IDX.get(kp["name"], None)
+            if j is None or j >= J:
+                continue
+            out[t, j, 0] = float(kp.get("x", 0.0))
+            out[t, j, 1] = float(kp.get("y", 0.0))
+            out[t, j, 2] = float(kp.get("v", 0.0))
+    return out
+
+
+def _best(fn, number: int) -> float:
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number
+
+
+def bench_length(T: int, batch: int, rng: np.random.Generator) -> dict:
+    J = len(POSE_NAMES)
+    seq = rng.random((T, J, 3)).astype(np.float32)
+    frames = [
+        {"keypoints": [{"name": n, "x": float(x), "y": float(y), "v": float(v)} for n, (x, y, v) in zip(POSE_NAMES, seq[t])]}
+        for t in range(T)
+    ]
+    xy = seq[:, :, :2]
+    batch_np = rng.random((batch, T, J, 3)).astype(np.float32)
+    batch_t = torch.from_numpy(batch_np)
+
+    ref = normalize_loop(xy)
+    vec = normalize_sequence_xy(xy)
+    ref_batch = np.stack([np.concatenate([normalize_loop(b[:, :, :2]), b[:, :, 2:]], axis=-1) for b in batch_np])
+    torch_batch = normalize_sequence_xy_torch(batch_t).numpy()
+
+    number = max(1, 2000 // T)
+    return {
+        "T": T,
+        "normalize_loop_us": round(_best(lambda: normalize_loop(xy), number) * 1e6, 1),
+        "normalize_numpy_us": round(_best(lambda: normalize_sequence_xy(xy), number) * 1e6, 1),
+        "normalize_torch_batch_us_per_seq": round(_best(lambda: normalize_sequence_xy_torch(batch_t), number) * 1e6 / batch, 1),
+        "normalize_numpy_max_abs_diff": float(np.abs(vec - ref).max()),
+        "normalize_torch_max_abs_diff": float(np.abs(torch_batch - ref_batch).max()),
+        "decode_loop_us": round(_best(lambda: decode_loop(frames), number) * 1e6, 1),
+        "decode_vectorized_us": round(_best(lambda: frames_to_keypoints(frames, POSE_NAMES), number) * 1e6, 1),
+        "decode_identical": bool(np.array_equal(decode_loop(frames), frames_to_keypoints(frames, POSE_NAMES))),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark de normalización y decode de keypoints")
+    parser.add_argument("--lengths", type=int, nargs="+", default=[32, 64, 128, 256, 1024])
+    parser.add_argument("--batch", type=int, default=16)
+    parser.add_argument("--output", type=str, default="")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    report = [bench_length(T, args.batch, rng) for T in args.lengths]
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
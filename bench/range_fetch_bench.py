@@ -0,0 +1,228 @@
+"""
+Benchmark de la descarga parcial con HTTP Range de pose-service (range_fetch.py)
+contra la descarga completa.
+
+Sirve los clips con un http.server local que soporta Range (un rango por
+request, ETag/If-Range) y opcionalmente limita ancho de banda y agrega latencia
+por request, para parecerse a un bucket remoto. Por clip y targetFrames
+reporta bytes transferidos y requests (contados en el servidor), latencia de la
+descarga y de POST /pose de punta a punta (mediana), speedup y si los
+keypoints coinciden con los de la descarga completa. Con --no_ranges el
+servidor ignora Range y se verifica el fallback.
+
+Uso:
+    python bench/range_fetch_bench.py --clips clip1.mp4 --target_frames 8 16 32 --bandwidth_mbps 50 --rtt_ms 30
+"""
+import argparse
+import asyncio
+import functools
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+_CHUNK = 64 * 1024
+
+
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+    """SimpleHTTPRequestHandler con Range de un solo rango, ETag y límites de red simulados."""
+
+    ranges = True
+    bandwidth = 0.0  # bytes/s, 0 = sin límite
+    rtt = 0.0  # segundos por request
+    lock = threading.Lock()
+    sent_bytes = 0
+    requests = 0
+
+    def log_message(self, format, *args):  # noqa: A002
+        pass
+
+    @classmethod
+    def reset_counters(cls) -> None:
+        with cls.lock:
+            cls.sent_bytes = 0
+            cls.requests = 0
+
+    def _send_body(self, f, length: int) -> None:
+        sent = 0
+        while sent < length:
+            data = f.read(min(_CHUNK, length - sent))
+            if not data:
+                break
+            self.wfile.write(data)
+            sent += len(data)
+            if self.bandwidth > 0:
+                time.sleep(len(data) / self.bandwidth)
+        with self.lock:
+            type(self).sent_bytes += sent
+
+    def do_GET(self):
+        with self.lock:
+            type(self).requests += 1
+        if self.rtt > 0:
+            time.sleep(self.rtt)
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return
+        size = os.path.getsize(path)
+        etag = f'"{int(os.path.getmtime(path))}-{size}"'
+        start, end = 0, size - 1
+        header = self.headers.get("Range")
+        if_range = self.headers.get("If-Range")
+        partial = self.ranges and header and header.startswith("bytes=") and "," not in header and if_range in (None, etag)
+        if partial:
+            first, _, last = header[len("bytes="):].partition("-")
+            if first:
+                start, end = int(first), min(size - 1, int(last)) if last else size - 1
+            else:
+                start = max(0, size - int(last))
+            if start >= size or start > end:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", "video/mp4")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("ETag", etag)
+        if self.ranges:
+            self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+        with open(path, "rb") as f:
+            f.seek(start)
+            self._send_body(f, end - start + 1)
+
+
+def serve_ranges(directory: str, ranges: bool, bandwidth_mbps: float, rtt_ms: float) -> tuple:
+    handler = type(
+        "Handler",
+        (RangeRequestHandler,),
+        {"ranges": ranges, "bandwidth": bandwidth_mbps * 1e6 / 8, "rtt": rtt_ms / 1000.0},
+    )
+    server = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(handler, directory=directory))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, handler, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+async def _run(main, handler, url: str, target_frames: List[int], repeats: int) -> List[Dict[str, Any]]:
+    import httpx
+
+    rows = []
+    await main.startup()
+    try:
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://pose-service", timeout=None) as client:
+
+            async def pose(frames: int) -> tuple:
+                t0 = time.perf_counter()
+                resp = await client.post("/pose", json={"videoUrl": url, "targetFrames": frames})
+                if resp.status_code != 200:
+                    raise RuntimeError(f"/pose returned {resp.status_code}: {resp.text[:200]}")
+                return time.perf_counter() - t0, resp.json()["frames"]
+
+            await pose(target_frames[0])  # warm-up
+            for frames in target_frames:
+                modes: Dict[str, Dict[str, Any]] = {}
+                for mode in ("full", "range"):
+                    main.POSE_RANGE_FETCH = mode == "range"
+                    settings = main.request_settings(main.PoseRequest(videoUrl=url, targetFrames=frames))
+                    download, pose_sec = [], []
+                    for _ in range(max(1, repeats)):
+                        handler.reset_counters()
+                        t0 = time.perf_counter()
+                        path, _, _ = await main.download_video(url, frames, main.range_probe_bytes(settings))
+                        download.append(time.perf_counter() - t0)
+                        os.remove(path)
+                        sent, requests = handler.sent_bytes, handler.requests
+                        sec, result = await pose(frames)
+                        pose_sec.append(sec)
+                    modes[mode] = {
+                        "bytes": sent,
+                        "requests": requests,
+                        "download_ms": round(1000 * statistics.median(download), 1),
+                        "pose_ms": round(1000 * statistics.median(pose_sec), 1),
+                        "frames": result,
+                    }
+                full, ranged = modes["full"], modes["range"]
+                rows.append({
+                    "target_frames": frames,
+                    "full_bytes": full["bytes"],
+                    "range_bytes": ranged["bytes"],
+                    "bytes_fraction": round(ranged["bytes"] / max(1, full["bytes"]), 4),
+                    "range_requests": ranged["requests"],
+                    "full_download_ms": full["download_ms"],
+                    "range_download_ms": ranged["download_ms"],
+                    "full_pose_ms": full["pose_ms"],
+                    "range_pose_ms": ranged["pose_ms"],
+                    "pose_speedup": round(full["pose_ms"] / ranged["pose_ms"], 2) if ranged["pose_ms"] else None,
+                    "identical": full["frames"] == ranged["frames"],
+                })
+    finally:
+        await main.shutdown()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Descarga parcial (HTTP Range) vs. completa en pose-service")
+    parser.add_argument("--clips", type=str, nargs="*", default=[])
+    parser.add_argument("--target_frames", type=int, nargs="+", default=[8, 16, 32])
+    parser.add_argument("--bandwidth_mbps", type=float, default=0.0, help="0 = sin límite")
+    parser.add_argument("--rtt_ms", type=float, default=0.0, help="latencia agregada por request")
+    parser.add_argument("--no_ranges", action="store_true", help="servidor sin soporte de Range (fallback)")
+    parser.add_argument("--repeats", type=int, default=3, help="se reporta la mediana")
+    parser.add_argument("--video_seconds", type=float, default=30.0)
+    parser.add_argument("--output", type=str, default="")
+    args = parser.parse_args()
+
+    # se mide la descarga y la extracción, no la cache; la config se lee al importar main
+    os.environ["POSE_CACHE_ENABLED"] = "0"
+    os.environ.setdefault("POSE_DECODER", "pyav")
+    os.environ.setdefault("POSE_EXECUTOR", "thread")
+    os.environ.setdefault("POSE_WORKERS", "1")
+    sys.path.insert(0, os.path.join(REPO_DIR, "ml"))
+    sys.path.insert(0, os.path.join(REPO_DIR, "pose-service"))
+    import main as pose_main  # type: ignore
+
+    work_dir = tempfile.mkdtemp(prefix="bench_range_")
+    try:
+        clips = args.clips
+        if not clips:
+            from run import make_synthetic_video  # type: ignore
+
+            clips = [make_synthetic_video(os.path.join(work_dir, "synthetic.mp4"), seconds=args.video_seconds, width=1280, height=720)]
+
+        report = {"bandwidth_mbps": args.bandwidth_mbps, "rtt_ms": args.rtt_ms, "ranges": not args.no_ranges, "clips": []}
+        for clip in clips:
+            server, handler, base_url = serve_ranges(
+                os.path.dirname(os.path.abspath(clip)), not args.no_ranges, args.bandwidth_mbps, args.rtt_ms
+            )
+            try:
+                url = f"{base_url}/{os.path.basename(clip)}"
+                rows = asyncio.run(_run(pose_main, handler, url, args.target_frames, args.repeats))
+            finally:
+                server.shutdown()
+            report["clips"].append({"clip": clip, "bytes": os.path.getsize(clip), "results": rows})
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Benchmark del preprocesado antes de MediaPipe (FramePreprocessor): frame completo
+vs. downscale a distintos lados largos vs. recorte a la persona (ROI) vs. ambos.
+
+Por configuración reporta frames/s (decode + preprocesado + inferencia), speedup
+y el error de los landmarks contra el frame completo (en largos de torso, ver
+bench/adaptive_extraction.py), además de la tasa de detección.
+
+Uso:
+    python bench/roi_preprocess.py --clips clip_1080p.mp4 clip_4k.mp4 --long_sides 1280 960 640
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ml"))
+
+from adaptive_extraction import landmark_errors  # type: ignore  # noqa: E402
+from extract_keypoints import create_pose, extract_from_video  # type: ignore  # noqa: E402
+
+
+def _detection_rate(data: Dict[str, Any]) -> float:
+    frames = data["frames"]
+    hits = sum(max(kp["v"] for kp in fr["keypoints"]) > 0 for fr in frames)
+    return hits / max(1, len(frames))
+
+
+def run(clips: List[str], long_sides: List[int], stride: int, model_complexity: int) -> Dict[str, Any]:
+    configs = [("full", 0, False)]
+    configs += [(f"long{s}", s, False) for s in long_sides]
+    configs += [("roi", 0, True)]
+    configs += [(f"roi_long{s}", s, True) for s in long_sides]
+
+    pose = create_pose(model_complexity=model_complexity)
+    rows = []
+    try:
+        extract_from_video(clips[0], stride=stride, pose=pose)  # warm-up
+        refs: List[Dict[str, Any]] = []
+        full_sec = 0.0
+        for name, long_side, roi in configs:
+            sec_total, frames, errors, detected = 0.0, 0, [], []
+            for i, clip in enumerate(clips):
+                t0 = time.perf_counter()
+                data = extract_from_video(clip, stride=stride, pose=pose, max_long_side=long_side, roi=roi)
+                sec_total += time.perf_counter() - t0
+                frames += len(data["frames"])
+                detected.append(_detection_rate(data))
+                if name == "full":
+                    refs.append(data)
+                else:
+                    errors.append(landmark_errors(refs[i], data))
+            if name == "full":
+                full_sec = sec_total
+            row = {
+                "config": name,
+                "max_long_side": long_side,
+                "roi": roi,
+                "frames_per_sec": round(frames / sec_total, 2),
+                "speedup": round(full_sec / sec_total, 2),
+                "detection_rate": round(float(np.mean(detected)), 3),
+            }
+            if errors:
+                err = np.concatenate(errors)
+                finite = err[np.isfinite(err)]
+                row.update({
+                    "error_mean": round(float(finite.mean()), 4) if len(finite) else None,
+                    "error_p95": round(float(np.percentile(err, 95, method="higher")), 4) if len(err) else None,
+                    "pck_0.1": round(float((err <= 0.1).mean()), 4) if len(err) else None,
+                })
+            rows.append(row)
+    finally:
+        pose.close()
+    return {"clips": clips, "stride": stride, "model_complexity": model_complexity, "results": rows}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Preprocesado (downscale / ROI) vs. frame completo")
+    parser.add_argument("--clips", type=str, nargs="+", required=True)
+    parser.add_argument("--long_sides", type=int, nargs="+", default=[1280, 960, 640])
+    parser.add_argument("--stride", type=int, default=1)
+    parser.add_argument("--model_complexity", type=int, default=1)
+    parser.add_argument("--output", type=str, default="")
+    args = parser.parse_args()
+
+    report = run(args.clips, args.long_sides, args.stride, args.model_complexity)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
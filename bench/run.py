@@ -0,0 +1,435 @@
+"""
+Suite de benchmarks reproducible: genera videos y datasets sintéticos en un
+directorio temporal, mide extracción, carga de datos y modelo, escribe los
+resultados en JSON y (opcional) los compara contra un baseline guardado.
+
+Suites:
+- extract: ml/extract_keypoints.extract_from_video, frames/s por model_complexity y stride
+- pose:    POST /pose de pose-service de punta a punta (app en proceso, video servido
+           por un http.server local): latencia p50/p95 y videos/s por concurrencia
+- dataset: PoseSequenceDataset (json y npy), samples/s
+- model:   TCNMultiHead forward (eval, no_grad), samples/s y frames/s por B y T
+- cold_start: pose-service en un proceso nuevo hasta /health y el primer /pose
+           (ver bench/cold_start.py)
+
+Métricas: las terminadas en `_per_sec` son mejores cuanto más altas y las
+terminadas en `_ms` cuanto más bajas; el resto es informativo y no se compara.
+
+Uso:
+    python bench/run.py --output bench_results.json
+    python bench/run.py --suites model dataset --save_baseline bench/baseline.json
+    python bench/run.py --baseline bench/baseline.json --threshold 0.15 --thresholds pose=0.3 extract/c1_s1=0.25
+
+Con --baseline sale con código 1 si alguna métrica empeora más que su umbral.
+"""
+import argparse
+import asyncio
+import functools
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, "ml"))
+
+SUITES = ("extract", "pose", "dataset", "model", "cold_start")
+
+
+# ---------------------------------------------------------------------------
+# datos sintéticos
+
+
+def make_synthetic_video(path: str, seconds: float = 4.0, fps: float = 30.0, width: int = 640, height: int = 360, seed: int = 0) -> str:
+    """Figura de palitos que levanta los brazos sobre un fondo con ruido fijo (mp4v)."""
+    import cv2
+
+    rng = np.random.default_rng(seed)
+    background = rng.integers(40, 90, (height, width, 3), dtype=np.uint8)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    if not writer.isOpened():
+        raise RuntimeError(f"Could not open video writer: {path}")
+    n = int(seconds * fps)
+    s = height / 360.0
+    cx = width // 2
+    for i in range(n):
+        phase = i / max(1, n - 1)
+        frame = background.copy()
+        head = (cx, int(90 * s))
+        neck, pelvis = (cx, int(120 * s)), (cx, int(220 * s))
+        # muñecas: de la cadera hasta arriba de la cabeza a lo largo del clip
+        wy = int((230 - 200 * phase) * s)
+        cv2.circle(frame, head, int(22 * s), (200, 180, 160), -1)
+        cv2.line(frame, neck, pelvis, (220, 220, 220), max(2, int(10 * s)))
+        for side in (-1, 1):
+            shoulder = (cx + side * int(35 * s), int(125 * s))
+            wrist = (cx + side * int(45 * s), wy)
+            elbow = ((shoulder[0] + wrist[0]) // 2 + side * int(20 * s), (shoulder[1] + wy) // 2)
+            cv2.line(frame, shoulder, elbow, (220, 220, 220), max(2, int(8 * s)))
+            cv2.line(frame, elbow, wrist, (220, 220, 220), max(2, int(8 * s)))
+            hip = (cx + side * int(20 * s), int(220 * s))
+            knee = (cx + side * int(28 * s), int(280 * s))
+            ankle = (cx + side * int(30 * s), int(340 * s))
+            cv2.line(frame, hip, knee, (220, 220, 220), max(2, int(9 * s)))
+            cv2.line(frame, knee, ankle, (220, 220, 220), max(2, int(9 * s)))
+        writer.write(frame)
+    writer.release()
+    return path
+
+
+def make_synthetic_dataset(root: str, split: str, n: int, seed: int = 0) -> Dict[str, str]:
+    """Mismas muestras en JSON (formato extract_keypoints) y en el formato columnar npy."""
+    from keypoint_store import convert_json_file  # type: ignore
+    from loader_throughput import make_synthetic  # type: ignore
+
+    json_dir = os.path.join(root, "json")
+    npy_dir = os.path.join(root, "npy")
+    make_synthetic(json_dir, split, n, seed=seed)
+    src = os.path.join(json_dir, split)
+    for name in sorted(os.listdir(src)):
+        if name.endswith(".json"):
+            convert_json_file(os.path.join(src, name), os.path.join(npy_dir, split, name[: -len(".json")]))
+    return {"json": json_dir, "npy": npy_dir}
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):  # noqa: A002
+        pass
+
+
+def serve_directory(directory: str) -> tuple:
+    """http.server en un thread; devuelve (server, base_url)."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(_QuietHandler, directory=directory))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+# ---------------------------------------------------------------------------
+# suites
+
+
+def _median_time(fn: Callable[[], Any], repeats: int) -> tuple:
+    times, result = [], None
+    for _ in range(max(1, repeats)):
+        t0 = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - t0)
+    return statistics.median(times), result
+
+
+def bench_extract(videos: List[str], complexities: List[int], strides: List[int], repeats: int) -> Dict[str, Dict[str, float]]:
+    from extract_keypoints import create_pose, extract_from_video  # type: ignore
+
+    out = {}
+    for c in complexities:
+        pose = create_pose(model_complexity=c)
+        try:
+            extract_from_video(videos[0], stride=max(strides), pose=pose)  # warm-up (carga del grafo)
+            for stride in strides:
+                frames = 0
+                elapsed = 0.0
+                for video in videos:
+                    sec, data = _median_time(lambda: extract_from_video(video, stride=stride, pose=pose), repeats)
+                    frames += len(data["frames"])
+                    elapsed += sec
+                out[f"c{c}_s{stride}"] = {
+                    "frames": frames,
+                    "frames_per_sec": round(frames / elapsed, 2),
+                    "ms_per_frame": None if not frames else round(elapsed * 1000.0 / frames, 2),
+                }
+        finally:
+            pose.close()
+    return out
+
+
+async def _pose_requests(main, url: str, target_frames: int, concurrency: List[int], requests: int) -> Dict[str, Dict[str, float]]:
+    import httpx
+
+    out = {}
+    await main.startup()
+    try:
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://pose-service", timeout=None) as client:
+            body = {"videoUrl": url, "targetFrames": target_frames}
+
+            async def one() -> float:
+                t0 = time.perf_counter()
+                resp = await client.post("/pose", json=body)
+                if resp.status_code != 200:
+                    raise RuntimeError(f"/pose returned {resp.status_code}: {resp.text[:200]}")
+                return time.perf_counter() - t0
+
+            await one()  # warm-up
+            for c in concurrency:
+                semaphore = asyncio.Semaphore(c)
+
+                async def limited() -> float:
+                    async with semaphore:
+                        return await one()
+
+                t0 = time.perf_counter()
+                latencies = sorted(await asyncio.gather(*(limited() for _ in range(requests))))
+                wall = time.perf_counter() - t0
+                out[f"target{target_frames}_c{c}"] = {
+                    "requests": requests,
+                    "videos_per_sec": round(requests / wall, 2),
+                    "p50_ms": round(1000.0 * latencies[len(latencies) // 2], 1),
+                    "p95_ms": round(1000.0 * latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))], 1),
+                }
+    finally:
+        await main.shutdown()
+    return out
+
+
+def bench_pose(video: str, target_frames: int, concurrency: List[int], requests: int, executor: str, workers: int) -> Dict[str, Dict[str, float]]:
+    # se mide la extracción, no la cache; la config se lee al importar main
+    os.environ["POSE_CACHE_ENABLED"] = "0"
+    os.environ["POSE_EXECUTOR"] = executor
+    os.environ["POSE_WORKERS"] = str(workers)
+    os.environ.setdefault("POSE_QUEUE_MAX", str(max(concurrency) + 1))
+    sys.path.insert(0, os.path.join(REPO_DIR, "pose-service"))
+    import main  # type: ignore
+
+    server, base_url = serve_directory(os.path.dirname(os.path.abspath(video)))
+    try:
+        url = f"{base_url}/{os.path.basename(video)}"
+        return asyncio.run(_pose_requests(main, url, target_frames, concurrency, requests))
+    finally:
+        server.shutdown()
+
+
+def bench_dataset(dirs: Dict[str, str], split: str, max_samples: int, repeats: int) -> Dict[str, Dict[str, float]]:
+    from datasets import PoseSequenceDataset  # type: ignore
+
+    out = {}
+    for fmt, root in dirs.items():
+        ds = PoseSequenceDataset(root, split=split, fmt=fmt)
+        n = min(len(ds), max_samples)
+        ds[0]  # warm-up
+        sec, _ = _median_time(lambda: [ds[i] for i in range(n)], repeats)
+        out[fmt] = {"samples": n, "samples_per_sec": round(n / sec, 1)}
+    return out
+
+
+def bench_model(batch_sizes: List[int], lengths: List[int], hidden: int, repeats: int) -> Dict[str, Dict[str, float]]:
+    import torch
+
+    from models.tcn import TCNMultiHead  # type: ignore
+
+    torch.manual_seed(0)
+    model = TCNMultiHead(hidden=hidden).eval()
+    out = {}
+    with torch.inference_mode():
+        for B in batch_sizes:
+            for T in lengths:
+                x = torch.randn(B, T, 33, 3)
+                model(x)  # warm-up
+                iters = max(1, 2048 // (B * T) + 1)
+                sec, _ = _median_time(lambda: [model(x) for _ in range(iters)], repeats)
+                per_call = sec / iters
+                out[f"b{B}_t{T}"] = {
+                    "samples_per_sec": round(B / per_call, 1),
+                    "frames_per_sec": round(B * T / per_call, 1),
+                    "latency_ms": round(per_call * 1000.0, 3),
+                }
+    return out
+
+
+# ---------------------------------------------------------------------------
+# baseline
+
+
+def _direction(metric: str) -> int:
+    if metric.endswith("_per_sec"):
+        return 1
+    if metric.endswith("_ms"):
+        return -1
+    return 0
+
+
+def _threshold_for(key: str, default: float, overrides: Dict[str, float]) -> float:
+    # gana el prefijo más largo: "extract/c1_s1" sobre "extract"
+    best = None
+    for prefix, value in overrides.items():
+        if (key == prefix or key.startswith(prefix + "/")) and (best is None or len(prefix) > len(best[0])):
+            best = (prefix, value)
+    return default if best is None else best[1]
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float, overrides: Dict[str, float]) -> List[Dict[str, Any]]:
+    rows = []
+    for suite, cases in results.items():
+        for case, metrics in cases.items():
+            base_metrics = baseline.get(suite, {}).get(case)
+            if not base_metrics:
+                continue
+            key = f"{suite}/{case}"
+            limit = _threshold_for(key, threshold, overrides)
+            for metric, value in metrics.items():
+                sign = _direction(metric)
+                base = base_metrics.get(metric)
+                if sign == 0 or not base or value is None:
+                    continue
+                # cambio relativo con signo "positivo = mejor"
+                change = sign * (value - base) / base
+                rows.append({
+                    "case": key,
+                    "metric": metric,
+                    "baseline": base,
+                    "current": value,
+                    "change": round(change, 4),
+                    "threshold": limit,
+                    "regression": change < -limit,
+                })
+    return rows
+
+
+def _parse_overrides(items: List[str]) -> Dict[str, float]:
+    out = {}
+    for item in items:
+        key, _, value = item.partition("=")
+        if not value:
+            raise argparse.ArgumentTypeError(f"invalid threshold override: {item!r} (expected key=fraction)")
+        out[key] = float(value)
+    return out
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=REPO_DIR, stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def _environment() -> Dict[str, Any]:
+    env: Dict[str, Any] = {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+    }
+    for module in ("torch", "cv2", "mediapipe"):
+        try:
+            env[module] = __import__(module).__version__
+        except Exception:
+            env[module] = None
+    return env
+
+
+# ---------------------------------------------------------------------------
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Suite de benchmarks (extracción, /pose, dataset, modelo, arranque en frío)")
+    parser.add_argument("--suites", type=str, nargs="+", default=list(SUITES), choices=SUITES)
+    parser.add_argument("--repeats", type=int, default=3, help="se reporta la mediana")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--torch_threads", type=int, default=0, help="0 = default de torch")
+    parser.add_argument("--work_dir", type=str, default="", help="por defecto un temporal que se borra al terminar")
+    # videos
+    parser.add_argument("--videos", type=str, nargs="*", default=[], help="clips reales en vez del sintético")
+    parser.add_argument("--video_seconds", type=float, default=4.0)
+    parser.add_argument("--video_size", type=int, nargs=2, default=[640, 360], metavar=("W", "H"))
+    parser.add_argument("--complexities", type=int, nargs="+", default=[0, 1])
+    parser.add_argument("--strides", type=int, nargs="+", default=[1, 4])
+    # /pose
+    parser.add_argument("--target_frames", type=int, default=16)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--requests", type=int, default=8)
+    parser.add_argument("--pose_executor", type=str, default="process", choices=["process", "thread"])
+    parser.add_argument("--pose_workers", type=int, default=min(4, os.cpu_count() or 1))
+    # dataset / modelo
+    parser.add_argument("--dataset_samples", type=int, default=500)
+    parser.add_argument("--batch_sizes", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--lengths", type=int, nargs="+", default=[64, 256])
+    parser.add_argument("--hidden", type=int, default=256)
+    # salida / baseline
+    parser.add_argument("--output", type=str, default="")
+    parser.add_argument("--baseline", type=str, default="")
+    parser.add_argument("--save_baseline", type=str, default="")
+    parser.add_argument("--threshold", type=float, default=0.10, help="empeoramiento relativo tolerado (0.10 = 10%%)")
+    parser.add_argument("--thresholds", type=str, nargs="*", default=[], help="overrides suite=f o suite/caso=f")
+    args = parser.parse_args()
+    overrides = _parse_overrides(args.thresholds)
+
+    if args.torch_threads > 0:
+        import torch
+
+        torch.set_num_threads(args.torch_threads)
+
+    work = args.work_dir or tempfile.mkdtemp(prefix="bench_run_")
+    os.makedirs(work, exist_ok=True)
+    results: Dict[str, Any] = {}
+    try:
+        videos = args.videos
+        if not videos and ({"extract", "pose", "cold_start"} & set(args.suites)):
+            W, H = args.video_size
+            videos = [make_synthetic_video(os.path.join(work, "synthetic.mp4"), args.video_seconds, width=W, height=H, seed=args.seed)]
+
+        for suite in args.suites:
+            t0 = time.perf_counter()
+            if suite == "extract":
+                results[suite] = bench_extract(videos, args.complexities, args.strides, args.repeats)
+            elif suite == "pose":
+                results[suite] = bench_pose(
+                    videos[0], args.target_frames, args.concurrency, args.requests, args.pose_executor, args.pose_workers
+                )
+            elif suite == "dataset":
+                dirs = make_synthetic_dataset(os.path.join(work, "dataset"), "train", args.dataset_samples, seed=args.seed)
+                results[suite] = bench_dataset(dirs, "train", args.dataset_samples, args.repeats)
+            elif suite == "model":
+                results[suite] = bench_model(args.batch_sizes, args.lengths, args.hidden, args.repeats)
+            elif suite == "cold_start":
+                from cold_start import bench_cold_start  # type: ignore
+
+                results[suite] = bench_cold_start(
+                    videos[0], args.target_frames, [args.pose_executor], [args.pose_workers], args.repeats
+                )
+            print(f"[{suite}] {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work, ignore_errors=True)
+
+    report: Dict[str, Any] = {"environment": _environment(), "args": vars(args), "results": results}
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        rows = compare(results, baseline.get("results", baseline), args.threshold, overrides)
+        regressions = [r for r in rows if r["regression"]]
+        report["comparison"] = {"baseline": args.baseline, "baseline_commit": baseline.get("environment", {}).get("commit"), "rows": rows}
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+    for r in regressions:
+        print(
+            f"REGRESSION {r['case']} {r['metric']}: {r['baseline']} -> {r['current']} "
+            f"({r['change'] * 100:+.1f}%, umbral -{r['threshold'] * 100:.0f}%)",
+            file=sys.stderr,
+        )
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
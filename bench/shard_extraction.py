@@ -0,0 +1,117 @@
+"""
+Benchmark de `extract_keypoints.py --shards`: extracción por rangos en procesos
+paralelos contra la pasada secuencial del mismo video.
+
+La salida por shards NO es idéntica a la secuencial: el tracker y el suavizado de
+MediaPipe dependen de los frames anteriores, y cada shard arranca con el estado
+vacío (solo `overlap_sec` de warm-up). Por configuración se reporta:
+- seq_sec / sharded_sec / speedup (tiempo de pared, incluido el arranque de los procesos)
+- frames_diff_xy: fracción de frames cuyo mayor |Δx|,|Δy| supera `--xy_threshold`
+- max_diff_xy: mayor diferencia en coordenadas normalizadas
+- detection_flips: frames detectados en una pasada y no en la otra
+- error_p95 / pck_0.1: error en largos de torso contra la secuencial (ver adaptive_extraction.py)
+
+Usar --shards solo si en la máquina y el tipo de video de destino el speedup
+medido acá es > 1 y la divergencia es aceptable.
+
+Uso:
+    python bench/shard_extraction.py --clips largo.mp4 --shards 2 3 4 --stride 2 --overlap_sec 1
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ml"))
+
+from adaptive_extraction import landmark_errors  # noqa: E402
+from extract_keypoints import extract_from_video, extract_sharded  # type: ignore  # noqa: E402
+
+
+def divergence(ref: Dict[str, Any], test: Dict[str, Any], xy_threshold: float) -> Dict[str, Any]:
+    """Diferencias por frame (alineados por índice) entre dos extracciones del mismo video."""
+    a = {fr["index"]: fr["keypoints"] for fr in ref["frames"]}
+    b = {fr["index"]: fr["keypoints"] for fr in test["frames"]}
+    common = sorted(a.keys() & b.keys())
+    diffs, flips = [], []
+    for idx in common:
+        ka = np.array([(k["x"], k["y"], k["v"]) for k in a[idx]], dtype=np.float64)
+        kb = np.array([(k["x"], k["y"], k["v"]) for k in b[idx]], dtype=np.float64)
+        if (ka[:, 2].max() > 0) != (kb[:, 2].max() > 0):
+            flips.append(idx)
+        diffs.append(float(np.abs(ka[:, :2] - kb[:, :2]).max()))
+    d = np.asarray(diffs)
+    return {
+        "frames": len(common),
+        "missing_frames": len(a.keys() ^ b.keys()),
+        "frames_diff_xy": round(float((d > xy_threshold).mean()), 4) if len(d) else 0.0,
+        "max_diff_xy": round(float(d.max()), 4) if len(d) else 0.0,
+        "detection_flips": flips,
+    }
+
+
+def run(clips: List[str], shards: List[int], stride: int, overlap_sec: float, model_complexity: int, xy_threshold: float) -> Dict[str, Any]:
+    kwargs = {"stride": stride, "model_complexity": model_complexity}
+    rows = []
+    for clip in clips:
+        t0 = time.perf_counter()
+        ref = extract_from_video(clip, **kwargs)
+        seq_sec = time.perf_counter() - t0
+        for n in shards:
+            t0 = time.perf_counter()
+            data = extract_sharded(clip, n, overlap_sec=overlap_sec, **kwargs)
+            sec = time.perf_counter() - t0
+            err = landmark_errors(ref, data)
+            row = {
+                "clip": os.path.basename(clip),
+                "shards": n,
+                "seq_sec": round(seq_sec, 2),
+                "sharded_sec": round(sec, 2),
+                "speedup": round(seq_sec / sec, 2),
+                **divergence(ref, data, xy_threshold),
+                "error_p95": round(float(np.percentile(err, 95, method="higher")), 4) if len(err) else None,
+                "pck_0.1": round(float((err <= 0.1).mean()), 4) if len(err) else None,
+            }
+            rows.append(row)
+    return {
+        "cpu_count": os.cpu_count(),
+        "stride": stride,
+        "overlap_sec": overlap_sec,
+        "model_complexity": model_complexity,
+        "xy_threshold": xy_threshold,
+        "results": rows,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extracción por shards vs. secuencial: speedup y divergencia")
+    parser.add_argument("--clips", type=str, nargs="*", default=[])
+    parser.add_argument("--shards", type=int, nargs="+", default=[2, 3])
+    parser.add_argument("--stride", type=int, default=2)
+    parser.add_argument("--overlap_sec", type=float, default=1.0)
+    parser.add_argument("--model_complexity", type=int, default=1)
+    parser.add_argument("--xy_threshold", type=float, default=0.02)
+    parser.add_argument("--output", type=str, default="")
+    args = parser.parse_args()
+
+    clips = args.clips
+    if not clips:
+        from run import make_synthetic_video  # type: ignore
+
+        clips = [make_synthetic_video(os.path.join(tempfile.mkdtemp(prefix="bench_shards_"), "synthetic.mp4"), seconds=12.0)]
+
+    report = run(clips, args.shards, args.stride, args.overlap_sec, args.model_complexity, args.xy_threshold)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
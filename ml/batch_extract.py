@@ -1,27 +1,122 @@
+"""
+Extracción de keypoints en lote.
+
+Con --executor process (default) cada worker es un proceso con su propia
+instancia de MediaPipe Pose, creada una vez y reutilizada entre videos.
+El manifiesto (<output_dir>/manifest.json) guarda por video el hash del input,
+los parámetros y el estado: al relanzar se saltean los videos ya extraídos con
+los mismos parámetros y se reintentan los fallidos o pendientes.
+
+Uso:
+    python batch_extract.py --videos_dir "C:/videos" --output_dir "C:/keypoints_json" --workers 8
+"""
 import argparse
 import glob
+import hashlib
+import json
+import multiprocessing
 import os
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from typing import Any, Dict, Optional
+
+from extract_keypoints import AdaptiveConfig, create_pose, extract_from_video, save_keypoints  # type: ignore
+from video_decoder import BACKENDS, resolve_backend  # type: ignore
+
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+
+# instancia de Pose propia de cada worker (proceso); None en modo thread
+_worker_pose = None
+
+
+def file_sha256(path: str, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def load_manifest(path: str) -> Dict[str, Any]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {"version": MANIFEST_VERSION, "videos": {}}
+    manifest.setdefault("videos", {})
+    return manifest
+
+
+def save_manifest(path: str, manifest: Dict[str, Any]) -> None:
+    # escritura atómica: un corte a mitad de escritura no corrompe el manifiesto
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp, path)
 
-from extract_keypoints import extract_from_video  # type: ignore
 
+def input_fingerprint(video_path: str, previous: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Hash del video; si tamaño y mtime coinciden con la entrada previa del
+    manifiesto se reutiliza el hash guardado en vez de releer el archivo.
+    """
+    st = os.stat(video_path)
+    if previous and previous.get("size") == st.st_size and previous.get("mtime_ns") == st.st_mtime_ns and previous.get("sha256"):
+        sha = previous["sha256"]
+    else:
+        sha = file_sha256(video_path)
+    return {"sha256": sha, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
 
-def process_one(video_path: str, out_dir: str, stride: int) -> str:
+
+def is_up_to_date(entry: Optional[Dict[str, Any]], fingerprint: Dict[str, Any], settings: Dict[str, Any]) -> bool:
+    return bool(
+        entry
+        and entry.get("status") == "done"
+        and entry.get("sha256") == fingerprint["sha256"]
+        and entry.get("settings") == settings
+        and entry.get("output")
+        and os.path.exists(entry["output"])
+    )
+
+
+def _init_worker(settings: Dict[str, Any]) -> None:
+    global _worker_pose
+    _worker_pose = create_pose(
+        settings["model_complexity"],
+        settings["min_detection_confidence"],
+        settings["min_tracking_confidence"],
+    )
+
+
+def process_one(video_path: str, out_dir: str, settings: Dict[str, Any], decoder_threads: int = 0) -> Dict[str, Any]:
     base = os.path.splitext(os.path.basename(video_path))[0]
     out_path = os.path.join(out_dir, base + ".json")
+    t0 = time.perf_counter()
     try:
-        data = extract_from_video(video_path=video_path, stride=stride)
+        data = extract_from_video(
+            video_path=video_path,
+            stride=settings["stride"],
+            model_complexity=settings["model_complexity"],
+            min_detection_confidence=settings["min_detection_confidence"],
+            min_tracking_confidence=settings["min_tracking_confidence"],
+            pose=_worker_pose,
+            adaptive=AdaptiveConfig(**settings["adaptive"]) if "adaptive" in settings else None,
+            max_long_side=settings.get("max_long_side", 0),
+            roi=settings.get("roi", False),
+            decoder=settings.get("decoder", "opencv"),
+            decoder_threads=decoder_threads,
+        )
         os.makedirs(out_dir, exist_ok=True)
-        with open(out_path, "wb") as f:
-            try:
-                import orjson as fastjson
-                f.write(fastjson.dumps(data))
-            except Exception:
-                import json
-                f.write(json.dumps(data).encode("utf-8"))
-        return f"OK {out_path}"
+        out_path = save_keypoints(data, out_path, settings["format"])
+        return {
+            "status": "done",
+            "output": os.path.abspath(out_path),
+            "frames": len(data["frames"]),
+            "seconds": round(time.perf_counter() - t0, 3),
+        }
     except Exception as e:
-        return f"ERROR {video_path}: {e}"
+        return {"status": "error", "error": str(e), "seconds": round(time.perf_counter() - t0, 3)}
 
 
 def main():
@@ -30,18 +125,100 @@ def main():
     parser.add_argument("--output_dir", type=str, required=True)
     parser.add_argument("--pattern", type=str, default="**/*.mp4")
     parser.add_argument("--stride", type=int, default=1)
-    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--executor", type=str, default="process", choices=["process", "thread"])
+    parser.add_argument("--format", type=str, default="json", choices=["json", "npy"])
+    parser.add_argument("--model_complexity", type=int, default=1)
+    parser.add_argument("--min_detection_confidence", type=float, default=0.5)
+    parser.add_argument("--min_tracking_confidence", type=float, default=0.5)
+    parser.add_argument("--keyframe_interval", type=int, default=1, help=">1: inferencia solo en keyframes (modo adaptativo)")
+    parser.add_argument("--adaptive_mode", type=str, default="flow", choices=["flow", "interp"])
+    parser.add_argument("--max_long_side", type=int, default=0, help="lado largo máximo de la imagen que entra a MediaPipe (0 = sin reducir)")
+    parser.add_argument("--roi", action="store_true", help="recortar la caja de la persona según el frame anterior")
+    parser.add_argument("--decoder", type=str, default="auto", choices=BACKENDS, help="pyav (threads, PTS reales) u opencv")
+    parser.add_argument("--decoder_threads", type=int, default=0, help="threads de decodificación pyav por worker (0 = CPUs / workers)")
+    parser.add_argument("--force", action="store_true", help="reextraer aunque el manifiesto indique que está al día")
     args = parser.parse_args()
 
-    paths = glob.glob(os.path.join(args.videos_dir, args.pattern), recursive=True)
+    paths = sorted(glob.glob(os.path.join(args.videos_dir, args.pattern), recursive=True))
     if not paths:
         print("No videos found")
         return
 
-    with ThreadPoolExecutor(max_workers=args.workers) as ex:
-        futs = [ex.submit(process_one, p, args.output_dir, args.stride) for p in paths]
+    settings = {
+        "stride": args.stride,
+        "format": args.format,
+        "model_complexity": args.model_complexity,
+        "min_detection_confidence": args.min_detection_confidence,
+        "min_tracking_confidence": args.min_tracking_confidence,
+    }
+    if args.keyframe_interval > 1:
+        # solo si se pide, así los manifiestos existentes siguen al día
+        settings["adaptive"] = {"keyframe_interval": args.keyframe_interval, "mode": args.adaptive_mode}
+    if args.max_long_side > 0:
+        settings["max_long_side"] = args.max_long_side
+    if args.roi:
+        settings["roi"] = True
+    if resolve_backend(args.decoder) != "opencv":
+        # cambia time_sec (PTS reales): los manifiestos de opencv quedan desactualizados
+        settings["decoder"] = resolve_backend(args.decoder)
+    decoder_threads = args.decoder_threads or max(1, (os.cpu_count() or 1) // max(1, args.workers))
+    os.makedirs(args.output_dir, exist_ok=True)
+    manifest_path = os.path.join(args.output_dir, MANIFEST_NAME)
+    manifest = load_manifest(manifest_path)
+    entries = manifest["videos"]
+
+    pending = []
+    for p in paths:
+        key = os.path.relpath(os.path.abspath(p), os.path.abspath(args.videos_dir))
+        fingerprint = input_fingerprint(p, entries.get(key))
+        if not args.force and is_up_to_date(entries.get(key), fingerprint, settings):
+            continue
+        entries[key] = {**fingerprint, "settings": settings, "status": "pending"}
+        pending.append((key, p))
+    save_manifest(manifest_path, manifest)
+
+    skipped = len(paths) - len(pending)
+    print(f"{len(paths)} videos: {len(pending)} a procesar, {skipped} al día (manifiesto)")
+    if not pending:
+        return
+
+    if args.executor == "process":
+        ex = ProcessPoolExecutor(
+            max_workers=args.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(settings,),
+        )
+    else:
+        # en threads cada video crea su propio Pose (no es seguro compartirlo)
+        ex = ThreadPoolExecutor(max_workers=args.workers)
+
+    done = errors = total_frames = 0
+    t0 = time.perf_counter()
+    with ex:
+        futs = {ex.submit(process_one, p, args.output_dir, settings, decoder_threads): key for key, p in pending}
         for fut in as_completed(futs):
-            print(fut.result())
+            key = futs[fut]
+            result = fut.result()
+            entries[key].update(result)
+            save_manifest(manifest_path, manifest)
+
+            done += 1
+            elapsed = max(time.perf_counter() - t0, 1e-9)
+            if result["status"] == "done":
+                total_frames += result["frames"]
+                line = f"OK {result['output']} ({result['frames']} frames, {result['seconds']:.1f}s)"
+            else:
+                errors += 1
+                line = f"ERROR {key}: {result['error']}"
+            print(f"[{done}/{len(pending)}] {line} | {done / elapsed:.2f} videos/s, {total_frames / elapsed:.1f} frames/s")
+
+    elapsed = time.perf_counter() - t0
+    print(
+        f"Listo: {done - errors} OK, {errors} errores, {skipped} salteados en {elapsed:.1f}s "
+        f"({done / elapsed:.2f} videos/s, {total_frames / elapsed:.1f} frames/s)"
+    )
 
 
 if __name__ == "__main__":
@@ -1,3 +1,4 @@
+import bisect
 import glob
 import json
 import os
@@ -5,7 +6,18 @@ from typing import Any, Dict, List, Optional, Tuple
 
 import numpy as np
 import torch
-from torch.utils.data import Dataset
+from torch.utils.data import Dataset, Sampler
+
+from keypoint_store import META_SUFFIX, frames_to_keypoints, load_meta, load_sequence, stem_of
+from pose_normalize import (  # noqa: F401  (re-export: POSE_NAMES/NAME_TO_IDX se importan desde datasets)
+    LEFT_HIP as _LEFT_HIP,
+    LEFT_SHOULDER as _LEFT_SHOULDER,
+    NAME_TO_IDX,
+    POSE_NAMES,
+    RIGHT_HIP as _RIGHT_HIP,
+    RIGHT_SHOULDER as _RIGHT_SHOULDER,
+    normalize_sequence_xy,
+)
 
 try:
     import orjson as fastjson
@@ -15,16 +27,6 @@ except Exception:
     def loads(b: bytes):
         return json.loads(b)
 
-POSE_NAMES = [
-    "nose","left_eye_inner","left_eye","left_eye_outer","right_eye_inner","right_eye","right_eye_outer",
-    "left_ear","right_ear","mouth_left","mouth_right","left_shoulder","right_shoulder","left_elbow",
-    "right_elbow","left_wrist","right_wrist","left_pinky","right_pinky","left_index","right_index",
-    "left_thumb","right_thumb","left_hip","right_hip","left_knee","right_knee","left_ankle","right_ankle",
-    "left_heel","right_heel","left_foot_index","right_foot_index",
-]
-
-NAME_TO_IDX = {n: i for i, n in enumerate(POSE_NAMES)}
-
 
 def _load_json(path: str) -> Dict[str, Any]:
     with open(path, "rb") as f:
@@ -32,74 +34,96 @@ def _load_json(path: str) -> Dict[str, Any]:
     return loads(data)
 
 
-def normalize_sequence_xy(seq_xy: np.ndarray) -> np.ndarray:
+def normalize_sequence_xy_torch(x: torch.Tensor) -> torch.Tensor:
     """
-    Normaliza XY por frame:
-    - centra en pelvis (promedio de left_hip y right_hip si existen)
-    - escala por distancia entre hombros (left_shoulder-right_shoulder) si existe; fallback: 1.0
-
-    seq_xy: [T, J, 2]
-    return: [T, J, 2] normalizado
+    Versión batch de normalize_sequence_xy para usar dentro del training step
+    (en GPU si corresponde). x: [B, T, J, C] con XY en los dos primeros canales.
     """
-    T, J, C = seq_xy.shape
-    out = seq_xy.copy()
+    xy = x[..., :2]
+    pelvis = 0.5 * (xy[:, :, _LEFT_HIP] + xy[:, :, _RIGHT_HIP])  # [B, T, 2]
+    d = torch.linalg.vector_norm(xy[:, :, _LEFT_SHOULDER] - xy[:, :, _RIGHT_SHOULDER], dim=-1)  # [B, T]
+    scale = torch.where(d > 1e-6, d, torch.ones_like(d)).clamp_min(1e-3)
+    xy = (xy - pelvis.unsqueeze(2)) / scale[:, :, None, None]
+    return torch.cat([xy, x[..., 2:]], dim=-1)
 
-    left_hip = NAME_TO_IDX.get("left_hip")
-    right_hip = NAME_TO_IDX.get("right_hip")
-    left_shoulder = NAME_TO_IDX.get("left_shoulder")
-    right_shoulder = NAME_TO_IDX.get("right_shoulder")
 
-    for t in range(T):
-        pelvis = None
-        scale = 1.0
+def _joint_map(names: List[str]) -> Optional[np.ndarray]:
+    """Índice de origen para cada joint de POSE_NAMES (-1 si falta); None si ya coinciden."""
+    if list(names) == POSE_NAMES:
+        return None
+    src = {n: i for i, n in enumerate(names)}
+    return np.array([src.get(n, -1) for n in POSE_NAMES], dtype=np.int64)
 
-        if left_hip is not None and right_hip is not None:
-            pelvis = 0.5 * (out[t, left_hip, :2] + out[t, right_hip, :2])
-        else:
-            pelvis = np.array([0.5, 0.5], dtype=np.float32)
-
-        if left_shoulder is not None and right_shoulder is not None:
-            d = np.linalg.norm(out[t, left_shoulder, :2] - out[t, right_shoulder, :2])
-            if d > 1e-6:
-                scale = d
-
-        out[t, :, :2] = (out[t, :, :2] - pelvis) / max(scale, 1e-3)
 
+def _select_joints(kps: np.ndarray, joint_map: Optional[np.ndarray]) -> np.ndarray:
+    if joint_map is None:
+        return np.array(kps, dtype=np.float32)
+    out = np.zeros((kps.shape[0], len(POSE_NAMES), kps.shape[2]), dtype=np.float32)
+    valid = joint_map >= 0
+    out[:, valid] = kps[:, joint_map[valid]]
     return out
 
 
 class PoseSequenceDataset(Dataset):
-    def __init__(self, root: str, split: str = "train", require_targets: bool = False):
+    """
+    Lee secuencias de `root/split` en JSON (una por archivo) o en formato columnar
+    de keypoint_store (.kps.npy + .meta.json, cargado con mmap). fmt: "auto" | "json" | "npy".
+    """
+
+    def __init__(self, root: str, split: str = "train", require_targets: bool = False, fmt: str = "auto"):
         self.root = root
         self.split = split
         self.require_targets = require_targets
 
-        self.files = sorted(glob.glob(os.path.join(root, split, "*.json")))
-        if len(self.files) == 0:
-            raise FileNotFoundError(f"No JSON files found in {os.path.join(root, split)}")
+        split_dir = os.path.join(root, split)
+        meta_files = sorted(glob.glob(os.path.join(split_dir, "*" + META_SUFFIX)))
+        if fmt == "auto":
+            fmt = "npy" if meta_files else "json"
+        self.fmt = fmt
+
+        if fmt == "npy":
+            self.files = [stem_of(f) for f in meta_files]
+            if len(self.files) == 0:
+                raise FileNotFoundError(f"No {META_SUFFIX} files found in {split_dir}")
+            # los metadatos (labels/targets, nombres) se parsean una sola vez, no por época
+            self._metas = [load_meta(stem) for stem in self.files]
+            self._joint_maps = [_joint_map(m.get("names", [])) for m in self._metas]
+        else:
+            self.files = sorted(f for f in glob.glob(os.path.join(split_dir, "*.json")) if not f.endswith(META_SUFFIX))
+            if len(self.files) == 0:
+                raise FileNotFoundError(f"No JSON files found in {split_dir}")
 
     def __len__(self) -> int:
         return len(self.files)
 
-    def __getitem__(self, idx: int) -> Dict[str, Any]:
-        path = self.files[idx]
-        sample = _load_json(path)
+    def lengths(self) -> List[int]:
+        """Largo T de cada muestra (para LengthBucketBatchSampler). En JSON requiere parsear cada archivo una vez."""
+        if getattr(self, "_lengths", None) is None:
+            if self.fmt == "npy":
+                self._lengths = [
+                    int(m["num_frames"]) if "num_frames" in m else int(load_sequence(stem, meta=m).keypoints.shape[0])
+                    for stem, m in zip(self.files, self._metas)
+                ]
+            else:
+                self._lengths = [len(_load_json(p).get("frames", [])) for p in self.files]
+        return self._lengths
 
-        frames = sample["frames"]
-        T = len(frames)
-        J = len(POSE_NAMES)
+    def _load_json_sample(self, path: str) -> Tuple[np.ndarray, np.ndarray, Dict[str, Any]]:
+        sample = _load_json(path)
+        kps = frames_to_keypoints(sample["frames"], POSE_NAMES)  # [T, J, 3]
+        return kps[:, :, :2], kps[:, :, 2:3], sample
 
-        seq_xy = np.zeros((T, J, 2), dtype=np.float32)
-        seq_v = np.zeros((T, J, 1), dtype=np.float32)
+    def _load_npy_sample(self, idx: int) -> Tuple[np.ndarray, np.ndarray, Dict[str, Any]]:
+        seq = load_sequence(self.files[idx], mmap=True, meta=self._metas[idx])
+        kps = _select_joints(seq.keypoints, self._joint_maps[idx])  # copia fuera del mmap
+        return kps[:, :, :2], kps[:, :, 2:3], seq.meta
 
-        for t, fr in enumerate(frames):
-            for kp in fr["keypoints"]:
-                j = NAME_TO_IDX.get(kp["name"], None)
-                if j is None or j >= J:
-                    continue
-                seq_xy[t, j, 0] = float(kp.get("x", 0.0))
-                seq_xy[t, j, 1] = float(kp.get("y", 0.0))
-                seq_v[t, j, 0] = float(kp.get("v", 0.0))
+    def __getitem__(self, idx: int) -> Dict[str, Any]:
+        path = self.files[idx]
+        if self.fmt == "npy":
+            seq_xy, seq_v, sample = self._load_npy_sample(idx)
+        else:
+            seq_xy, seq_v, sample = self._load_json_sample(path)
 
         seq_xy = normalize_sequence_xy(seq_xy)
         seq = np.concatenate([seq_xy, seq_v], axis=-1)  # [T, J, 3]
@@ -125,3 +149,168 @@ class PoseSequenceDataset(Dataset):
             "y_reg": y_reg,  # [R] o None
             "path": path,
         }
+
+
+class PackedPoseDataset(Dataset):
+    """
+    Dataset sobre shards generados por pack_shards.py. Cada muestra es un slice de
+    un np.memmap (sin abrir archivos por muestra). Los memmaps se abren de forma
+    perezosa en cada proceso, así funciona con DataLoader(num_workers > 0).
+    """
+
+    def __init__(self, root: str, split: str = "train"):
+        self.root = root
+        self.split = split
+        self.dir = os.path.join(root, split)
+        meta_path = os.path.join(self.dir, "pack.json")
+        if not os.path.exists(meta_path):
+            raise FileNotFoundError(f"No pack.json found in {self.dir}")
+        with open(meta_path, "rb") as f:
+            self.meta = loads(f.read())
+
+        self.index = np.load(os.path.join(self.dir, "index.npy"))
+        self.labels = np.load(os.path.join(self.dir, "labels.npy"))
+        self.has_labels = np.load(os.path.join(self.dir, "has_labels.npy"))
+        self.targets = np.load(os.path.join(self.dir, "targets.npy"))
+        self.has_targets = np.load(os.path.join(self.dir, "has_targets.npy"))
+        self.label_keys: List[str] = self.meta["label_keys"]
+        self.target_keys: List[str] = self.meta["target_keys"]
+        self.files: List[str] = self.meta["paths"]
+        self._shards: Optional[List[np.ndarray]] = None
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def lengths(self) -> List[int]:
+        return self.index["length"].tolist()
+
+    def __getstate__(self):
+        # no serializar memmaps abiertos hacia los workers
+        state = self.__dict__.copy()
+        state["_shards"] = None
+        return state
+
+    def _shard(self, s: int) -> np.ndarray:
+        if self._shards is None:
+            self._shards = [np.load(os.path.join(self.dir, name), mmap_mode="r") for name in self.meta["shards"]]
+        return self._shards[s]
+
+    def raw(self, idx: int) -> np.ndarray:
+        """Keypoints crudos [T, J, 3] como vista del memmap (sin copia)."""
+        s, start, length = self.index[idx]
+        return self._shard(int(s))[start:start + length]
+
+    def __getitem__(self, idx: int) -> Dict[str, Any]:
+        kps = self.raw(idx)
+        seq_xy = normalize_sequence_xy(np.asarray(kps[:, :, :2], dtype=np.float32))
+        seq = np.concatenate([seq_xy, kps[:, :, 2:3]], axis=-1)  # [T, J, 3]
+
+        y_cls = torch.from_numpy(self.labels[idx].copy()) if self.has_labels[idx] else None
+        y_reg = torch.from_numpy(self.targets[idx].copy()) if self.has_targets[idx] else None
+        return {
+            "x": torch.from_numpy(seq).float(),  # [T, J, 3]
+            "y_cls": y_cls,  # [L] o None
+            "y_reg": y_reg,  # [R] o None
+            "path": self.files[idx],
+        }
+
+
+class LengthBucketBatchSampler(Sampler):
+    """
+    Batch sampler que agrupa muestras de largo parecido para reducir el padding.
+
+    Con `boundaries` (p. ej. [32, 64, 128, 256]) cada muestra va al bucket del
+    menor límite >= T (las más largas a un bucket final). Sin `boundaries` se
+    toman grupos aleatorios de `batch_size * pool_batches` muestras, se ordenan
+    por largo y se cortan en batches. En ambos casos el orden de los batches se
+    mezcla en cada época: cada iteración avanza la época sola y set_epoch
+    la fija (para reanudar o reproducir una época).
+    """
+
+    def __init__(
+        self,
+        lengths: List[int],
+        batch_size: int,
+        boundaries: Optional[List[int]] = None,
+        shuffle: bool = True,
+        drop_last: bool = False,
+        pool_batches: int = 50,
+        seed: int = 0,
+    ):
+        self.lengths = np.asarray(lengths, dtype=np.int64)
+        self.batch_size = batch_size
+        self.boundaries = sorted(boundaries) if boundaries else None
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.pool_batches = pool_batches
+        self.seed = seed
+        self.epoch = 0
+
+    def set_epoch(self, epoch: int) -> None:
+        self.epoch = epoch
+
+    def _groups(self, rng: np.random.Generator) -> List[np.ndarray]:
+        order = rng.permutation(len(self.lengths)) if self.shuffle else np.arange(len(self.lengths))
+        if self.boundaries is not None:
+            bucket_of = np.searchsorted(self.boundaries, self.lengths[order], side="left")
+            return [order[bucket_of == b] for b in range(len(self.boundaries) + 1)]
+        pool = self.batch_size * self.pool_batches
+        # orden estable: con shuffle=False el resultado es determinista
+        return [chunk[np.argsort(self.lengths[chunk], kind="stable")] for chunk in np.array_split(order, max(1, -(-len(order) // pool)))]
+
+    def _batches(self) -> List[List[int]]:
+        rng = np.random.default_rng(self.seed + self.epoch)
+        batches = []
+        for group in self._groups(rng):
+            for i in range(0, len(group), self.batch_size):
+                batch = group[i:i + self.batch_size]
+                if len(batch) < self.batch_size and self.drop_last:
+                    continue
+                if len(batch):
+                    batches.append(batch.tolist())
+        if self.shuffle:
+            batches = [batches[i] for i in rng.permutation(len(batches))]
+        return batches
+
+    def __iter__(self):
+        batches = self._batches()
+        # Lightning llama set_epoch sobre dataloader.sampler, nunca sobre un batch_sampler
+        # propio: avanzar acá para que cada época tenga otro orden
+        self.epoch += 1
+        return iter(batches)
+
+    def __len__(self) -> int:
+        return len(self._batches())
+
+
+def pad_collate(samples: List[Dict[str, Any]], boundaries: Optional[List[int]] = None) -> Dict[str, Any]:
+    """
+    Rellena con ceros hasta el T máximo del batch (o hasta el menor de `boundaries`
+    que lo contenga) y devuelve mask [B, T] (True = frame real) y lengths [B].
+    """
+    lengths = [int(s["x"].shape[0]) for s in samples]
+    T = max(lengths)
+    if boundaries:
+        bounds = sorted(boundaries)
+        i = bisect.bisect_left(bounds, T)
+        if i < len(bounds):
+            T = bounds[i]
+    _, J, C = samples[0]["x"].shape
+
+    x = torch.zeros((len(samples), T, J, C), dtype=samples[0]["x"].dtype)
+    mask = torch.zeros((len(samples), T), dtype=torch.bool)
+    for b, s in enumerate(samples):
+        x[b, :lengths[b]] = s["x"]
+        mask[b, :lengths[b]] = True
+
+    y_clss = [s.get("y_cls") for s in samples]
+    y_regs = [s.get("y_reg") for s in samples]
+    y_cls = torch.stack(y_clss, dim=0) if all(y is not None for y in y_clss) else None
+    y_reg = torch.stack(y_regs, dim=0) if all(y is not None for y in y_regs) else None
+    return {
+        "x": x,  # [B, T, J, 3]
+        "mask": mask,  # [B, T]
+        "lengths": torch.tensor(lengths, dtype=torch.long),
+        "y_cls": y_cls,
+        "y_reg": y_reg,
+    }
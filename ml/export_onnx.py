@@ -1,7 +1,226 @@
+"""
+Exporta TCNMultiHead a ONNX (batch y T dinámicos) y opcionalmente:
+- optimiza el grafo con ONNX Runtime (--optimize)
+- cuantiza a INT8 dinámico o estático (--quantize dynamic|static; el estático se
+  calibra con muestras de PoseSequenceDataset, --calib_data_dir)
+- verifica paridad contra PyTorch y mide latencia/throughput en CPU (--bench)
+
+Uso:
+    python export_onnx.py --checkpoint last.ckpt --output onnx_models/tcn.onnx --optimize --quantize static \
+        --calib_data_dir "C:/ruta/a/ml_data" --bench --report onnx_models/tcn_report.json
+"""
 import argparse
+import inspect
+import json
+import os
+import sys
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
 import torch
+import torch.nn as nn
+
+from models.tcn import StreamingTCN, TCNMultiHead
+
+
+def _export_kwargs() -> dict:
+    # el exportador dynamo (default en torch recientes) no traduce dynamic_axes con *args;
+    # el TorchScript cubre igual todos los casos de este modelo
+    return {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+
+
+def _head_names(model: TCNMultiHead) -> List[str]:
+    # ONNX no admite salidas None: solo se exportan las heads presentes
+    return [n for n, h in (("logits", model.head_cls), ("preds", model.head_reg)) if h is not None]
+
+
+class _HeadsExport(nn.Module):
+    def __init__(self, model: TCNMultiHead):
+        super().__init__()
+        self.model = model
+
+    def forward(self, x):
+        return tuple(o for o in self.model(x) if o is not None)
+
+
+class _StreamingExport(nn.Module):
+    def __init__(self, streaming: StreamingTCN):
+        super().__init__()
+        self.streaming = streaming
+
+    def forward(self, frame, *state):
+        logits, preds, *new_state = self.streaming(frame, *state)
+        return tuple(o for o in (logits, preds) if o is not None) + tuple(new_state)
+
+
+def load_checkpoint(model: TCNMultiHead, path: str, strict: bool = True) -> Dict[str, List[str]]:
+    """
+    Carga un checkpoint (Lightning o state_dict plano) e informa claves faltantes
+    o inesperadas. Con strict=True cualquier diferencia es un error.
+    """
+    ckpt = torch.load(path, map_location="cpu")
+    state_dict = ckpt.get("state_dict", ckpt)
+    # Lightning guarda los pesos como "model.<clave>"
+    state_dict = {(k[len("model."):] if k.startswith("model.") else k): v for k, v in state_dict.items()}
+    result = model.load_state_dict(state_dict, strict=False)
+    report = {"missing_keys": list(result.missing_keys), "unexpected_keys": list(result.unexpected_keys)}
+    for kind, keys in report.items():
+        if keys:
+            print(f"WARNING {kind} ({len(keys)}): {', '.join(keys[:10])}{' ...' if len(keys) > 10 else ''}")
+    if strict and (report["missing_keys"] or report["unexpected_keys"]):
+        raise RuntimeError("El checkpoint no coincide con la arquitectura (usar --no_strict para ignorarlo)")
+    return report
+
+
+def export_model(model: TCNMultiHead, output: str, seq_len: int = 64, opset: int = 17) -> None:
+    """Entrada x [B, T, 33, 3] con B y T dinámicos; salidas [B, L] / [B, R]."""
+    heads = _head_names(model)
+    dynamic_axes = {"x": {0: "B", 1: "T"}, **{n: {0: "B"} for n in heads}}
+    torch.onnx.export(
+        _HeadsExport(model).eval(),
+        torch.randn(2, seq_len, 33, 3),
+        output,
+        input_names=["x"],
+        output_names=heads,
+        dynamic_axes=dynamic_axes,
+        opset_version=opset,
+        **_export_kwargs(),
+    )
+
+
+def export_streaming(model: TCNMultiHead, output: str, opset: int = 17) -> None:
+    """
+    Exporta el modo incremental: entradas x [B, J, C] + estado, salidas heads + nuevo estado
+    (state_in_<nombre> -> state_out_<nombre>). El estado inicial es todo ceros con
+    las formas de StreamingTCN.initial_state.
+    """
+    streaming = StreamingTCN(model).eval()
+    state = streaming.initial_state(1)
+    names = streaming.state_names()
+    input_names = ["x"] + [f"state_in_{n}" for n in names]
+    output_names = _head_names(model) + [f"state_out_{n}" for n in names]
+    dynamic_axes = {n: {0: "B"} for n in input_names + output_names}
+
+    torch.onnx.export(
+        _StreamingExport(streaming).eval(),
+        (torch.randn(1, 33, 3), *state),
+        output,
+        input_names=input_names,
+        output_names=output_names,
+        dynamic_axes=dynamic_axes,
+        opset_version=opset,
+        **_export_kwargs(),
+    )
+
+
+def optimize_model(input_path: str, output_path: str) -> None:
+    """Optimización de grafo offline (fusiones y constant folding portables: nivel EXTENDED)."""
+    import onnxruntime as ort
+
+    opts = ort.SessionOptions()
+    opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED
+    opts.optimized_model_filepath = output_path
+    ort.InferenceSession(input_path, sess_options=opts, providers=["CPUExecutionProvider"])
+
 
-from models.tcn import TCNMultiHead
+class CalibrationReader:
+    """Interfaz de CalibrationDataReader de onnxruntime sobre una lista de entradas [1, T, 33, 3]."""
+
+    def __init__(self, samples: List[np.ndarray]):
+        self.samples = samples
+        self._it = iter(self.samples)
+
+    def get_next(self) -> Optional[Dict[str, np.ndarray]]:
+        x = next(self._it, None)
+        return None if x is None else {"x": x}
+
+    def rewind(self) -> None:
+        self._it = iter(self.samples)
+
+
+class DatasetCalibrationReader(CalibrationReader):
+    """Alimenta la calibración estática con secuencias de PoseSequenceDataset (batch 1)."""
+
+    def __init__(self, data_dir: str, split: str, num_samples: int, seed: int = 0):
+        from datasets import PoseSequenceDataset
+
+        ds = PoseSequenceDataset(data_dir, split=split)
+        rng = np.random.default_rng(seed)
+        idx = rng.choice(len(ds), size=min(num_samples, len(ds)), replace=False)
+        super().__init__([ds[int(i)]["x"].numpy()[None].astype(np.float32) for i in idx])
+
+
+class _RandomCalibrationReader(CalibrationReader):
+    # sin dataset: secuencias sintéticas (solo para probar el pipeline, no para producción)
+    def __init__(self, num_samples: int, seq_len: int, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        super().__init__([rng.standard_normal((1, seq_len, 33, 3)).astype(np.float32) for _ in range(num_samples)])
+
+
+def quantize_model(input_path: str, output_path: str, mode: str, reader=None) -> None:
+    from onnxruntime.quantization import QuantFormat, QuantType, quantize_dynamic, quantize_static
+
+    if mode == "dynamic":
+        quantize_dynamic(input_path, output_path, weight_type=QuantType.QInt8)
+    else:
+        quantize_static(
+            input_path,
+            output_path,
+            reader,
+            quant_format=QuantFormat.QDQ,
+            per_channel=True,
+            activation_type=QuantType.QInt8,
+            weight_type=QuantType.QInt8,
+        )
+
+
+def _session(path: str, threads: int = 0):
+    import onnxruntime as ort
+
+    opts = ort.SessionOptions()
+    if threads > 0:
+        opts.intra_op_num_threads = threads
+    return ort.InferenceSession(path, sess_options=opts, providers=["CPUExecutionProvider"])
+
+
+def check_parity(model: TCNMultiHead, onnx_path: str, batch_sizes: List[int], lengths: List[int], seed: int = 0) -> dict:
+    """Máxima diferencia absoluta ONNX vs PyTorch por salida, sobre entradas aleatorias."""
+    sess = _session(onnx_path)
+    heads = _head_names(model)
+    rng = np.random.default_rng(seed)
+    worst = {n: 0.0 for n in heads}
+    for B in batch_sizes:
+        for T in lengths:
+            x = rng.standard_normal((B, T, 33, 3)).astype(np.float32)
+            with torch.no_grad():
+                ref = [o.numpy() for o in model(torch.from_numpy(x)) if o is not None]
+            got = sess.run(heads, {"x": x})
+            for n, r, g in zip(heads, ref, got):
+                worst[n] = max(worst[n], float(np.abs(r - g).max()))
+    return worst
+
+
+def benchmark(onnx_path: str, batch_sizes: List[int], lengths: List[int], threads: int, repeats: int = 20) -> List[dict]:
+    sess = _session(onnx_path, threads)
+    rows = []
+    for B in batch_sizes:
+        for T in lengths:
+            x = np.random.default_rng(0).standard_normal((B, T, 33, 3)).astype(np.float32)
+            sess.run(None, {"x": x})  # warm-up
+            times = []
+            for _ in range(repeats):
+                t0 = time.perf_counter()
+                sess.run(None, {"x": x})
+                times.append(time.perf_counter() - t0)
+            median = float(np.median(times))
+            rows.append({
+                "batch": B,
+                "T": T,
+                "latency_ms_p50": round(median * 1e3, 3),
+                "sequences_per_sec": round(B / median, 1),
+            })
+    return rows
 
 
 def main():
@@ -11,36 +230,82 @@ def main():
     parser.add_argument("--num_labels", type=int, default=4)
     parser.add_argument("--num_targets", type=int, default=2)
     parser.add_argument("--seq_len", type=int, default=64)
+    parser.add_argument("--opset", type=int, default=17)
+    parser.add_argument("--streaming", action="store_true", help="exportar el modo incremental (un frame + estado)")
+    parser.add_argument("--no_strict", action="store_true", help="no fallar si el checkpoint tiene claves faltantes/extra")
+    parser.add_argument("--optimize", action="store_true", help="guardar además el grafo optimizado (<output>.opt.onnx)")
+    parser.add_argument("--quantize", type=str, default="none", choices=["none", "dynamic", "static"])
+    parser.add_argument("--calib_data_dir", type=str, default="")
+    parser.add_argument("--calib_split", type=str, default="train")
+    parser.add_argument("--calib_samples", type=int, default=64)
+    parser.add_argument("--parity_tol", type=float, default=1e-4, help="tolerancia de paridad fp32")
+    parser.add_argument("--bench", action="store_true")
+    parser.add_argument("--bench_batch_sizes", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--bench_lengths", type=int, nargs="+", default=[32, 64, 128])
+    parser.add_argument("--bench_threads", type=int, default=0, help="intra-op threads (0 = default de ORT)")
+    parser.add_argument("--report", type=str, default="", help="guardar el reporte JSON")
     args = parser.parse_args()
 
-    # Cargar arquitectura e inicializar
     model = TCNMultiHead(num_labels=args.num_labels, num_targets=args.num_targets)
-
-    # Si el checkpoint es de Lightning, puede requerir cargar state_dict['state_dict']
-    ckpt = torch.load(args.checkpoint, map_location="cpu")
-    state_dict = ckpt.get("state_dict", ckpt)
-    new_state_dict = {}
-    for k, v in state_dict.items():
-        nk = k
-        if nk.startswith("model."):
-            nk = nk[len("model."):]
-        new_state_dict[nk] = v
-    model.load_state_dict(new_state_dict, strict=False)
+    report: dict = {"checkpoint": args.checkpoint, "keys": load_checkpoint(model, args.checkpoint, not args.no_strict)}
     model.eval()
 
-    dummy = torch.randn(1, args.seq_len, 33, 3)  # [B, T, J, C]
+    out_dir = os.path.dirname(os.path.abspath(args.output))
+    os.makedirs(out_dir, exist_ok=True)
 
-    torch.onnx.export(
-        model,
-        dummy,
-        args.output,
-        input_names=["x"],
-        output_names=["logits", "preds"],
-        dynamic_axes={"x": {1: "T"}},
-        opset_version=17,
-    )
+    if args.streaming:
+        export_streaming(model, args.output, args.opset)
+        print(f"Exported streaming ONNX to {args.output}")
+        return
+
+    export_model(model, args.output, args.seq_len, args.opset)
     print(f"Exported ONNX to {args.output}")
 
+    base, _ = os.path.splitext(args.output)
+    variants = {"fp32": args.output}
+    if args.optimize:
+        variants["fp32_opt"] = base + ".opt.onnx"
+        optimize_model(args.output, variants["fp32_opt"])
+        print(f"Optimized graph: {variants['fp32_opt']}")
+    if args.quantize != "none":
+        reader = None
+        if args.quantize == "static":
+            if args.calib_data_dir:
+                reader = DatasetCalibrationReader(args.calib_data_dir, args.calib_split, args.calib_samples)
+            else:
+                print("WARNING sin --calib_data_dir: calibrando con secuencias aleatorias")
+                reader = _RandomCalibrationReader(args.calib_samples, args.seq_len)
+        variants[f"int8_{args.quantize}"] = base + f".int8-{args.quantize}.onnx"
+        # se cuantiza el grafo sin optimizar: ORT recomienda no partir de un grafo ya fusionado
+        quantize_model(args.output, variants[f"int8_{args.quantize}"], args.quantize, reader)
+        print(f"Quantized ({args.quantize}): {variants[f'int8_{args.quantize}']}")
+
+    lengths = sorted({16, args.seq_len, 2 * args.seq_len})
+    report["parity"] = {}
+    failed = False
+    for name, path in variants.items():
+        worst = check_parity(model, path, [1, 4], lengths)
+        report["parity"][name] = worst
+        enforced = not name.startswith("int8")
+        ok = all(v <= args.parity_tol for v in worst.values())
+        failed |= enforced and not ok
+        status = ("OK" if ok else "FAIL") if enforced else "info"
+        print(f"Parity {name}: " + ", ".join(f"{k} max|diff|={v:.2e}" for k, v in worst.items()) + f" [{status}]")
+
+    if args.bench:
+        report["bench"] = {}
+        for name, path in variants.items():
+            report["bench"][name] = benchmark(path, args.bench_batch_sizes, args.bench_lengths, args.bench_threads)
+            for row in report["bench"][name]:
+                print(f"Bench {name}: B={row['batch']} T={row['T']} p50={row['latency_ms_p50']}ms {row['sequences_per_sec']} seq/s")
+
+    report["files"] = {name: {"path": p, "bytes": os.path.getsize(p)} for name, p in variants.items()}
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if failed:
+        sys.exit(f"Paridad fp32 fuera de tolerancia ({args.parity_tol})")
+
 
 if __name__ == "__main__":
     main()
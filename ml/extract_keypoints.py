@@ -1,8 +1,11 @@
 import argparse
+import itertools
 import json
+import multiprocessing
 import os
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Optional, Tuple
 
 import cv2
 import numpy as np
@@ -15,6 +18,10 @@ except Exception:
     def dumps(obj):
         return json.dumps(obj).encode("utf-8")
 
+from frame_preprocess import FramePreprocessor
+from keypoint_store import KPS_SUFFIX, save_sequence, sequence_from_json, stem_of
+from video_decoder import BACKENDS, VideoDecoder, VideoOpenError, open_video
+
 try:
     import mediapipe as mp
 except ImportError as e:
@@ -56,6 +63,11 @@ POSE_LANDMARK_NAMES = [
     "right_foot_index",
 ]
 
+_NUM_JOINTS = len(POSE_LANDMARK_NAMES)
+# hombros, codos, muñecas y caderas: los que importan para el tiro
+_CORE_JOINTS = [11, 12, 13, 14, 15, 16, 23, 24]
+
+
 @dataclass
 class Keypoint:
     name: str
@@ -64,82 +76,391 @@ class Keypoint:
     v: float
 
 
+@dataclass
+class AdaptiveConfig:
+    """
+    Extracción adaptativa: MediaPipe corre solo en keyframes (cada `keyframe_interval`
+    frames muestreados) y los frames intermedios se completan con interpolación
+    lineal ("interp") o propagando los landmarks con flujo óptico Lucas-Kanade y
+    corrigiendo la deriva hacia el keyframe siguiente ("flow").
+
+    Se vuelve a inferencia en todos los frames cuando:
+    - la imagen cambia más que `motion_threshold` (diferencia media 0-1) respecto del último keyframe,
+    - las articulaciones se movieron entre keyframes más de `pose_motion_threshold`
+      anchos de hombros por frame (p. ej. cerca del release),
+    - el último keyframe no detectó pose o su visibilidad media es menor que `min_visibility`.
+    """
+    keyframe_interval: int = 4
+    mode: str = "flow"
+    motion_threshold: float = 0.04
+    pose_motion_threshold: float = 0.15
+    min_visibility: float = 0.5
+    analysis_width: int = 320
+
+
+def _landmarks_array(results) -> Optional[np.ndarray]:
+    """Landmarks de MediaPipe como [J, 3] (x, y, v) sin recortar, o None si no hay detección."""
+    if results.pose_landmarks is None:
+        return None
+    arr = np.zeros((_NUM_JOINTS, 3), dtype=np.float64)
+    for i, lm in enumerate(results.pose_landmarks.landmark[:_NUM_JOINTS]):
+        arr[i] = (lm.x, lm.y, lm.visibility if lm.visibility is not None else 0.0)
+    return arr
+
+
+def _frame_record(frame_index: int, t_sec: float, arr: Optional[np.ndarray]) -> Dict[str, Any]:
+    if arr is None:
+        # No detección, relleno con 0
+        kps = [Keypoint(name=n, x=0.0, y=0.0, v=0.0).__dict__ for n in POSE_LANDMARK_NAMES]
+    else:
+        kps = [
+            Keypoint(name=name, x=float(x), y=float(y), v=float(v)).__dict__
+            for name, (x, y, v) in zip(POSE_LANDMARK_NAMES, arr)
+        ]
+    return {
+        "index": int(frame_index),
+        "time_sec": float(t_sec),
+        "keypoints": kps,
+    }
+
+
+def _infer(pose, frame: np.ndarray, pre: Optional[FramePreprocessor] = None) -> Optional[np.ndarray]:
+    """Landmarks [J, 3] en coordenadas del frame completo, recortados a [0, 1]."""
+    if pre is None:
+        arr = _landmarks_array(pose.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)))
+        return None if arr is None else np.clip(arr, 0.0, 1.0)
+    arr = _landmarks_array(pose.process(pre.prepare(frame)))
+    if arr is not None:
+        arr = np.clip(pre.to_frame(arr), 0.0, 1.0)
+    if pre.update(arr) and hasattr(pose, "reset"):
+        # la caja cambió: el tracking/suavizado interno estaba en las coordenadas del recorte anterior
+        pose.reset()
+    return arr
+
+
+def _analysis_gray(frame: np.ndarray, width: int) -> np.ndarray:
+    h, w = frame.shape[:2]
+    if w > width:
+        frame = cv2.resize(frame, (width, max(1, round(h * width / w))), interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+
+def _is_confident(arr: Optional[np.ndarray], min_visibility: float) -> bool:
+    return arr is not None and float(arr[_CORE_JOINTS, 2].mean()) >= min_visibility
+
+
+def _pose_motion(a: np.ndarray, b: np.ndarray, frame_size: Tuple[int, int], steps: int, min_visibility: float) -> float:
+    """Desplazamiento mediano por frame de las articulaciones visibles en a y b, en anchos de hombros."""
+    size = np.asarray(frame_size, dtype=np.float64)
+    pa, pb = a[:, :2] * size, b[:, :2] * size
+    shoulder_w = max(np.linalg.norm(pa[11] - pa[12]), np.linalg.norm(pb[11] - pb[12]), 1e-6)
+    visible = (a[:, 2] >= min_visibility) & (b[:, 2] >= min_visibility)
+    if not visible.any():
+        return float("inf")
+    d = np.linalg.norm(pb[visible] - pa[visible], axis=-1)
+    return float(np.median(d)) / shoulder_w / max(1, steps)
+
+
+def _fill_between(
+    prev_key: Tuple[int, Optional[np.ndarray], np.ndarray],
+    pending: List[Tuple[int, np.ndarray]],
+    next_key: Tuple[int, Optional[np.ndarray], np.ndarray],
+    cfg: AdaptiveConfig,
+) -> List[Optional[np.ndarray]]:
+    """Landmarks [J, 3] para cada frame de `pending` entre dos keyframes."""
+    i0, a, gray0 = prev_key
+    i1, b, gray1 = next_key
+    if a is None or b is None:
+        # sin pose en un extremo no hay de dónde interpolar
+        return [None] * len(pending)
+
+    fracs = [(idx - i0) / (i1 - i0) for idx, _ in pending]
+    v = np.minimum(a[:, 2], b[:, 2])
+    out = [np.column_stack([(1 - f) * a[:, :2] + f * b[:, :2], v]) for f in fracs]
+    if cfg.mode != "flow":
+        return out
+
+    # Lucas-Kanade desde el keyframe anterior a través de los intermedios hasta el siguiente;
+    # el error acumulado al llegar se reparte linealmente (corrección hacia adelante-atrás)
+    gh, gw = gray0.shape[:2]
+    scale = np.array([gw, gh], dtype=np.float32)
+    tracked = a[:, 2] >= cfg.min_visibility
+    pts = (a[:, :2] * scale).astype(np.float32).reshape(-1, 1, 2)
+    path = []
+    prev_gray = gray0
+    for gray in [g for _, g in pending] + [gray1]:
+        pts, status, _ = cv2.calcOpticalFlowPyrLK(prev_gray, gray, pts, None, winSize=(21, 21), maxLevel=3)
+        tracked &= status.reshape(-1).astype(bool)
+        path.append(pts.reshape(-1, 2) / scale)
+        prev_gray = gray
+    residual = b[:, :2] - path[-1]
+    for k, f in enumerate(fracs):
+        flow_xy = np.clip(path[k] + f * residual, 0.0, 1.0)
+        out[k][tracked, :2] = flow_xy[tracked]
+    return out
+
+
+def _extract_adaptive(
+    decoder: VideoDecoder,
+    indices: Iterable[int],
+    frame_size: Tuple[int, int],
+    pose,
+    cfg: AdaptiveConfig,
+    pre: Optional[FramePreprocessor] = None,
+) -> Tuple[List[Dict[str, Any]], int]:
+    """Devuelve (frames, cantidad de keyframes con inferencia)."""
+    frames: List[Dict[str, Any]] = []
+    pending: List[Tuple[int, np.ndarray]] = []  # (index, gray) sin inferencia desde el último keyframe
+    last_key: Optional[Tuple[int, Optional[np.ndarray], np.ndarray]] = None
+    last_frame: Optional[np.ndarray] = None  # BGR del último pendiente, por si el video termina ahí
+    times: Dict[int, float] = {}  # index -> t_sec de los frames aún sin registro
+    interval = max(1, cfg.keyframe_interval)
+    keyframes = 0
+
+    def close_segment(key: Tuple[int, Optional[np.ndarray], np.ndarray]) -> None:
+        nonlocal interval, keyframes
+        keyframes += 1
+        if last_key is not None and pending:
+            for (idx, _), arr in zip(pending, _fill_between(last_key, pending, key, cfg)):
+                rec = _frame_record(idx, times.pop(idx), arr)
+                rec["source"] = cfg.mode
+                frames.append(rec)
+        rec = _frame_record(key[0], times.pop(key[0]), key[1])
+        rec["source"] = "inference"
+        frames.append(rec)
+
+        # volver a inferencia densa si la pose es dudosa o se mueve rápido
+        dense = not _is_confident(key[1], cfg.min_visibility)
+        if not dense and last_key is not None and last_key[1] is not None:
+            steps = len(pending) + 1
+            dense = _pose_motion(last_key[1], key[1], frame_size, steps, cfg.min_visibility) > cfg.pose_motion_threshold
+        interval = 1 if dense else max(1, cfg.keyframe_interval)
+
+    for frame_index, t_sec, frame in decoder.frames(indices):
+        times[frame_index] = t_sec
+        gray = _analysis_gray(frame, cfg.analysis_width)
+        is_key = (
+            last_key is None
+            or len(pending) + 1 >= interval
+            or float(cv2.absdiff(gray, last_key[2]).mean()) / 255.0 > cfg.motion_threshold
+        )
+        if not is_key:
+            pending.append((frame_index, gray))
+            last_frame = frame
+            continue
+        key = (frame_index, _infer(pose, frame, pre), gray)
+        close_segment(key)
+        last_key, pending = key, []
+
+    if pending:
+        # el último frame muestreado siempre es keyframe
+        idx, gray = pending.pop()
+        close_segment((idx, _infer(pose, last_frame, pre), gray))
+    return frames, keyframes
+
+
+def create_pose(
+    model_complexity: int = 1,
+    min_detection_confidence: float = 0.5,
+    min_tracking_confidence: float = 0.5,
+):
+    return mp.solutions.pose.Pose(
+        static_image_mode=False,
+        model_complexity=model_complexity,
+        smooth_landmarks=True,
+        enable_segmentation=False,
+        min_detection_confidence=min_detection_confidence,
+        min_tracking_confidence=min_tracking_confidence,
+    )
+
+
 def extract_from_video(
     video_path: str,
     stride: int = 1,
     model_complexity: int = 1,
     min_detection_confidence: float = 0.5,
     min_tracking_confidence: float = 0.5,
+    pose=None,
+    start_frame: int = 0,
+    end_frame: Optional[int] = None,
+    adaptive: Optional[AdaptiveConfig] = None,
+    max_long_side: int = 0,
+    roi: bool = False,
+    decoder: str = "auto",
+    decoder_threads: int = 0,
 ) -> Dict[str, Any]:
+    """
+    Si se pasa `pose` (instancia reutilizada entre videos) se resetea el tracking
+    y no se cierra al terminar; en ese caso los parámetros del modelo se ignoran.
+    Con start_frame/end_frame se procesa solo el rango [start_frame, end_frame)
+    muestreando start_frame, start_frame + stride, ...
+    Con `adaptive` solo se infiere en keyframes (ver AdaptiveConfig); cada frame
+    lleva "source" ("inference", "interp" o "flow").
+    `max_long_side` (> 0) reduce lo que entra a MediaPipe y `roi` recorta la caja
+    de la persona del frame anterior (ver FramePreprocessor); los landmarks
+    siempre quedan normalizados al frame completo.
+    `decoder` elige el backend de video_decoder ("auto", "pyav", "opencv"); con
+    pyav "time_sec" sale del PTS de cada frame y, sin ROI, el downscale se hace
+    en el decoder.
+    """
     if not os.path.exists(video_path):
         raise FileNotFoundError(f"Video not found: {video_path}")
 
-    cap = cv2.VideoCapture(video_path)
-    if not cap.isOpened():
-        raise RuntimeError(f"Could not open video: {video_path}")
+    try:
+        # con ROI el recorte se hace sobre el frame completo: el decoder no reduce
+        dec = open_video(video_path, decoder, 0 if roi else max_long_side, decoder_threads)
+    except VideoOpenError as e:
+        raise RuntimeError(f"Could not open video: {video_path}") from e
 
-    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
-    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    fps = dec.info.fps
+    width, height = dec.info.width, dec.info.height
 
-    mp_pose = mp.solutions.pose
-    pose = mp_pose.Pose(
-        static_image_mode=False,
-        model_complexity=model_complexity,
-        smooth_landmarks=True,
-        enable_segmentation=False,
-        min_detection_confidence=min_detection_confidence,
-        min_tracking_confidence=min_tracking_confidence,
-    )
+    owns_pose = pose is None
+    if owns_pose:
+        pose = create_pose(model_complexity, min_detection_confidence, min_tracking_confidence)
+    elif hasattr(pose, "reset"):
+        # no arrastrar el tracking/suavizado del video anterior
+        pose.reset()
 
-    frames: List[Dict[str, Any]] = []
-    frame_index = 0
+    dec.seek(start_frame)
+    step = max(1, stride)
+    if end_frame is None:
+        indices: Iterable[int] = itertools.count(start_frame, step)
+    else:
+        indices = range(start_frame, end_frame, step)
 
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
+    pre = FramePreprocessor(max_long_side, roi)
+    pre = pre if pre.active else None
+    keyframes = None
+    if adaptive is not None and adaptive.keyframe_interval > 1:
+        frames, keyframes = _extract_adaptive(dec, indices, (width, height), pose, adaptive, pre)
+    else:
+        frames = [_frame_record(idx, t_sec, _infer(pose, frame, pre)) for idx, t_sec, frame in dec.frames(indices)]
 
-        if stride > 1 and (frame_index % stride != 0):
-            frame_index += 1
-            continue
+    dec.close()
+    if owns_pose:
+        pose.close()
 
-        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        results = pose.process(rgb)
-
-        if results.pose_landmarks is not None:
-            landmarks = results.pose_landmarks.landmark
-            kps: List[Keypoint] = []
-            for i, lm in enumerate(landmarks[: len(POSE_LANDMARK_NAMES)]):
-                x = float(np.clip(lm.x, 0.0, 1.0))
-                y = float(np.clip(lm.y, 0.0, 1.0))
-                v = float(np.clip(lm.visibility if lm.visibility is not None else 0.0, 0.0, 1.0))
-                name = POSE_LANDMARK_NAMES[i] if i < len(POSE_LANDMARK_NAMES) else f"kp_{i}"
-                kps.append(Keypoint(name=name, x=x, y=y, v=v).__dict__)
-        else:
-            # No detección, relleno con 0
-            kps = [Keypoint(name=n, x=0.0, y=0.0, v=0.0).__dict__ for n in POSE_LANDMARK_NAMES]
-
-        t = frame_index / fps
-        frames.append({
-            "index": int(frame_index),
-            "time_sec": float(t),
-            "keypoints": kps,
-        })
-
-        frame_index += 1
-
-    cap.release()
-    pose.close()
-
-    return {
+    data = {
         "version": 1,
         "source_video": os.path.abspath(video_path),
         "width": width,
         "height": height,
         "fps": float(fps),
+        "decoder": dec.backend,
         "frames": frames,
     }
+    if keyframes is not None:
+        data["adaptive"] = {**adaptive.__dict__, "keyframes": keyframes}
+    return data
+
+
+def plan_shard_ranges(total_frames: int, shards: int, stride: int = 1, overlap_frames: int = 0) -> List[Tuple[int, int, int]]:
+    """
+    Divide [0, total_frames) en `shards` rangos (warmup_start, own_start, own_end).
+    Los límites propios se alinean a múltiplos de `stride`, así los frames
+    muestreados son los mismos que en una pasada secuencial y cada índice
+    pertenece a un único shard. El tramo [warmup_start, own_start) solo sirve
+    para que el tracker y el suavizado converjan y se descarta al unir.
+    El último rango usa own_end=-1 (hasta el final del video).
+    """
+    step = max(1, stride)
+    samples = -(-total_frames // step)
+    shards = max(1, min(shards, samples))
+    bounds = [(samples * k // shards) * step for k in range(shards + 1)]
+    ranges = []
+    for k in range(shards):
+        own_start, own_end = bounds[k], bounds[k + 1]
+        warmup_start = max(0, own_start - (overlap_frames // step) * step)
+        ranges.append((warmup_start, own_start, own_end if k < shards - 1 else -1))
+    return ranges
+
+
+def _extract_range(video_path: str, warmup_start: int, own_start: int, own_end: int, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    data = extract_from_video(
+        video_path,
+        start_frame=warmup_start,
+        end_frame=None if own_end < 0 else own_end,
+        **kwargs,
+    )
+    data["frames"] = [fr for fr in data["frames"] if fr["index"] >= own_start]
+    return data
+
+
+def extract_sharded(
+    video_path: str,
+    shards: int,
+    overlap_sec: float = 1.0,
+    stride: int = 1,
+    model_complexity: int = 1,
+    min_detection_confidence: float = 0.5,
+    min_tracking_confidence: float = 0.5,
+    adaptive: Optional[AdaptiveConfig] = None,
+    max_long_side: int = 0,
+    roi: bool = False,
+    decoder: str = "auto",
+    decoder_threads: int = 0,
+) -> Dict[str, Any]:
+    """
+    Extrae un video largo en `shards` procesos paralelos por rangos de frames y
+    une el resultado en una sola secuencia (mismo formato que extract_from_video).
+    Cada shard arranca `overlap_sec` antes de su rango para calentar el tracker;
+    en la costura se queda siempre el frame del shard dueño de ese índice.
+    El resultado NO es idéntico al de la pasada secuencial (el estado del tracker
+    depende del camino) ni necesariamente más rápido: medir con bench/shard_extraction.py.
+    """
+    if not os.path.exists(video_path):
+        raise FileNotFoundError(f"Video not found: {video_path}")
+    try:
+        with open_video(video_path, decoder) as dec:
+            fps = dec.info.fps
+            total = dec.info.estimated_frames()
+    except VideoOpenError as e:
+        raise RuntimeError(f"Could not open video: {video_path}") from e
+
+    kwargs = {
+        "stride": stride,
+        "model_complexity": model_complexity,
+        "min_detection_confidence": min_detection_confidence,
+        "min_tracking_confidence": min_tracking_confidence,
+        "adaptive": adaptive,
+        "max_long_side": max_long_side,
+        "roi": roi,
+        "decoder": decoder,
+        "decoder_threads": decoder_threads,
+    }
+    if shards <= 1 or total <= 0:
+        return extract_from_video(video_path, **kwargs)
+
+    ranges = plan_shard_ranges(total, shards, stride, int(round(overlap_sec * fps)))
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=len(ranges), mp_context=ctx) as ex:
+        futs = [ex.submit(_extract_range, video_path, w, s, e, kwargs) for w, s, e in ranges]
+        parts = [f.result() for f in futs]
+
+    data = parts[0]
+    data["frames"] = [fr for part in parts for fr in part["frames"]]
+    if "adaptive" in data:
+        # keyframes de los tramos propios (los del warm-up se descartaron)
+        data["adaptive"]["keyframes"] = sum(
+            fr.get("source") == "inference" for fr in data["frames"]
+        )
+    return data
+
+
+def save_keypoints(data: Dict[str, Any], output_path: str, fmt: str = "json") -> str:
+    """Escribe el resultado de extract_from_video como JSON o en formato columnar (npy)."""
+    if fmt == "npy":
+        stem = stem_of(output_path)
+        save_sequence(stem, sequence_from_json(data, POSE_LANDMARK_NAMES))
+        return stem + KPS_SUFFIX
+
+    out_dir = os.path.dirname(os.path.abspath(output_path))
+    if out_dir and not os.path.exists(out_dir):
+        os.makedirs(out_dir, exist_ok=True)
+    with open(output_path, "wb") as f:
+        f.write(dumps(data))
+    return output_path
 
 
 def main():
@@ -150,24 +471,45 @@ def main():
     parser.add_argument("--model_complexity", type=int, default=1)
     parser.add_argument("--min_detection_confidence", type=float, default=0.5)
     parser.add_argument("--min_tracking_confidence", type=float, default=0.5)
+    parser.add_argument("--format", type=str, default="json", choices=["json", "npy"])
+    parser.add_argument("--shards", type=int, default=1, help="procesos en paralelo por rangos de frames; no idéntico a la pasada secuencial, medir antes (bench/shard_extraction.py)")
+    parser.add_argument("--overlap_sec", type=float, default=1.0, help="warm-up del tracker antes de cada rango")
+    parser.add_argument("--keyframe_interval", type=int, default=1, help=">1: inferencia solo en keyframes (modo adaptativo)")
+    parser.add_argument("--adaptive_mode", type=str, default="flow", choices=["flow", "interp"])
+    parser.add_argument("--motion_threshold", type=float, default=0.04, help="diferencia media de imagen (0-1) que fuerza keyframe")
+    parser.add_argument("--pose_motion_threshold", type=float, default=0.15, help="anchos de hombros por frame que fuerzan inferencia densa")
+    parser.add_argument("--max_long_side", type=int, default=0, help="lado largo máximo de la imagen que entra a MediaPipe (0 = sin reducir)")
+    parser.add_argument("--roi", action="store_true", help="recortar la caja de la persona según el frame anterior")
+    parser.add_argument("--decoder", type=str, default="auto", choices=BACKENDS, help="pyav (threads, PTS reales) u opencv")
+    parser.add_argument("--decoder_threads", type=int, default=0, help="threads de decodificación pyav (0 = automático)")
     args = parser.parse_args()
 
-    data = extract_from_video(
+    adaptive = None
+    if args.keyframe_interval > 1:
+        adaptive = AdaptiveConfig(
+            keyframe_interval=args.keyframe_interval,
+            mode=args.adaptive_mode,
+            motion_threshold=args.motion_threshold,
+            pose_motion_threshold=args.pose_motion_threshold,
+        )
+
+    data = extract_sharded(
         video_path=args.video_path,
+        shards=args.shards,
+        overlap_sec=args.overlap_sec,
         stride=args.stride,
         model_complexity=args.model_complexity,
         min_detection_confidence=args.min_detection_confidence,
         min_tracking_confidence=args.min_tracking_confidence,
+        adaptive=adaptive,
+        max_long_side=args.max_long_side,
+        roi=args.roi,
+        decoder=args.decoder,
+        decoder_threads=args.decoder_threads,
     )
 
-    out_dir = os.path.dirname(os.path.abspath(args.output_path))
-    if out_dir and not os.path.exists(out_dir):
-        os.makedirs(out_dir, exist_ok=True)
-
-    with open(args.output_path, "wb") as f:
-        f.write(dumps(data))
-
-    print(f"OK: {args.output_path}")
+    out_path = save_keypoints(data, args.output_path, args.format)
+    print(f"OK: {out_path}")
 
 
 if __name__ == "__main__":
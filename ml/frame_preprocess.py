@@ -0,0 +1,119 @@
+"""
+Preprocesado de frames antes de MediaPipe Pose. Lo usa también pose-service
+(ver pose-service/ml_shared.py).
+
+- ROI: se recorta la caja de la persona (landmarks visibles del frame anterior
+  más un margen). La caja queda fija mientras los landmarks no se acerquen al
+  borde, porque cada cambio obliga a resetear el tracking/suavizado de MediaPipe
+  (sus coordenadas son relativas a la imagen que recibe). Sin detección se
+  vuelve al frame completo.
+- Downscale: el lado largo de lo que entra a MediaPipe se limita a
+  `max_long_side` (antes del cvtColor, que así también procesa menos pixeles;
+  INTER_LINEAR: INTER_AREA con factores no enteros cuesta más de lo que ahorra).
+- `to_frame` lleva los landmarks a coordenadas normalizadas del frame completo.
+"""
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+
+
+class FramePreprocessor:
+    def __init__(
+        self,
+        max_long_side: int = 0,
+        roi: bool = False,
+        roi_padding: float = 0.5,
+        roi_min_size: float = 0.2,
+        min_visibility: float = 0.3,
+    ):
+        self.max_long_side = max(0, max_long_side)
+        self.roi = roi
+        self.roi_padding = roi_padding
+        self.roi_min_size = roi_min_size
+        self.min_visibility = min_visibility
+        self.reset()
+
+    @property
+    def active(self) -> bool:
+        return self.roi or self.max_long_side > 0
+
+    def reset(self) -> None:
+        self.box: Optional[Tuple[float, float, float, float]] = None  # (x0, y0, x1, y1) normalizado
+        self._keep: Optional[Tuple[float, float, float, float]] = None  # zona interior donde la caja sigue valiendo
+        self._min_area = 0.0
+        self._crop = (0.0, 0.0, 1.0, 1.0)  # (x0, y0, w, h) normalizado de la última imagen preparada
+        self._frame_size = (1, 1)
+
+    def prepare(self, frame: np.ndarray) -> np.ndarray:
+        """BGR completo -> RGB (recortado y/o reducido) listo para pose.process."""
+        H, W = frame.shape[:2]
+        self._frame_size = (W, H)
+        if self.box is not None:
+            x0, y0, x1, y1 = self.box
+            px0, py0 = int(x0 * W), int(y0 * H)
+            px1, py1 = max(px0 + 1, int(np.ceil(x1 * W))), max(py0 + 1, int(np.ceil(y1 * H)))
+            frame = frame[py0:py1, px0:px1]
+            self._crop = (px0 / W, py0 / H, (px1 - px0) / W, (py1 - py0) / H)
+        else:
+            self._crop = (0.0, 0.0, 1.0, 1.0)
+
+        h, w = frame.shape[:2]
+        if self.max_long_side and max(h, w) > self.max_long_side:
+            s = self.max_long_side / max(h, w)
+            frame = cv2.resize(frame, (max(1, round(w * s)), max(1, round(h * s))), interpolation=cv2.INTER_LINEAR)
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+    def to_frame(self, landmarks: np.ndarray) -> np.ndarray:
+        """[J, >=2] normalizado a la imagen preparada -> normalizado al frame completo (copia)."""
+        x0, y0, w, h = self._crop
+        out = np.array(landmarks, dtype=np.float64, copy=True)
+        out[:, 0] = x0 + out[:, 0] * w
+        out[:, 1] = y0 + out[:, 1] * h
+        return out
+
+    def update(self, landmarks: Optional[np.ndarray]) -> bool:
+        """
+        Actualiza la caja con los landmarks del frame (coordenadas del frame completo,
+        [J, 3] con visibilidad). Devuelve True si la caja cambió: el llamador debe
+        resetear el Pose para no suavizar a través del salto de coordenadas.
+        """
+        if not self.roi:
+            return False
+        previous = self.box
+        pts = None
+        if landmarks is not None:
+            pts = landmarks[landmarks[:, 2] >= self.min_visibility, :2]
+        if pts is None or len(pts) < 4:
+            self.box = self._keep = None
+            return previous is not None
+
+        (x0, y0), (x1, y1) = pts.min(axis=0), pts.max(axis=0)
+        if self._keep is not None:
+            kx0, ky0, kx1, ky1 = self._keep
+            inside = x0 >= kx0 and y0 >= ky0 and x1 <= kx1 and y1 <= ky1
+            if inside and (x1 - x0) * (y1 - y0) >= self._min_area:
+                return False
+
+        # margen proporcional al lado mayor de la persona, en pixeles
+        W, H = self._frame_size
+        pad = self.roi_padding * max((x1 - x0) * W, (y1 - y0) * H)
+        px, py = pad / W, pad / H
+        bx0, by0, bx1, by1 = x0 - px, y0 - py, x1 + px, y1 + py
+        # tamaño mínimo (fracción del frame) centrado en la persona
+        for lo, hi, axis in ((bx0, bx1, 0), (by0, by1, 1)):
+            if hi - lo < self.roi_min_size:
+                c = 0.5 * (lo + hi)
+                lo, hi = c - 0.5 * self.roi_min_size, c + 0.5 * self.roi_min_size
+            if axis == 0:
+                bx0, bx1 = lo, hi
+            else:
+                by0, by1 = lo, hi
+        self.box = (max(0.0, bx0), max(0.0, by0), min(1.0, bx1), min(1.0, by1))
+        if self.box == (0.0, 0.0, 1.0, 1.0):
+            self.box = None
+        # la caja se conserva mientras la persona no use más de 3/4 del margen y no se achique a menos
+        # de un tercio: cada cambio cuesta un reset (y una detección completa) en MediaPipe
+        self._keep = (x0 - 0.75 * px, y0 - 0.75 * py, x1 + 0.75 * px, y1 + 0.75 * py) if self.box is not None else None
+        self._min_area = (x1 - x0) * (y1 - y0) / 3.0
+        return self.box != previous
@@ -0,0 +1,216 @@
+"""
+Formato columnar para secuencias de keypoints (alternativa binaria al JSON por video).
+
+Para un "stem" (p. ej. out/video_001) se escriben tres archivos:
+- video_001.kps.npy     float32 [T, J, 3] (x, y, v)          -> se carga con mmap
+- video_001.frames.npy  estructurado [T] (index int64, time_sec float64)
+- video_001.meta.json   fps, width, height, names, source_video y extras
+                        del JSON original (labels, targets, window, ...)
+"""
+import argparse
+import glob
+import json
+import operator
+import os
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+try:
+    import orjson as fastjson
+    def dumps(obj):
+        return fastjson.dumps(obj)
+    def loads(b):
+        return fastjson.loads(b)
+except Exception:
+    def dumps(obj):
+        return json.dumps(obj).encode("utf-8")
+    def loads(b):
+        return json.loads(b)
+
+FORMAT_VERSION = 1
+KPS_SUFFIX = ".kps.npy"
+FRAMES_SUFFIX = ".frames.npy"
+META_SUFFIX = ".meta.json"
+FRAMES_DTYPE = np.dtype([("index", "<i8"), ("time_sec", "<f8")])
+
+# claves del JSON de extracción que pasan a arrays; el resto va a meta
+_ARRAY_KEYS = {"frames"}
+_KP_FIELDS = operator.itemgetter("name", "x", "y", "v")
+
+
+@dataclass
+class KeypointSequence:
+    keypoints: np.ndarray  # float32 [T, J, 3] (x, y, v)
+    index: np.ndarray  # int64 [T]
+    time_sec: np.ndarray  # float64 [T]
+    fps: float
+    width: int
+    height: int
+    names: List[str]
+    meta: Dict[str, Any] = field(default_factory=dict)
+
+
+def stem_of(path: str) -> str:
+    for suffix in (KPS_SUFFIX, FRAMES_SUFFIX, META_SUFFIX, ".json"):
+        if path.endswith(suffix):
+            return path[: -len(suffix)]
+    return path
+
+
+def frames_to_keypoints(frames: List[Dict[str, Any]], names: List[str]) -> np.ndarray:
+    """
+    Decodifica la lista de frames JSON a un array float32 [T, J, 3] (x, y, v).
+    Una sola pasada de Python extrae los campos; índices y valores se arman como
+    arrays y el llenado es un único scatter de NumPy. Nombres desconocidos se ignoran.
+    """
+    name_to_idx = {n: i for i, n in enumerate(names)}
+    T, J = len(frames), len(names)
+    keypoints = np.zeros((T, J, 3), dtype=np.float32)
+    try:
+        rows = [_KP_FIELDS(kp) for fr in frames for kp in fr["keypoints"]]
+    except KeyError:
+        # keypoints incompletos, o con "score" (respuestas de pose-service) en vez de "v"
+        rows = [
+            (kp.get("name"), kp.get("x", 0.0), kp.get("y", 0.0), kp.get("v", kp.get("score", 0.0)))
+            for fr in frames
+            for kp in fr.get("keypoints", [])
+        ]
+    if not rows:
+        return keypoints
+
+    kp_names, xs, ys, vs = zip(*rows)
+    t_idx = np.repeat(np.arange(T), [len(fr.get("keypoints", [])) for fr in frames])
+    j_idx = np.fromiter((name_to_idx.get(n, -1) for n in kp_names), dtype=np.int64, count=len(rows))
+    values = np.array([xs, ys, vs], dtype=np.float64).T
+    valid = j_idx >= 0
+    keypoints[t_idx[valid], j_idx[valid]] = values[valid]
+    return keypoints
+
+
+def sequence_from_json(sample: Dict[str, Any], names: Optional[List[str]] = None) -> KeypointSequence:
+    """Convierte el dict de extract_keypoints (o un JSON de ventanas) a arrays."""
+    frames = sample.get("frames", [])
+    if names is None:
+        names = next(([kp["name"] for kp in fr["keypoints"]] for fr in frames if fr.get("keypoints")), [])
+
+    keypoints = frames_to_keypoints(frames, names)
+    index = np.array([int(fr.get("index", t)) for t, fr in enumerate(frames)], dtype=np.int64)
+    time_sec = np.array([float(fr.get("time_sec", 0.0)) for fr in frames], dtype=np.float64)
+
+    meta = {k: v for k, v in sample.items() if k not in _ARRAY_KEYS}
+    return KeypointSequence(
+        keypoints=keypoints,
+        index=index,
+        time_sec=time_sec,
+        fps=float(sample.get("fps", 30.0)),
+        width=int(sample.get("width", 0) or 0),
+        height=int(sample.get("height", 0) or 0),
+        names=list(names),
+        meta=meta,
+    )
+
+
+def save_sequence(stem: str, seq: KeypointSequence) -> None:
+    out_dir = os.path.dirname(os.path.abspath(stem))
+    os.makedirs(out_dir, exist_ok=True)
+
+    frames = np.empty(len(seq.index), dtype=FRAMES_DTYPE)
+    frames["index"] = seq.index
+    frames["time_sec"] = seq.time_sec
+    np.save(stem + KPS_SUFFIX, np.ascontiguousarray(seq.keypoints, dtype=np.float32))
+    np.save(stem + FRAMES_SUFFIX, frames)
+
+    meta = dict(seq.meta)
+    meta.update({
+        "format": "kps-npy",
+        "format_version": FORMAT_VERSION,
+        "fps": float(seq.fps),
+        "width": int(seq.width),
+        "height": int(seq.height),
+        "names": list(seq.names),
+        "num_frames": int(seq.keypoints.shape[0]),
+    })
+    # meta al final: su presencia marca la secuencia como completa
+    with open(stem + META_SUFFIX, "wb") as f:
+        f.write(dumps(meta))
+
+
+def load_meta(stem: str) -> Dict[str, Any]:
+    with open(stem + META_SUFFIX, "rb") as f:
+        return loads(f.read())
+
+
+def load_sequence(stem: str, mmap: bool = True, meta: Optional[Dict[str, Any]] = None) -> KeypointSequence:
+    """Carga una secuencia; con mmap=True los arrays se mapean sin leerlos completos."""
+    stem = stem_of(stem)
+    if meta is None:
+        meta = load_meta(stem)
+    mode = "r" if mmap else None
+    keypoints = np.load(stem + KPS_SUFFIX, mmap_mode=mode)
+    frames = np.load(stem + FRAMES_SUFFIX, mmap_mode=mode)
+    return KeypointSequence(
+        keypoints=keypoints,
+        index=frames["index"],
+        time_sec=frames["time_sec"],
+        fps=float(meta.get("fps", 30.0)),
+        width=int(meta.get("width", 0)),
+        height=int(meta.get("height", 0)),
+        names=list(meta.get("names", [])),
+        meta=meta,
+    )
+
+
+def sequence_to_json(seq: KeypointSequence) -> Dict[str, Any]:
+    """Inversa de sequence_from_json (mismo formato que extract_keypoints)."""
+    reserved = {"format", "format_version", "names", "num_frames"}
+    out = {k: v for k, v in seq.meta.items() if k not in reserved}
+    out.update({"fps": float(seq.fps), "width": int(seq.width), "height": int(seq.height)})
+    frames = []
+    for i, t, kps in zip(seq.index.tolist(), seq.time_sec.tolist(), np.asarray(seq.keypoints).tolist()):
+        frames.append({
+            "index": i,
+            "time_sec": t,
+            "keypoints": [{"name": n, "x": x, "y": y, "v": v} for n, (x, y, v) in zip(seq.names, kps)],
+        })
+    out["frames"] = frames
+    return out
+
+
+def convert_json_file(json_path: str, out_stem: str) -> int:
+    with open(json_path, "rb") as f:
+        sample = loads(f.read())
+    seq = sequence_from_json(sample)
+    save_sequence(out_stem, seq)
+    return int(seq.keypoints.shape[0])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convertir JSON de keypoints al formato columnar (.npy + meta)")
+    parser.add_argument("--input", type=str, required=True, help="archivo JSON o directorio")
+    parser.add_argument("--output_dir", type=str, required=True)
+    parser.add_argument("--pattern", type=str, default="**/*.json")
+    args = parser.parse_args()
+
+    if os.path.isdir(args.input):
+        paths = glob.glob(os.path.join(args.input, args.pattern), recursive=True)
+        paths = sorted(p for p in paths if not p.endswith(META_SUFFIX))
+        base_dir = args.input
+    else:
+        paths = [args.input]
+        base_dir = os.path.dirname(os.path.abspath(args.input))
+
+    for p in paths:
+        # conserva la estructura de subdirectorios (train/, val/, ...)
+        rel = os.path.relpath(os.path.abspath(p), os.path.abspath(base_dir))
+        out_stem = os.path.join(args.output_dir, stem_of(rel))
+        try:
+            n = convert_json_file(p, out_stem)
+            print(f"OK {out_stem} ({n} frames)")
+        except Exception as e:
+            print(f"ERROR {p}: {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -57,11 +57,103 @@ class TCNMultiHead(nn.Module):
             nn.Conv1d(ch, ch, 1), nn.ReLU(inplace=True), nn.AdaptiveAvgPool1d(1), nn.Flatten(), nn.Linear(ch, num_targets)
         ) if num_targets > 0 else None
 
-    def forward(self, x: torch.Tensor) -> tuple[Optional[torch.Tensor], Optional[torch.Tensor]]:
-        # x: [B, T, J, C] -> [B, (J*C), T]
+    def forward(
+        self, x: torch.Tensor, mask: Optional[torch.Tensor] = None
+    ) -> tuple[Optional[torch.Tensor], Optional[torch.Tensor]]:
+        # x: [B, T, J, C] -> [B, (J*C), T]; mask: [B, T] (True = frame real) o None
         B, T, J, C = x.shape
-        x = x.view(B, T, J * C).transpose(1, 2)
+        x = x.reshape(B, T, J * C).transpose(1, 2)
         feats = self.backbone(x)
-        logits = self.head_cls(feats) if self.head_cls is not None else None
-        preds = self.head_reg(feats) if self.head_reg is not None else None
+        logits = self._run_head(self.head_cls, feats, mask) if self.head_cls is not None else None
+        preds = self._run_head(self.head_reg, feats, mask) if self.head_reg is not None else None
         return logits, preds
+
+    @staticmethod
+    def _run_head(head: nn.Sequential, feats: torch.Tensor, mask: Optional[torch.Tensor]) -> torch.Tensor:
+        if mask is None:
+            return head(feats)
+        # el backbone es causal: el padding a la derecha no altera los frames reales,
+        # solo hay que excluirlo del promedio temporal (mismos módulos -> mismo state_dict)
+        h = head[1](head[0](feats))
+        m = mask.to(h.dtype).unsqueeze(1)  # [B, 1, T]
+        pooled = (h * m).sum(dim=2) / m.sum(dim=2).clamp_min(1.0)
+        return head[4](pooled)
+
+
+class StreamingTCN(nn.Module):
+    """
+    Inferencia incremental (frame a frame) de un TCNMultiHead ya entrenado.
+
+    Cada conv dilatada guarda una ventana con sus últimas (k-1)*d entradas
+    (inicializada en ceros = el padding izquierdo del forward completo) y cada
+    head acumula la suma de sus activaciones y la cantidad de frames. Así cada
+    frame nuevo cuesta O(1) y las salidas coinciden con model(x[:, :t+1]).
+
+    El estado es explícito (lista de tensores) para poder exportar a ONNX:
+        logits, preds, *state = streaming(frame, *state)
+    Solo inferencia (model.eval()): dropout no se aplica.
+    """
+
+    def __init__(self, model: TCNMultiHead):
+        super().__init__()
+        self.model = model
+        self.heads = [h for h in (model.head_cls, model.head_reg) if h is not None]
+
+    def state_names(self) -> list[str]:
+        names = []
+        for i in range(len(self.model.backbone)):
+            names += [f"block{i}_conv1", f"block{i}_conv2"]
+        names += [f"head{i}_sum" for i in range(len(self.heads))]
+        return names + ["count"]
+
+    def initial_state(self, batch_size: int = 1, device=None, dtype=torch.float32) -> list[torch.Tensor]:
+        state = []
+        for block in self.model.backbone:
+            for conv in (block.conv1, block.conv2):
+                width = (conv.kernel_size[0] - 1) * conv.dilation[0]
+                state.append(torch.zeros(batch_size, conv.in_channels, width, device=device, dtype=dtype))
+        for head in self.heads:
+            state.append(torch.zeros(batch_size, head[0].out_channels, device=device, dtype=dtype))
+        state.append(torch.zeros(batch_size, 1, device=device, dtype=dtype))
+        return state
+
+    @staticmethod
+    def _conv_step(conv: nn.Conv1d, window: torch.Tensor, x: torch.Tensor) -> tuple[torch.Tensor, torch.Tensor]:
+        # window: [B, C_in, (k-1)*d], x: [B, C_in, 1] -> salida [B, C_out, 1] y ventana desplazada
+        # con una sola posición de salida la conv es un producto matricial sobre los k taps
+        # dilatados (mucho más barato que conv1d en eager)
+        full = torch.cat([window, x], dim=2)
+        taps = full[:, :, :: conv.dilation[0]]  # [B, C_in, k]
+        out = nn.functional.linear(taps.reshape(taps.shape[0], -1), conv.weight.reshape(conv.out_channels, -1), conv.bias)
+        return out.unsqueeze(2), full[:, :, 1:]
+
+    def forward(self, frame: torch.Tensor, *state: torch.Tensor):
+        # frame: [B, J, C] (un solo frame, ya normalizado como en el entrenamiento)
+        B = frame.shape[0]
+        x = frame.reshape(B, -1, 1)
+        new_state = []
+        k = 0
+        for block in self.model.backbone:
+            out, w1 = self._conv_step(block.conv1, state[k], x)
+            out = torch.relu(out)
+            out, w2 = self._conv_step(block.conv2, state[k + 1], out)
+            out = torch.relu(out)
+            res = block.downsample(x) if block.downsample is not None else x
+            x = out + res
+            new_state += [w1, w2]
+            k += 2
+
+        count = state[-1] + 1.0
+        feats = x[:, :, 0]  # [B, ch]
+        outputs = []
+        for i, head in enumerate(self.heads):
+            h = torch.relu(nn.functional.linear(feats, head[0].weight[:, :, 0], head[0].bias))
+            total = state[k + i] + h
+            new_state.append(total)
+            outputs.append(head[4](total / count))
+        new_state.append(count)
+
+        it = iter(outputs)
+        logits = next(it) if self.model.head_cls is not None else None
+        preds = next(it) if self.model.head_reg is not None else None
+        return (logits, preds, *new_state)
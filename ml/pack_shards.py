@@ -0,0 +1,128 @@
+"""
+Empaqueta un split (JSON o formato columnar) en pocos shards grandes para
+PackedPoseDataset:
+
+    out/<split>/shard_00000.npy   float32 [sum(T), J, 3]  keypoints crudos (x, y, v)
+    out/<split>/index.npy         [N] (shard, start, length)
+    out/<split>/labels.npy        float32 [N, L]  + has_labels.npy bool [N]
+    out/<split>/targets.npy       float32 [N, R]  + has_targets.npy bool [N]
+    out/<split>/pack.json         label_keys, target_keys, paths, shards
+
+Uso:
+    python pack_shards.py --data_dir "C:/ruta/a/ml_data" --output_dir "C:/ruta/a/ml_packed" --splits train val
+"""
+import argparse
+import json
+import os
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from datasets import POSE_NAMES, PoseSequenceDataset, _load_json, _select_joints
+from keypoint_store import load_sequence, sequence_from_json
+
+INDEX_DTYPE = np.dtype([("shard", "<i4"), ("start", "<i8"), ("length", "<i8")])
+PACK_META = "pack.json"
+
+
+def _shard_name(i: int) -> str:
+    return f"shard_{i:05d}.npy"
+
+
+def _read_raw(ds: PoseSequenceDataset, idx: int) -> Tuple[np.ndarray, Dict[str, Any]]:
+    # keypoints sin normalizar en el orden de POSE_NAMES; la normalización se aplica al leer
+    if ds.fmt == "npy":
+        seq = load_sequence(ds.files[idx], mmap=True, meta=ds._metas[idx])
+        return _select_joints(seq.keypoints, ds._joint_maps[idx]), seq.meta
+    sample = _load_json(ds.files[idx])
+    seq = sequence_from_json(sample, POSE_NAMES)
+    return seq.keypoints, sample
+
+
+def _matrix(dicts: List[Any]) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    keys = sorted({k for d in dicts if d for k in d.keys()})
+    mat = np.zeros((len(dicts), len(keys)), dtype=np.float32)
+    present = np.zeros(len(dicts), dtype=bool)
+    for i, d in enumerate(dicts):
+        if d is None:
+            continue
+        present[i] = True
+        mat[i] = [float(d.get(k, 0.0)) for k in keys]
+    return keys, mat, present
+
+
+def pack_split(data_dir: str, split: str, output_dir: str, shard_size_mb: int = 512) -> Dict[str, Any]:
+    ds = PoseSequenceDataset(data_dir, split=split)
+    out_dir = os.path.join(output_dir, split)
+    os.makedirs(out_dir, exist_ok=True)
+
+    J = len(POSE_NAMES)
+    frame_bytes = J * 3 * 4
+    max_frames = max(1, shard_size_mb * 1024 * 1024 // frame_bytes)
+
+    # primera pasada: largos y metadatos, para preasignar cada shard
+    lengths, labels, targets = [], [], []
+    for i in range(len(ds)):
+        kps, meta = _read_raw(ds, i)
+        lengths.append(int(kps.shape[0]))
+        labels.append(meta.get("labels"))
+        targets.append(meta.get("targets"))
+
+    index = np.zeros(len(ds), dtype=INDEX_DTYPE)
+    shard_sizes: List[int] = [0]
+    for i, n in enumerate(lengths):
+        if shard_sizes[-1] > 0 and shard_sizes[-1] + n > max_frames:
+            shard_sizes.append(0)
+        index[i] = (len(shard_sizes) - 1, shard_sizes[-1], n)
+        shard_sizes[-1] += n
+
+    shards = [
+        np.lib.format.open_memmap(os.path.join(out_dir, _shard_name(s)), mode="w+", dtype=np.float32, shape=(n, J, 3))
+        for s, n in enumerate(shard_sizes)
+    ]
+    for i in range(len(ds)):
+        kps, _ = _read_raw(ds, i)
+        s, start, n = index[i]
+        shards[s][start:start + n] = kps
+    for shard in shards:
+        shard.flush()
+    del shards
+
+    label_keys, label_mat, has_labels = _matrix(labels)
+    target_keys, target_mat, has_targets = _matrix(targets)
+    np.save(os.path.join(out_dir, "index.npy"), index)
+    np.save(os.path.join(out_dir, "labels.npy"), label_mat)
+    np.save(os.path.join(out_dir, "has_labels.npy"), has_labels)
+    np.save(os.path.join(out_dir, "targets.npy"), target_mat)
+    np.save(os.path.join(out_dir, "has_targets.npy"), has_targets)
+
+    meta = {
+        "version": 1,
+        "names": POSE_NAMES,
+        "num_samples": len(ds),
+        "num_frames": int(sum(lengths)),
+        "shards": [_shard_name(s) for s in range(len(shard_sizes))],
+        "label_keys": label_keys,
+        "target_keys": target_keys,
+        "paths": list(ds.files),
+    }
+    with open(os.path.join(out_dir, PACK_META), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    return meta
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Empaquetar splits en shards contiguos (np.memmap)")
+    parser.add_argument("--data_dir", type=str, required=True)
+    parser.add_argument("--output_dir", type=str, required=True)
+    parser.add_argument("--splits", type=str, nargs="+", default=["train", "val"])
+    parser.add_argument("--shard_size_mb", type=int, default=512)
+    args = parser.parse_args()
+
+    for split in args.splits:
+        meta = pack_split(args.data_dir, split, args.output_dir, args.shard_size_mb)
+        print(f"OK {split}: {meta['num_samples']} muestras, {meta['num_frames']} frames, {len(meta['shards'])} shards")
+
+
+if __name__ == "__main__":
+    main()
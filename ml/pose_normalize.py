@@ -0,0 +1,40 @@
+"""
+Normalización de keypoints que comparten el entrenamiento (datasets.py) y el
+servicio (pose-service/predictor.py, vía ml_shared): solo numpy, sin torch.
+"""
+import numpy as np
+
+POSE_NAMES = [
+    "nose","left_eye_inner","left_eye","left_eye_outer","right_eye_inner","right_eye","right_eye_outer",
+    "left_ear","right_ear","mouth_left","mouth_right","left_shoulder","right_shoulder","left_elbow",
+    "right_elbow","left_wrist","right_wrist","left_pinky","right_pinky","left_index","right_index",
+    "left_thumb","right_thumb","left_hip","right_hip","left_knee","right_knee","left_ankle","right_ankle",
+    "left_heel","right_heel","left_foot_index","right_foot_index",
+]
+
+NAME_TO_IDX = {n: i for i, n in enumerate(POSE_NAMES)}
+
+LEFT_HIP = NAME_TO_IDX["left_hip"]
+RIGHT_HIP = NAME_TO_IDX["right_hip"]
+LEFT_SHOULDER = NAME_TO_IDX["left_shoulder"]
+RIGHT_SHOULDER = NAME_TO_IDX["right_shoulder"]
+
+
+def normalize_sequence_xy(seq_xy: np.ndarray) -> np.ndarray:
+    """
+    Normaliza XY por frame:
+    - centra en pelvis (promedio de left_hip y right_hip si existen)
+    - escala por distancia entre hombros (left_shoulder-right_shoulder) si existe; fallback: 1.0
+
+    seq_xy: [T, J, 2]
+    return: [T, J, 2] normalizado
+    """
+    out = seq_xy.copy()
+    xy = out[:, :, :2]
+
+    pelvis = 0.5 * (xy[:, LEFT_HIP] + xy[:, RIGHT_HIP])  # [T, 2]
+    d = np.linalg.norm(xy[:, LEFT_SHOULDER] - xy[:, RIGHT_SHOULDER], axis=-1)  # [T]
+    scale = np.maximum(np.where(d > 1e-6, d, np.float32(1.0)), np.float32(1e-3))
+
+    out[:, :, :2] = (xy - pelvis[:, None, :]) / scale[:, None, None]
+    return out
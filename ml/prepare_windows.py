@@ -1,7 +1,26 @@
+"""
+Recorta ventanas alrededor del release a partir del JSON de extract_keypoints.
+
+- Un archivo: --input_json/--output_json (--release_time_sec opcional; si falta se detecta)
+- Un directorio en paralelo: --input_dir/--output_dir (mismo árbol de subdirectorios),
+  salida en JSON o en formato columnar (--format npy) listo para PoseSequenceDataset.
+
+Detección automática del release: se toma la muñeca que más sube por encima de su
+hombro; entre los frames con la muñeca sobre el hombro se busca el de mayor velocidad
+vertical hacia arriba y desde ahí se avanza mientras siga subiendo: el release es el
+ápice de ese empuje. Alturas y velocidades se miden en anchos de hombros.
+"""
 import argparse
+import bisect
+import glob
 import json
 import os
-from typing import Any, Dict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from keypoint_store import META_SUFFIX, frames_to_keypoints, save_sequence, sequence_from_json, stem_of
 
 try:
     import orjson as fastjson
@@ -15,9 +34,19 @@ except Exception:
     def loads(b):
         return json.loads(b)
 
+# índices MediaPipe Pose
+_SHOULDERS = (11, 12)
+_WRISTS = (15, 16)
+_NUM_JOINTS = 33
 
-def crop_window(sample: Dict[str, Any], release_time_sec: float, pre_ms: int, post_ms: int) -> Dict[str, Any]:
-    fps = float(sample.get("fps", 30.0))
+
+def crop_window(
+    sample: Dict[str, Any],
+    release_time_sec: float,
+    pre_ms: int,
+    post_ms: int,
+    times: Optional[List[float]] = None,
+) -> Dict[str, Any]:
     frames = sample.get("frames", [])
     if not frames:
         return sample
@@ -25,9 +54,13 @@ def crop_window(sample: Dict[str, Any], release_time_sec: float, pre_ms: int, po
     start_t = release_time_sec - pre_ms / 1000.0
     end_t = release_time_sec + post_ms / 1000.0
 
-    cropped = [fr for fr in frames if start_t <= float(fr.get("time_sec", 0.0)) <= end_t]
+    # frames ordenados por tiempo: dos búsquedas binarias en vez de recorrer todo
+    if times is None:
+        times = [float(fr.get("time_sec", 0.0)) for fr in frames]
+    lo = bisect.bisect_left(times, start_t)
+    hi = bisect.bisect_right(times, end_t)
     out = dict(sample)
-    out["frames"] = cropped
+    out["frames"] = frames[lo:hi]
     out["window"] = {
         "release_time_sec": release_time_sec,
         "pre_ms": pre_ms,
@@ -36,28 +69,177 @@ def crop_window(sample: Dict[str, Any], release_time_sec: float, pre_ms: int, po
     return out
 
 
+def _smooth(x: np.ndarray, k: int = 3) -> np.ndarray:
+    if len(x) < k:
+        return x
+    pad = k // 2
+    return np.convolve(np.pad(x, pad, mode="edge"), np.ones(k) / k, mode="valid")
+
+
+def detect_release(
+    sample: Dict[str, Any],
+    min_visibility: float = 0.5,
+    min_rise: float = 0.0,
+) -> Optional[float]:
+    """
+    Devuelve el tiempo (s) estimado del release, o None si ninguna muñeca pasa por
+    encima del hombro con visibilidad suficiente. `min_rise`: altura mínima de la
+    muñeca sobre el hombro, en anchos de hombros.
+    """
+    frames = sample.get("frames", [])
+    if len(frames) < 3:
+        return None
+    names = next((
+        [kp["name"] for kp in fr["keypoints"]] for fr in frames if len(fr.get("keypoints", [])) >= _NUM_JOINTS
+    ), None)
+    if names is None:
+        return None
+    kps = frames_to_keypoints(frames, names[:_NUM_JOINTS])  # [T, 33, 3]
+    times = np.array([float(fr.get("time_sec", 0.0)) for fr in frames])
+
+    shoulder_w = np.linalg.norm(kps[:, _SHOULDERS[0], :2] - kps[:, _SHOULDERS[1], :2], axis=-1)
+    valid_w = shoulder_w[shoulder_w > 1e-6]
+    if len(valid_w) == 0:
+        return None
+    scale = float(np.median(valid_w))
+
+    best = None
+    for shoulder, wrist in zip(_SHOULDERS, _WRISTS):
+        visible = (kps[:, wrist, 2] >= min_visibility) & (kps[:, shoulder, 2] >= min_visibility)
+        # y de imagen crece hacia abajo: altura positiva = muñeca sobre el hombro
+        height = _smooth((kps[:, shoulder, 1] - kps[:, wrist, 1]) / scale)
+        up_velocity = -np.gradient(_smooth(kps[:, wrist, 1] / scale), times) if np.ptp(times) > 0 else np.zeros(len(times))
+        candidates = np.flatnonzero(visible & (height > min_rise) & (up_velocity > 0))
+        if len(candidates) == 0:
+            continue
+        peak = int(candidates[np.argmax(up_velocity[candidates])])
+        apex = peak
+        while apex + 1 < len(frames) and up_velocity[apex + 1] > 0 and visible[apex + 1]:
+            apex += 1
+        score = float(height[apex])
+        if best is None or score > best[0]:
+            best = (score, apex)
+
+    return None if best is None else float(times[best[1]])
+
+
+def process_file(
+    input_path: str,
+    output_path: str,
+    pre_ms: int,
+    post_ms: int,
+    release_time_sec: Optional[float] = None,
+    fmt: str = "json",
+) -> Dict[str, Any]:
+    with open(input_path, "rb") as f:
+        sample = loads(f.read())
+    if not sample.get("frames"):
+        return {"input": input_path, "status": "skipped", "reason": "sin frames"}
+
+    auto = release_time_sec is None
+    if auto:
+        release_time_sec = detect_release(sample)
+        if release_time_sec is None:
+            return {"input": input_path, "status": "skipped", "reason": "release no detectado"}
+
+    out = crop_window(sample, release_time_sec, pre_ms, post_ms)
+    out["window"]["auto_release"] = auto
+    if not out["frames"]:
+        return {"input": input_path, "status": "skipped", "reason": "ventana vacía"}
+
+    out_dir = os.path.dirname(os.path.abspath(output_path))
+    os.makedirs(out_dir, exist_ok=True)
+    if fmt == "npy":
+        stem = stem_of(output_path)
+        save_sequence(stem, sequence_from_json(out))
+        output_path = stem + META_SUFFIX
+    else:
+        with open(output_path, "wb") as f:
+            f.write(dumps(out))
+    return {
+        "input": input_path,
+        "output": output_path,
+        "status": "ok",
+        "release_time_sec": release_time_sec,
+        "frames": len(out["frames"]),
+    }
+
+
+def _load_release_times(path: str) -> Dict[str, float]:
+    # JSON {"<ruta relativa o nombre de archivo>": segundos}
+    with open(path, "rb") as f:
+        return {k: float(v) for k, v in loads(f.read()).items()}
+
+
+def run_batch(
+    input_dir: str,
+    output_dir: str,
+    pattern: str,
+    pre_ms: int,
+    post_ms: int,
+    fmt: str = "json",
+    workers: int = 1,
+    release_times: Optional[Dict[str, float]] = None,
+) -> List[Dict[str, Any]]:
+    paths = glob.glob(os.path.join(input_dir, pattern), recursive=True)
+    paths = sorted(p for p in paths if not p.endswith(META_SUFFIX))
+    release_times = release_times or {}
+
+    jobs = []
+    for p in paths:
+        rel = os.path.relpath(os.path.abspath(p), os.path.abspath(input_dir))
+        release = release_times.get(rel, release_times.get(os.path.basename(p)))
+        jobs.append((p, os.path.join(output_dir, rel), pre_ms, post_ms, release, fmt))
+
+    results = []
+    with ProcessPoolExecutor(max_workers=max(1, workers)) as ex:
+        futs = {ex.submit(process_file, *job): job[0] for job in jobs}
+        for fut in as_completed(futs):
+            try:
+                res = fut.result()
+            except Exception as e:
+                res = {"input": futs[fut], "status": "error", "reason": str(e)}
+            results.append(res)
+            if res["status"] == "ok":
+                print(f"OK {res['output']} (release {res['release_time_sec']:.3f}s, {res['frames']} frames)")
+            else:
+                print(f"{res['status'].upper()} {res['input']}: {res['reason']}")
+    return results
+
+
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument("--input_json", type=str, required=True)
-    parser.add_argument("--output_json", type=str, required=True)
-    parser.add_argument("--release_time_sec", type=float, required=True)
+    parser.add_argument("--input_json", type=str, default="")
+    parser.add_argument("--output_json", type=str, default="")
+    parser.add_argument("--input_dir", type=str, default="")
+    parser.add_argument("--output_dir", type=str, default="")
+    parser.add_argument("--pattern", type=str, default="**/*.json")
+    parser.add_argument("--release_time_sec", type=float, default=None, help="si falta, se detecta automáticamente")
+    parser.add_argument("--release_times", type=str, default="", help="JSON {archivo: segundos} para forzar releases en lote")
     parser.add_argument("--pre_ms", type=int, default=500)
     parser.add_argument("--post_ms", type=int, default=200)
+    parser.add_argument("--format", type=str, default="json", choices=["json", "npy"])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
     args = parser.parse_args()
 
-    with open(args.input_json, "rb") as f:
-        sample = loads(f.read())
-
-    out = crop_window(sample, args.release_time_sec, args.pre_ms, args.post_ms)
-
-    out_dir = os.path.dirname(os.path.abspath(args.output_json))
-    if out_dir and not os.path.exists(out_dir):
-        os.makedirs(out_dir, exist_ok=True)
-
-    with open(args.output_json, "wb") as f:
-        f.write(dumps(out))
+    if args.input_dir:
+        if not args.output_dir:
+            parser.error("--output_dir es requerido con --input_dir")
+        release_times = _load_release_times(args.release_times) if args.release_times else None
+        results = run_batch(
+            args.input_dir, args.output_dir, args.pattern, args.pre_ms, args.post_ms,
+            args.format, args.workers, release_times,
+        )
+        ok = sum(r["status"] == "ok" for r in results)
+        print(f"Listo: {ok}/{len(results)} ventanas")
+        return
 
-    print(f"OK {args.output_json}")
+    if not args.input_json or not args.output_json:
+        parser.error("usar --input_json/--output_json o --input_dir/--output_dir")
+    res = process_file(args.input_json, args.output_json, args.pre_ms, args.post_ms, args.release_time_sec, args.format)
+    if res["status"] != "ok":
+        raise SystemExit(f"{res['status'].upper()} {args.input_json}: {res['reason']}")
+    print(f"OK {res['output']}")
 
 
 if __name__ == "__main__":
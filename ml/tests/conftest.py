@@ -0,0 +1,5 @@
+import os
+import sys
+
+# los módulos de ml/ se importan planos (como desde los scripts)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
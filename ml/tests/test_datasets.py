@@ -0,0 +1,53 @@
+import torch
+
+from datasets import LengthBucketBatchSampler, pad_collate
+
+
+def _lengths():
+    return [(i * 37) % 200 + 8 for i in range(120)]
+
+
+def test_bucket_sampler_changes_order_between_epochs():
+    sampler = LengthBucketBatchSampler(_lengths(), batch_size=8, boundaries=[32, 64, 128])
+    first, second = list(sampler), list(sampler)
+    assert first != second
+    assert sorted(i for b in first for i in b) == sorted(i for b in second for i in b) == list(range(120))
+
+
+def test_bucket_sampler_set_epoch_reproduces_order():
+    sampler = LengthBucketBatchSampler(_lengths(), batch_size=8)
+    sampler.set_epoch(3)
+    a = list(sampler)
+    sampler.set_epoch(3)
+    assert list(sampler) == a
+    assert len(sampler) == len(a)
+
+
+def test_bucket_sampler_without_shuffle_is_stable():
+    sampler = LengthBucketBatchSampler(_lengths(), batch_size=8, shuffle=False)
+    assert list(sampler) == list(sampler)
+
+
+def test_pad_collate_masks_real_frames():
+    samples = [
+        {"x": torch.ones(3, 33, 3), "y_cls": torch.tensor([1.0]), "y_reg": torch.tensor([0.5])},
+        {"x": torch.full((5, 33, 3), 2.0), "y_cls": torch.tensor([0.0]), "y_reg": torch.tensor([0.1])},
+    ]
+    batch = pad_collate(samples)
+    assert batch["x"].shape == (2, 5, 33, 3)
+    assert batch["lengths"].tolist() == [3, 5]
+    assert batch["mask"].tolist() == [[True] * 3 + [False] * 2, [True] * 5]
+    assert torch.all(batch["x"][0, 3:] == 0)  # padding en cero
+    assert torch.equal(batch["x"][0, :3], samples[0]["x"])
+    assert torch.equal(batch["x"][1], samples[1]["x"])
+    assert batch["y_cls"].shape == (2, 1) and batch["y_reg"].shape == (2, 1)
+
+
+def test_pad_collate_pads_to_boundary_and_drops_missing_targets():
+    samples = [{"x": torch.ones(10, 33, 3)}, {"x": torch.ones(20, 33, 3), "y_cls": torch.tensor([1.0])}]
+    batch = pad_collate(samples, boundaries=[16, 32, 64])
+    assert batch["x"].shape[1] == 32
+    assert batch["mask"].sum(dim=1).tolist() == [10, 20]
+    assert batch["y_cls"] is None and batch["y_reg"] is None
+    # más largo que el último límite: hasta el T máximo del batch
+    assert pad_collate([{"x": torch.ones(70, 33, 3)}], boundaries=[16, 32, 64])["x"].shape[1] == 70
@@ -0,0 +1,39 @@
+import numpy as np
+
+from keypoint_store import frames_to_keypoints, load_sequence, save_sequence, sequence_from_json, sequence_to_json
+
+NAMES = ["nose", "left_hip", "right_hip"]
+
+
+def _sample():
+    frames = []
+    for t in range(4):
+        frames.append({
+            "index": 2 * t,
+            "time_sec": 2 * t / 30.0,
+            "keypoints": [{"name": n, "x": 0.1 * j + t, "y": 0.5, "v": 0.9} for j, n in enumerate(NAMES)],
+        })
+    return {"fps": 30.0, "width": 640, "height": 360, "labels": {"release": 1}, "frames": frames}
+
+
+def test_roundtrip_json_npy(tmp_path):
+    sample = _sample()
+    stem = str(tmp_path / "out" / "clip")
+    save_sequence(stem, sequence_from_json(sample))
+
+    seq = load_sequence(stem)
+    assert isinstance(seq.keypoints, np.memmap)
+    assert seq.keypoints.shape == (4, 3, 3)
+    assert seq.index.tolist() == [0, 2, 4, 6]
+    assert seq.names == NAMES and seq.meta["labels"] == {"release": 1}
+
+    back = sequence_to_json(seq)
+    assert back["labels"] == sample["labels"]
+    np.testing.assert_allclose(frames_to_keypoints(back["frames"], NAMES), frames_to_keypoints(sample["frames"], NAMES))
+
+
+def test_frames_to_keypoints_accepts_score_and_unknown_names():
+    frames = [{"keypoints": [{"name": "left_hip", "x": 0.3, "y": 0.4, "score": 0.8}, {"name": "tail", "x": 1, "y": 1}]}]
+    kps = frames_to_keypoints(frames, NAMES)
+    np.testing.assert_allclose(kps[0, 1], [0.3, 0.4, 0.8])
+    assert not kps[0, [0, 2]].any()
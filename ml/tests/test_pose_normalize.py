@@ -0,0 +1,22 @@
+import numpy as np
+
+from pose_normalize import LEFT_HIP, LEFT_SHOULDER, RIGHT_HIP, RIGHT_SHOULDER, normalize_sequence_xy
+
+
+def test_normalize_centers_pelvis_and_scales_by_shoulders():
+    rng = np.random.default_rng(0)
+    kps = rng.random((5, 33, 3)).astype(np.float32)
+    out = normalize_sequence_xy(kps)
+
+    pelvis = 0.5 * (out[:, LEFT_HIP, :2] + out[:, RIGHT_HIP, :2])
+    np.testing.assert_allclose(pelvis, 0.0, atol=1e-5)
+    np.testing.assert_allclose(np.linalg.norm(out[:, LEFT_SHOULDER, :2] - out[:, RIGHT_SHOULDER, :2], axis=-1), 1.0, rtol=1e-5)
+    np.testing.assert_array_equal(out[:, :, 2], kps[:, :, 2])  # score intacto
+    assert out.dtype == np.float32
+
+
+def test_normalize_without_shoulder_width_only_centers():
+    kps = np.full((1, 33, 2), 0.5, dtype=np.float32)
+    kps[0, 0] = (0.7, 0.2)
+    out = normalize_sequence_xy(kps)
+    np.testing.assert_allclose(out[0, 0], (0.2, -0.3), atol=1e-6)
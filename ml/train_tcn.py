@@ -1,4 +1,5 @@
 import argparse
+from functools import partial
 from typing import Any, Dict, Optional
 
 import torch
@@ -6,7 +7,7 @@ import torch.nn as nn
 import pytorch_lightning as pl
 from torch.utils.data import DataLoader
 
-from datasets import PoseSequenceDataset
+from datasets import LengthBucketBatchSampler, PoseSequenceDataset, pad_collate
 from models.tcn import TCNMultiHead
 
 
@@ -18,12 +19,12 @@ class LitModel(pl.LightningModule):
         self.loss_cls = nn.BCEWithLogitsLoss() if num_labels > 0 else None
         self.loss_reg = nn.SmoothL1Loss() if num_targets > 0 else None
 
-    def forward(self, x: torch.Tensor):
-        return self.model(x)
+    def forward(self, x: torch.Tensor, mask: Optional[torch.Tensor] = None):
+        return self.model(x, mask)
 
     def common_step(self, batch: Dict[str, Any], stage: str):
         x = batch["x"].float()  # [B, T, J, 3]
-        logits, preds = self(x)
+        logits, preds = self(x, batch.get("mask"))
         loss = torch.tensor(0.0, device=self.device)
         logs = {}
 
@@ -53,31 +54,6 @@ class LitModel(pl.LightningModule):
         return torch.optim.Adam(self.parameters(), lr=self.hparams.lr)
 
 
-def collate(samples):
-    # simple collate: pad/crop to min length in batch
-    T_min = min(s["x"].shape[0] for s in samples)
-    xs = []
-    y_clss = []
-    y_regs = []
-    for s in samples:
-        x = s["x"][:T_min]
-        xs.append(x.unsqueeze(0))
-        y_clss.append(s.get("y_cls"))
-        y_regs.append(s.get("y_reg"))
-
-    x_batch = torch.cat(xs, dim=0)
-
-    y_cls_batch = None
-    if all(y is not None for y in y_clss):
-        y_cls_batch = torch.stack(y_clss, dim=0)
-
-    y_reg_batch = None
-    if all(y is not None for y in y_regs):
-        y_reg_batch = torch.stack(y_regs, dim=0)
-
-    return {"x": x_batch, "y_cls": y_cls_batch, "y_reg": y_reg_batch}
-
-
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--data_dir", type=str, required=True)
@@ -86,13 +62,26 @@ def main():
     parser.add_argument("--num_labels", type=int, default=4)
     parser.add_argument("--num_targets", type=int, default=2)
     parser.add_argument("--lr", type=float, default=1e-3)
+    parser.add_argument("--bucket_boundaries", type=int, nargs="*", default=None,
+                        help="límites de largo (p. ej. 32 64 128 256); sin valores agrupa por largo ordenando")
+    parser.add_argument("--no_bucketing", action="store_true", help="batches mezclados sin agrupar por largo")
+    parser.add_argument("--num_workers", type=int, default=0)
     args = parser.parse_args()
 
     train_ds = PoseSequenceDataset(args.data_dir, split="train")
     val_ds = PoseSequenceDataset(args.data_dir, split="val")
 
-    train_loader = DataLoader(train_ds, batch_size=args.batch_size, shuffle=True, collate_fn=collate)
-    val_loader = DataLoader(val_ds, batch_size=args.batch_size, shuffle=False, collate_fn=collate)
+    # padding hasta el máximo del batch (o al límite del bucket) + mask; nada se recorta
+    collate = partial(pad_collate, boundaries=args.bucket_boundaries)
+    if args.no_bucketing:
+        train_loader = DataLoader(train_ds, batch_size=args.batch_size, shuffle=True, collate_fn=collate,
+                                  num_workers=args.num_workers)
+    else:
+        train_sampler = LengthBucketBatchSampler(train_ds.lengths(), args.batch_size, args.bucket_boundaries)
+        train_loader = DataLoader(train_ds, batch_sampler=train_sampler, collate_fn=collate,
+                                  num_workers=args.num_workers)
+    val_sampler = LengthBucketBatchSampler(val_ds.lengths(), args.batch_size, args.bucket_boundaries, shuffle=False)
+    val_loader = DataLoader(val_ds, batch_sampler=val_sampler, collate_fn=collate, num_workers=args.num_workers)
 
     model = LitModel(num_labels=args.num_labels, num_targets=args.num_targets, lr=args.lr)
 
@@ -0,0 +1,310 @@
+"""
+Lectura de video con backend intercambiable. La usa también pose-service (ver
+pose-service/ml_shared.py).
+
+- "pyav": ffmpeg vía PyAV. Decodificación multi-thread (frame y slice), escalado
+  en el propio decoder (swscale, en la misma pasada que la conversión a BGR),
+  rotación del display matrix (videos de celular) y tiempo de cada frame a partir
+  de su PTS, así que sirve para videos de frame rate variable.
+- "opencv": cv2.VideoCapture (fallback, siempre disponible). Un solo thread a
+  resolución completa; fps y cantidad de frames salen del header y el tiempo de
+  cada frame se estima como index / fps.
+- "auto": pyav si está instalado, si no opencv.
+
+En ambos el índice de un frame es su posición en orden de decodificación. Tras
+un seek el backend pyav lo estima como round(t * fps) (exacto con fps constante).
+"""
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Iterable, Iterator, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+try:
+    import av
+except ImportError:
+    av = None
+
+BACKENDS = ("auto", "pyav", "opencv")
+
+_ROTATE_CODES = {
+    90: cv2.ROTATE_90_COUNTERCLOCKWISE,
+    180: cv2.ROTATE_180,
+    270: cv2.ROTATE_90_CLOCKWISE,
+}
+
+
+class VideoOpenError(Exception):
+    pass
+
+
+@dataclass
+class VideoInfo:
+    width: int  # tamaño del frame completo (ya rotado), antes del escalado
+    height: int
+    fps: float
+    frame_count: int  # 0 si el contenedor no lo informa
+    duration_sec: float  # 0 si no se conoce
+
+    def estimated_frames(self) -> int:
+        if self.frame_count > 0:
+            return self.frame_count
+        return int(round(self.duration_sec * self.fps))
+
+
+def resolve_backend(backend: str) -> str:
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown decoder backend: {backend} (expected one of {BACKENDS})")
+    if backend == "auto":
+        return "pyav" if av is not None else "opencv"
+    if backend == "pyav" and av is None:
+        raise RuntimeError("PyAV is required for the pyav decoder. Please run: pip install av")
+    return backend
+
+
+def _scaled_size(width: int, height: int, max_long_side: int) -> Optional[Tuple[int, int]]:
+    if max_long_side <= 0 or max(width, height) <= max_long_side:
+        return None
+    s = max_long_side / max(width, height)
+    return max(1, round(width * s)), max(1, round(height * s))
+
+
+class VideoDecoder(ABC):
+    """
+    Interfaz común. `frames` recorre índices crecientes y `frames_at` tiempos
+    crecientes; ambos devuelven (index, t_sec, frame BGR) con el lado largo
+    limitado a `max_long_side` (> 0). `frames_decoded` cuenta los frames leídos
+    del contenedor, incluidos los que se descartaron.
+    """
+
+    backend = ""
+    accurate_timestamps = False
+
+    def __init__(self, path: str, max_long_side: int = 0):
+        self.path = path
+        self.max_long_side = max(0, max_long_side)
+        self.frames_decoded = 0
+        self.info = VideoInfo(0, 0, 30.0, 0, 0.0)
+
+    @abstractmethod
+    def seek(self, frame_index: int) -> int:
+        """Posiciona el decoder en `frame_index` (o antes); devuelve la posición real."""
+
+    @abstractmethod
+    def frames(self, indices: Iterable[int], seek_gap: int = 0) -> Iterator[Tuple[int, float, np.ndarray]]:
+        """Los frames de `indices` (crecientes); con `seek_gap` > 0 los saltos mayores se hacen con seek."""
+
+    @abstractmethod
+    def frames_at(self, times: Sequence[float], seek_gap: int = 0) -> Iterator[Tuple[int, float, np.ndarray]]:
+        """Para cada tiempo, el primer frame que empieza en él (o medio frame antes); cada frame a lo sumo una vez."""
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self) -> "VideoDecoder":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class OpenCVDecoder(VideoDecoder):
+    backend = "opencv"
+
+    def __init__(self, path: str, max_long_side: int = 0):
+        super().__init__(path, max_long_side)
+        self._cap = cv2.VideoCapture(path)
+        if not self._cap.isOpened():
+            raise VideoOpenError(f"Could not open video: {path}")
+        fps = self._cap.get(cv2.CAP_PROP_FPS) or 30.0
+        count = int(self._cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+        self.info = VideoInfo(
+            width=int(self._cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            height=int(self._cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            fps=float(fps),
+            frame_count=max(0, count),
+            duration_sec=max(0, count) / fps,
+        )
+        self._size = _scaled_size(self.info.width, self.info.height, self.max_long_side)
+        self._pos = 0
+
+    def seek(self, frame_index: int) -> int:
+        if frame_index <= 0:
+            return self._pos
+        self._cap.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
+        pos = int(self._cap.get(cv2.CAP_PROP_POS_FRAMES))
+        if pos != frame_index:
+            # seek no soportado o impreciso: volver al inicio y avanzar con grab()
+            self._cap.release()
+            self._cap = cv2.VideoCapture(self.path)
+            pos = 0
+        self._pos = pos
+        return pos
+
+    def frames(self, indices: Iterable[int], seek_gap: int = 0) -> Iterator[Tuple[int, float, np.ndarray]]:
+        # los frames intermedios se avanzan con grab() sin retrieve(): sin conversión ni copia
+        for idx in indices:
+            if seek_gap > 0 and idx - self._pos > seek_gap:
+                if self._cap.set(cv2.CAP_PROP_POS_FRAMES, idx):
+                    self._pos = idx
+            while self._pos < idx:
+                if not self._cap.grab():
+                    return
+                self._pos += 1
+                self.frames_decoded += 1
+            if not self._cap.grab():
+                return
+            ret, frame = self._cap.retrieve()
+            self._pos += 1
+            self.frames_decoded += 1
+            if not ret:
+                return
+            if self._size is not None:
+                frame = cv2.resize(frame, self._size, interpolation=cv2.INTER_LINEAR)
+            yield idx, idx / self.info.fps, frame
+
+    def frames_at(self, times: Sequence[float], seek_gap: int = 0) -> Iterator[Tuple[int, float, np.ndarray]]:
+        indices = sorted({int(round(t * self.info.fps)) for t in times})
+        return self.frames(indices, seek_gap)
+
+    def close(self) -> None:
+        self._cap.release()
+
+
+class PyAVDecoder(VideoDecoder):
+    backend = "pyav"
+    accurate_timestamps = True
+
+    def __init__(self, path: str, max_long_side: int = 0, threads: int = 0):
+        super().__init__(path, max_long_side)
+        try:
+            self._container = av.open(path)
+            self._stream = self._container.streams.video[0]
+        except (av.FFmpegError, OSError, IndexError) as e:
+            raise VideoOpenError(f"Could not open video: {path}") from e
+        self._stream.thread_type = "AUTO"
+        self._stream.codec_context.thread_count = max(0, threads)  # 0: ffmpeg elige según CPUs
+        self._time_base = float(self._stream.time_base)
+        self._start_pts = self._stream.start_time or 0
+        fps = float(self._stream.average_rate or self._stream.guessed_rate or 30.0)
+        if self._stream.duration:
+            duration = float(self._stream.duration * self._stream.time_base)
+        elif self._container.duration:
+            duration = self._container.duration / av.time_base
+        else:
+            duration = 0.0
+        self.info = VideoInfo(
+            width=self._stream.codec_context.width,
+            height=self._stream.codec_context.height,
+            fps=fps,
+            frame_count=self._stream.frames or 0,
+            duration_sec=duration,
+        )
+
+        self._it = self._decode()
+        self._peek = None
+        self._pos = 0
+        first = self._next()
+        if first is None:
+            self.close()
+            raise VideoOpenError(f"Could not open video: {path}")
+        self._peek = first
+        # tamaño y rotación del primer frame: el header no siempre coincide con lo decodificado
+        self._rotate = _ROTATE_CODES.get(int(first[0].rotation) % 360)
+        w, h = first[0].width, first[0].height
+        self._size = _scaled_size(w, h, self.max_long_side)
+        if self._rotate in (cv2.ROTATE_90_CLOCKWISE, cv2.ROTATE_90_COUNTERCLOCKWISE):
+            w, h = h, w
+        self.info.width, self.info.height = w, h
+
+    def _decode(self):
+        for packet in self._container.demux(self._stream):
+            try:
+                decoded = packet.decode()
+            except av.InvalidDataError:
+                # paquete corrupto (o no descargado, ver range_fetch en pose-service): se saltea
+                continue
+            for frame in decoded:
+                self.frames_decoded += 1
+                if frame.pts is None:
+                    t = self._pos / self.info.fps
+                else:
+                    t = (frame.pts - self._start_pts) * self._time_base
+                yield frame, t
+
+    def _next(self):
+        if self._peek is not None:
+            item, self._peek = self._peek, None
+            return item
+        return next(self._it, None)
+
+    def _to_bgr(self, frame) -> np.ndarray:
+        if self._size is None:
+            img = frame.to_ndarray(format="bgr24")
+        else:
+            img = frame.to_ndarray(format="bgr24", width=self._size[0], height=self._size[1], interpolation="BILINEAR")
+        if self._rotate is not None:
+            img = cv2.rotate(img, self._rotate)
+        return img
+
+    def seek(self, frame_index: int) -> int:
+        if frame_index <= self._pos:
+            return self._pos
+        fps = self.info.fps
+        target = self._start_pts + int(frame_index / fps / self._time_base)
+        self._container.seek(target, stream=self._stream, backward=True)
+        self._it = self._decode()
+        self._peek = None
+        # el seek cae en el keyframe anterior: decodificar (sin convertir) hasta el frame pedido
+        while True:
+            item = next(self._it, None)
+            if item is None:
+                self._pos = frame_index
+                return frame_index
+            pos = int(round(item[1] * fps))
+            if pos >= frame_index:
+                self._peek = item
+                self._pos = pos
+                return pos
+
+    def frames(self, indices: Iterable[int], seek_gap: int = 0) -> Iterator[Tuple[int, float, np.ndarray]]:
+        for idx in indices:
+            if seek_gap > 0 and idx - self._pos > seek_gap:
+                self.seek(idx)
+            if self._pos > idx:
+                continue
+            while self._pos < idx:
+                if self._next() is None:
+                    return
+                self._pos += 1
+            item = self._next()
+            if item is None:
+                return
+            self._pos += 1
+            yield idx, item[1], self._to_bgr(item[0])
+
+    def frames_at(self, times: Sequence[float], seek_gap: int = 0) -> Iterator[Tuple[int, float, np.ndarray]]:
+        half = 0.5 / self.info.fps
+        for target in times:
+            if seek_gap > 0 and target * self.info.fps - self._pos > seek_gap:
+                self.seek(int(target * self.info.fps))
+            while True:
+                item = self._next()
+                if item is None:
+                    return
+                self._pos += 1
+                if item[1] >= target - half:
+                    break
+            yield self._pos - 1, item[1], self._to_bgr(item[0])
+
+    def close(self) -> None:
+        self._container.close()
+
+
+def open_video(path: str, backend: str = "auto", max_long_side: int = 0, threads: int = 0) -> VideoDecoder:
+    """Abre `path` con el backend pedido ("auto", "pyav" u "opencv"); lanza VideoOpenError si no se puede."""
+    if resolve_backend(backend) == "pyav":
+        return PyAVDecoder(path, max_long_side, threads)
+    return OpenCVDecoder(path, max_long_side)
+
@@ -0,0 +1,395 @@
+"""
+Cola persistente de jobs de /pose/jobs en SQLite y pool de workers asíncronos.
+
+Cada job guarda el request, la prioridad, los intentos y el resultado (bytes,
+los arma quien procesa) o el error. Un job en ejecución tiene un lease: si el
+proceso muere sin terminarlo, al vencer el lease otro worker lo vuelve a tomar
+y cuenta como un intento más. Varios procesos pueden compartir el archivo.
+
+Los callbacks se entregan al menos una vez: si el proceso se reinicia antes de
+confirmar la entrega, se reintentan al arrancar.
+"""
+import asyncio
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import suppress
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional
+
+import orjson
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+log = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    priority INTEGER NOT NULL,
+    request BLOB NOT NULL,
+    callback_url TEXT,
+    callback_status TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    run_at REAL NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    result BLOB,
+    error TEXT,
+    error_status INTEGER
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (priority DESC, created_at) WHERE status IN ('queued', 'running');
+CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (updated_at) WHERE status IN ('done', 'failed');
+"""
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class JobFailed(Exception):
+    """Error de un job con el status HTTP que tendría el request sincrónico; `retryable` lo vuelve a encolar."""
+
+    def __init__(self, status: int, message: str, retryable: bool = False):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.retryable = retryable
+
+
+@dataclass
+class Job:
+    id: str
+    status: str
+    priority: int
+    request: dict
+    callback_url: Optional[str]
+    callback_status: Optional[str]  # pending | sent | failed (None sin callback)
+    attempts: int
+    max_attempts: int
+    run_at: float  # queued: no antes de; running: vencimiento del lease
+    created_at: float
+    updated_at: float
+    result: Optional[bytes] = None
+    error: Optional[str] = None
+    error_status: Optional[int] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (DONE, FAILED)
+
+
+def _row_to_job(row: sqlite3.Row) -> Job:
+    data = dict(row)
+    data["request"] = orjson.loads(data["request"])
+    return Job(**data)
+
+
+class JobStore:
+    """
+    Acceso a la tabla de jobs. Los métodos son sincrónicos (llamarlos con
+    asyncio.to_thread); cada cambio de estado es una transacción.
+    """
+
+    def __init__(self, path: str, max_depth: int):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.max_depth = max(1, max_depth)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30.0, isolation_level=None, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def _write(self, fn):
+        # BEGIN IMMEDIATE: toma el lock de escritura antes de leer (claim entre procesos)
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                out = fn(self._db)
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+            return out
+
+    def enqueue(self, request: dict, priority: int = 0, callback_url: Optional[str] = None, max_attempts: int = 3) -> Job:
+        now = time.time()
+        job = Job(
+            id=uuid.uuid4().hex,
+            status=QUEUED,
+            priority=priority,
+            request=request,
+            callback_url=callback_url,
+            callback_status="pending" if callback_url else None,
+            attempts=0,
+            max_attempts=max(1, max_attempts),
+            run_at=now,
+            created_at=now,
+            updated_at=now,
+        )
+
+        def insert(db: sqlite3.Connection) -> None:
+            (depth,) = db.execute("SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')").fetchone()
+            if depth >= self.max_depth:
+                raise JobQueueFull(f"Job queue is full ({depth} jobs)")
+            db.execute(
+                "INSERT INTO jobs (id, status, priority, request, callback_url, callback_status, attempts, max_attempts,"
+                " run_at, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    job.id, job.status, job.priority, orjson.dumps(request), job.callback_url, job.callback_status,
+                    job.attempts, job.max_attempts, job.run_at, job.created_at, job.updated_at,
+                ),
+            )
+
+        self._write(insert)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            row = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _row_to_job(row) if row is not None else None
+
+    def depth(self) -> int:
+        with self._lock:
+            (depth,) = self._db.execute("SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')").fetchone()
+        return depth
+
+    def claim(self, lease_sec: float) -> Optional[Job]:
+        """
+        Toma el job listo de mayor prioridad (el más viejo si empatan) y lo pasa a
+        running con un lease de `lease_sec`. Un running con lease vencido es de un
+        worker perdido: se retoma, o se devuelve ya fallado si no le quedan intentos.
+        """
+
+        def take(db: sqlite3.Connection) -> Optional[Job]:
+            now = time.time()
+            row = db.execute(
+                "SELECT * FROM jobs WHERE status IN ('queued', 'running') AND run_at <= ?"
+                " ORDER BY priority DESC, created_at LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is None:
+                return None
+            job = _row_to_job(row)
+            if job.status == RUNNING and job.attempts >= job.max_attempts:
+                error = "El worker que procesaba el job se detuvo."
+                db.execute(
+                    "UPDATE jobs SET status = ?, error = ?, error_status = 500, updated_at = ? WHERE id = ?",
+                    (FAILED, error, now, job.id),
+                )
+                job.status, job.error, job.error_status, job.updated_at = FAILED, error, 500, now
+                return job
+            job.status, job.attempts, job.run_at, job.updated_at = RUNNING, job.attempts + 1, now + lease_sec, now
+            db.execute(
+                "UPDATE jobs SET status = ?, attempts = ?, run_at = ?, updated_at = ? WHERE id = ?",
+                (job.status, job.attempts, job.run_at, job.updated_at, job.id),
+            )
+            return job
+
+        return self._write(take)
+
+    def complete(self, job_id: str, result: bytes) -> None:
+        self._write(
+            lambda db: db.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = NULL, error_status = NULL, updated_at = ? WHERE id = ?",
+                (DONE, result, time.time(), job_id),
+            )
+        )
+
+    def fail(self, job: Job, status: int, message: str, retry_delay_sec: Optional[float] = None) -> str:
+        """Vuelve a encolar el job tras `retry_delay_sec` si le quedan intentos (y no es None); devuelve el nuevo estado."""
+        now = time.time()
+        retry = retry_delay_sec is not None and job.attempts < job.max_attempts
+        new_status = QUEUED if retry else FAILED
+        run_at = now + retry_delay_sec if retry else job.run_at
+        self._write(
+            lambda db: db.execute(
+                "UPDATE jobs SET status = ?, run_at = ?, error = ?, error_status = ?, updated_at = ? WHERE id = ?",
+                (new_status, run_at, message, status, now, job.id),
+            )
+        )
+        return new_status
+
+    def release(self, job: Job) -> None:
+        # el worker se detuvo (shutdown) sin terminar: vuelve a la cola sin gastar el intento
+        self._write(
+            lambda db: db.execute(
+                "UPDATE jobs SET status = ?, attempts = MAX(0, attempts - 1), run_at = ?, updated_at = ?"
+                " WHERE id = ? AND status = ?",
+                (QUEUED, time.time(), time.time(), job.id, RUNNING),
+            )
+        )
+
+    def set_callback_status(self, job_id: str, callback_status: str) -> None:
+        self._write(lambda db: db.execute("UPDATE jobs SET callback_status = ? WHERE id = ?", (callback_status, job_id)))
+
+    def pending_callbacks(self) -> list[Job]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT * FROM jobs WHERE status IN ('done', 'failed') AND callback_status = 'pending'"
+            ).fetchall()
+        return [_row_to_job(r) for r in rows]
+
+    def purge(self, ttl_sec: float) -> int:
+        """Borra los jobs terminados hace más de `ttl_sec`; devuelve cuántos."""
+        cutoff = time.time() - ttl_sec
+        cur = self._write(
+            lambda db: db.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?", (cutoff,))
+        )
+        return cur.rowcount
+
+
+class JobWorkers:
+    """
+    `concurrency` workers que toman jobs de `store` y los corren con `handler`
+    (devuelve el resultado en bytes o lanza JobFailed). Los errores reintentables
+    se reencolan con backoff exponencial. Al terminar un job con callback se llama
+    a `notify` (lanza si la entrega falló) hasta `callback_attempts` veces.
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        handler: Callable[[Job], Awaitable[bytes]],
+        notify: Optional[Callable[[Job], Awaitable[None]]] = None,
+        concurrency: int = 1,
+        lease_sec: float = 900.0,
+        retry_base_sec: float = 5.0,
+        retry_max_sec: float = 300.0,
+        callback_attempts: int = 3,
+        poll_sec: float = 1.0,
+        ttl_sec: float = 86400.0,
+        on_event: Optional[Callable[[str], None]] = None,
+    ):
+        self.store = store
+        self.handler = handler
+        self.notify = notify
+        self.concurrency = max(1, concurrency)
+        self.lease_sec = lease_sec
+        self.retry_base_sec = retry_base_sec
+        self.retry_max_sec = retry_max_sec
+        self.callback_attempts = max(1, callback_attempts)
+        self.poll_sec = poll_sec
+        self.ttl_sec = ttl_sec
+        self.on_event = on_event or (lambda _: None)
+        self._wake: Optional[asyncio.Event] = None
+        self._tasks: list[asyncio.Task] = []
+        self._callbacks: set[asyncio.Task] = set()
+        self._last_purge = 0.0
+
+    def start(self) -> None:
+        self._wake = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._worker_loop()) for _ in range(self.concurrency)]
+        for job in self.store.pending_callbacks():
+            self._schedule_callback(job)
+
+    async def close(self) -> None:
+        tasks = self._tasks + list(self._callbacks)
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            with suppress(asyncio.CancelledError):
+                await task
+
+    def wake(self) -> None:
+        if self._wake is not None:
+            self._wake.set()
+
+    def retry_delay(self, attempts: int) -> float:
+        # backoff exponencial con jitter para no reintentar en tanda
+        delay = min(self.retry_max_sec, self.retry_base_sec * 2 ** max(0, attempts - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    async def _worker_loop(self) -> None:
+        while True:
+            try:
+                await self._step()
+            except Exception:
+                # p. ej. "database is locked": el worker sigue; un job ya tomado se retoma al vencer su lease
+                log.exception("Job worker iteration failed")
+                await asyncio.sleep(max(1.0, self.poll_sec))
+
+    async def _step(self) -> None:
+        self._wake.clear()
+        job = await asyncio.to_thread(self.store.claim, self.lease_sec)
+        if job is None:
+            await self._maybe_purge()
+            with suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._wake.wait(), self.poll_sec)
+            return
+        if job.status == RUNNING:
+            await self._run(job)
+        else:
+            self.on_event(FAILED)
+            self._schedule_callback(job)
+
+    async def _run(self, job: Job) -> None:
+        try:
+            result = await self.handler(job)
+        except asyncio.CancelledError:
+            self.store.release(job)
+            raise
+        except Exception as e:
+            if not isinstance(e, JobFailed):
+                # el handler no debería dejar escapar otra cosa: se trata como error interno reintentable
+                log.exception("Job %s handler raised", job.id)
+                e = JobFailed(500, "Error interno procesando el video.", retryable=True)
+            delay = self.retry_delay(job.attempts) if e.retryable else None
+            status = await asyncio.to_thread(self.store.fail, job, e.status, e.message, delay)
+            self.on_event("retried" if status == QUEUED else FAILED)
+            if status == QUEUED:
+                return
+        else:
+            await asyncio.to_thread(self.store.complete, job.id, result)
+            self.on_event(DONE)
+        self._schedule_callback(job)
+
+    async def _maybe_purge(self) -> None:
+        if self.ttl_sec > 0 and time.monotonic() - self._last_purge > min(self.ttl_sec, 600.0):
+            self._last_purge = time.monotonic()
+            await asyncio.to_thread(self.store.purge, self.ttl_sec)
+
+    def _schedule_callback(self, job: Job) -> None:
+        if self.notify is None or not job.callback_url:
+            return
+        task = asyncio.get_running_loop().create_task(self._deliver(job.id))
+        self._callbacks.add(task)
+        task.add_done_callback(self._callbacks.discard)
+
+    async def _deliver(self, job_id: str) -> None:
+        try:
+            await self._deliver_once(job_id)
+        except Exception:
+            # queda "pending": se reintenta en el próximo arranque
+            log.exception("Callback delivery for job %s failed", job_id)
+
+    async def _deliver_once(self, job_id: str) -> None:
+        # se relee el job para mandar el estado final guardado
+        job = await asyncio.to_thread(self.store.get, job_id)
+        if job is None or job.callback_status != "pending":
+            return
+        for attempt in range(1, self.callback_attempts + 1):
+            try:
+                await self.notify(job)
+            except Exception:
+                if attempt < self.callback_attempts:
+                    await asyncio.sleep(self.retry_delay(attempt))
+                continue
+            await asyncio.to_thread(self.store.set_callback_status, job_id, "sent")
+            return
+        await asyncio.to_thread(self.store.set_callback_status, job_id, "failed")
+        self.on_event("callback_failed")
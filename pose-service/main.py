@@ -1,53 +1,122 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel, Field
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import suppress
+from typing import Optional
+from urllib.parse import urlsplit
+import asyncio
+import hashlib
+import hmac
+import logging
+import multiprocessing
 import tempfile
-import requests
-import cv2
-import mediapipe as mp
-import numpy as np
+import time
+import httpx
+import orjson
 import os
 
+import job_queue
+import metrics
+import pose_common
+import pose_format
+from pose_common import (
+    DEFAULT_POSE_SETTINGS,
+    POSE_LANDMARK_NAMES,
+    ExtractionCancelled,
+    PosePoolExhausted,
+    PoseSettings,
+    VideoUnreadable,
+)
+from job_queue import Job, JobFailed, JobQueueFull, JobStore, JobWorkers
+from pose_format import PoseResult
+from result_cache import AsyncSingleFlight, ResultCache, make_cache_key
 
-POSE_LANDMARK_NAMES = [
-    "nose",
-    "left_eye_inner",
-    "left_eye",
-    "left_eye_outer",
-    "right_eye_inner",
-    "right_eye",
-    "right_eye_outer",
-    "left_ear",
-    "right_ear",
-    "mouth_left",
-    "mouth_right",
-    "left_shoulder",
-    "right_shoulder",
-    "left_elbow",
-    "right_elbow",
-    "left_wrist",
-    "right_wrist",
-    "left_pinky",
-    "right_pinky",
-    "left_index",
-    "right_index",
-    "left_thumb",
-    "right_thumb",
-    "left_hip",
-    "right_hip",
-    "left_knee",
-    "right_knee",
-    "left_ankle",
-    "right_ankle",
-    "left_heel",
-    "right_heel",
-    "left_foot_index",
-    "right_foot_index",
-]
+log = logging.getLogger(__name__)
+
+# Pool de grafos MediaPipe: instancias por combinación de settings. Solo en modo "thread":
+# en "process" cada worker corre un trabajo a la vez con una instancia por settings
+# (el paralelismo es POSE_WORKERS y la saturación la marca POSE_QUEUE_MAX)
+POSE_POOL_SIZE = int(os.getenv("POSE_POOL_SIZE", "2"))
+POSE_POOL_WARMUP = os.getenv("POSE_POOL_WARMUP", "1") not in ("0", "false", "False")
+POSE_POOL_ACQUIRE_TIMEOUT_SEC = float(os.getenv("POSE_POOL_ACQUIRE_TIMEOUT_SEC", "5"))
+# Saltos mayores a esta cantidad de frames se hacen con seek en vez de grab(); 0 = desactivado
+POSE_SEEK_GAP_FRAMES = int(os.getenv("POSE_SEEK_GAP_FRAMES", "0"))
+# Preprocesado antes de MediaPipe (defaults; cada request puede pisarlos con maxLongSide/roi)
+POSE_MAX_LONG_SIDE = int(os.getenv("POSE_MAX_LONG_SIDE", "0"))
+POSE_ROI = os.getenv("POSE_ROI", "0") not in ("0", "false", "False")
+# Backend de lectura de video: "auto" (pyav si está instalado), "pyav" u "opencv"; threads de pyav por worker
+POSE_DECODER = pose_common.resolve_decoder(os.getenv("POSE_DECODER", "auto"))
+
+# Ejecución de MediaPipe fuera del event loop: "process" (default) o "thread"
+POSE_EXECUTOR = os.getenv("POSE_EXECUTOR", "process")
+POSE_WORKERS = int(os.getenv("POSE_WORKERS", str(os.cpu_count() or 1)))
+POSE_DECODER_THREADS = int(os.getenv("POSE_DECODER_THREADS", str(max(1, (os.cpu_count() or 1) // max(1, POSE_WORKERS)))))
+POSE_QUEUE_MAX = int(os.getenv("POSE_QUEUE_MAX", "8"))
+POSE_REQUEST_DEADLINE_SEC = float(os.getenv("POSE_REQUEST_DEADLINE_SEC", "110"))
+POSE_DISCONNECT_POLL_SEC = float(os.getenv("POSE_DISCONNECT_POLL_SEC", "0.5"))
+# /pose/batch: items por request y cuántos se procesan a la vez
+POSE_BATCH_MAX_ITEMS = int(os.getenv("POSE_BATCH_MAX_ITEMS", "50"))
+POSE_BATCH_CONCURRENCY = int(os.getenv("POSE_BATCH_CONCURRENCY", str(max(1, POSE_WORKERS))))
+
+# /pose/jobs: cola persistente (SQLite) para clips largos; el resultado se consulta o llega por callback
+POSE_JOB_DB = os.getenv("POSE_JOB_DB", os.path.join(tempfile.gettempdir(), "pose-jobs", "jobs.sqlite3"))
+POSE_JOB_WORKERS = int(os.getenv("POSE_JOB_WORKERS", str(max(1, POSE_WORKERS))))
+POSE_JOB_QUEUE_MAX = int(os.getenv("POSE_JOB_QUEUE_MAX", "1000"))
+POSE_JOB_MAX_ATTEMPTS = int(os.getenv("POSE_JOB_MAX_ATTEMPTS", "3"))
+POSE_JOB_RETRY_BASE_SEC = float(os.getenv("POSE_JOB_RETRY_BASE_SEC", "5"))
+POSE_JOB_DEADLINE_SEC = float(os.getenv("POSE_JOB_DEADLINE_SEC", "900"))
+POSE_JOB_POLL_SEC = float(os.getenv("POSE_JOB_POLL_SEC", "1"))
+POSE_JOB_TTL_SEC = float(os.getenv("POSE_JOB_TTL_SEC", str(24 * 3600)))
+POSE_JOB_CALLBACK_ATTEMPTS = int(os.getenv("POSE_JOB_CALLBACK_ATTEMPTS", "5"))
+POSE_JOB_CALLBACK_TIMEOUT_SEC = float(os.getenv("POSE_JOB_CALLBACK_TIMEOUT_SEC", "10"))
+# si está, los callbacks llevan X-Pose-Signature: sha256=<HMAC del body>
+POSE_JOB_CALLBACK_SECRET = os.getenv("POSE_JOB_CALLBACK_SECRET", "")
+
+# Descarga de videos: streaming por chunks con presupuesto máximo de bytes
+POSE_MAX_VIDEO_BYTES = int(os.getenv("POSE_MAX_VIDEO_BYTES", str(200 * 1024 * 1024)))
+POSE_DOWNLOAD_CHUNK_BYTES = int(os.getenv("POSE_DOWNLOAD_CHUNK_BYTES", str(1024 * 1024)))
+POSE_DOWNLOAD_CONNECT_TIMEOUT_SEC = float(os.getenv("POSE_DOWNLOAD_CONNECT_TIMEOUT_SEC", "5"))
+POSE_DOWNLOAD_READ_TIMEOUT_SEC = float(os.getenv("POSE_DOWNLOAD_READ_TIMEOUT_SEC", "30"))
+POSE_DOWNLOAD_DEADLINE_SEC = float(os.getenv("POSE_DOWNLOAD_DEADLINE_SEC", "120"))
+POSE_HTTP_POOL_SIZE = int(os.getenv("POSE_HTTP_POOL_SIZE", "16"))
+# application/mp4: MP4 servido con el tipo genérico de RFC 4337 (algunos buckets/CDNs); HLS/DASH no: son playlists, no un archivo de video
+ALLOWED_VIDEO_CONTENT_TYPES = ("video/", "application/mp4", "application/octet-stream", "binary/octet-stream")
+# Descarga parcial con HTTP Range (solo con decoder pyav): índice MP4 + GOPs de los frames muestreados;
+# si el servidor no soporta rangos o el plan supera POSE_RANGE_MAX_FRACTION del archivo se baja completo
+POSE_RANGE_FETCH = os.getenv("POSE_RANGE_FETCH", "1") not in ("0", "false", "False")
+POSE_RANGE_PROBE_BYTES = int(os.getenv("POSE_RANGE_PROBE_BYTES", str(256 * 1024)))
+POSE_RANGE_MARGIN_FRAMES = int(os.getenv("POSE_RANGE_MARGIN_FRAMES", "8"))
+POSE_RANGE_MERGE_GAP_BYTES = int(os.getenv("POSE_RANGE_MERGE_GAP_BYTES", str(64 * 1024)))
+POSE_RANGE_MAX_FRACTION = float(os.getenv("POSE_RANGE_MAX_FRACTION", "0.5"))
+POSE_RANGE_CONCURRENCY = int(os.getenv("POSE_RANGE_CONCURRENCY", "4"))
+
+# Cache de resultados de /pose (memoria LRU + disco)
+POSE_CACHE_ENABLED = os.getenv("POSE_CACHE_ENABLED", "1") not in ("0", "false", "False")
+POSE_CACHE_MEM_ITEMS = int(os.getenv("POSE_CACHE_MEM_ITEMS", "256"))
+POSE_CACHE_DIR = os.getenv("POSE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "pose-cache"))
+POSE_CACHE_DISK_MAX_BYTES = int(os.getenv("POSE_CACHE_DISK_MAX_BYTES", str(512 * 1024 * 1024)))
+
+# Header Server-Timing con los tiempos por etapa de cada /pose y /predict
+POSE_SERVER_TIMING = os.getenv("POSE_SERVER_TIMING", "0") not in ("0", "false", "False")
+
+# /predict: TCN exportado a ONNX (sin PREDICT_MODEL_PATH el endpoint responde 503)
+PREDICT_MODEL_PATH = os.getenv("PREDICT_MODEL_PATH", "")
+PREDICT_INTRA_OP_THREADS = int(os.getenv("PREDICT_INTRA_OP_THREADS", "2"))
+PREDICT_INTER_OP_THREADS = int(os.getenv("PREDICT_INTER_OP_THREADS", "1"))
+PREDICT_MAX_BATCH = int(os.getenv("PREDICT_MAX_BATCH", "16"))
+PREDICT_BATCH_WINDOW_MS = float(os.getenv("PREDICT_BATCH_WINDOW_MS", "5"))
+# nombres de las salidas en el orden del entrenamiento (claves ordenadas alfabéticamente), separados por coma
+PREDICT_LABELS = [n for n in os.getenv("PREDICT_LABELS", "").split(",") if n]
+PREDICT_TARGETS = [n for n in os.getenv("PREDICT_TARGETS", "").split(",") if n]
 
 
 class PoseRequest(BaseModel):
     videoUrl: str = Field(..., min_length=3)
     targetFrames: int = Field(8, ge=6, le=90)
+    # lado largo máximo de la imagen para MediaPipe (0 = resolución original) y recorte a la persona
+    maxLongSide: Optional[int] = Field(None, ge=0, le=4096)
+    roi: Optional[bool] = None
 
 
 class PoseResponse(BaseModel):
@@ -55,92 +124,770 @@ class PoseResponse(BaseModel):
     fps: float
 
 
+class PoseBatchRequest(BaseModel):
+    items: list[PoseRequest]
+
+
+class PoseJobRequest(PoseRequest):
+    # mayor prioridad se toma antes; en la misma prioridad, por orden de llegada
+    priority: int = Field(0, ge=0, le=9)
+    callbackUrl: Optional[str] = Field(None, min_length=3)
+
+
+class PredictRequest(BaseModel):
+    # keypoints [T, 33, 3] (x, y, score) como los devuelve /pose, o videoUrl para encadenar /pose
+    keypoints: Optional[list[list[list[float]]]] = None
+    videoUrl: Optional[str] = Field(None, min_length=3)
+    targetFrames: int = Field(8, ge=6, le=90)
+    maxLongSide: Optional[int] = Field(None, ge=0, le=4096)
+    roi: Optional[bool] = None
+    includePose: bool = False
+
+
+class PoseExecutor:
+    """
+    Corre extract_pose_frames en un pool de procesos (o threads) con cola acotada.
+    Cada trabajo ocupa un slot de `cancel_flags`; si el request se cancela (deadline
+    o desconexión del cliente) se marca el slot y el worker aborta en el próximo frame.
+    """
+
+    def __init__(self, mode: str, workers: int, queue_max: int):
+        self.mode = mode
+        self.workers = max(1, workers)
+        self.capacity = self.workers + max(0, queue_max)
+        self._free_slots = list(range(self.capacity))
+        self.warmed = False
+        warmup_settings = DEFAULT_POSE_SETTINGS if POSE_POOL_WARMUP else None
+
+        if mode == "process":
+            if "POSE_POOL_SIZE" in os.environ or "POSE_POOL_ACQUIRE_TIMEOUT_SEC" in os.environ:
+                log.warning("POSE_POOL_SIZE/POSE_POOL_ACQUIRE_TIMEOUT_SEC only apply to POSE_EXECUTOR=thread; use POSE_WORKERS")
+            # spawn: MediaPipe/OpenCV no son seguros tras fork
+            ctx = multiprocessing.get_context("spawn")
+            self._cancel_flags = ctx.Array("b", self.capacity, lock=False)
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=ctx,
+                initializer=pose_common.init_engine,
+                initargs=(1, POSE_POOL_ACQUIRE_TIMEOUT_SEC, warmup_settings, self._cancel_flags),
+            )
+        else:
+            import pose_engine  # cv2/PyAV/numpy: solo en modo "thread" se cargan en este proceso
+
+            self._cancel_flags = bytearray(self.capacity)
+            pose_engine.init_engine(
+                max(POSE_POOL_SIZE, self.workers), POSE_POOL_ACQUIRE_TIMEOUT_SEC, warmup_settings, self._cancel_flags
+            )
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="pose")
+
+    @property
+    def queue_depth(self) -> int:
+        return self.capacity - len(self._free_slots)
+
+    async def warmup(self) -> None:
+        # fuerza el arranque (y warmup del pool) de todos los workers; un worker que
+        # terminó antes puede tomar varias tareas, así que se repite hasta ver todos los pids
+        loop = asyncio.get_running_loop()
+        expected = self.workers if self.mode == "process" else 1
+        ready: set[int] = set()
+        while len(ready) < expected:
+            pids = await asyncio.gather(
+                *(loop.run_in_executor(self._executor, pose_common.worker_ready) for _ in range(expected - len(ready)))
+            )
+            if len(ready | set(pids)) < expected:
+                await asyncio.sleep(0.05)
+            ready.update(pids)
+        self.warmed = True
+
+    async def run(self, video_path: str, target_frames: int, settings: PoseSettings, seek_gap: Optional[int] = None) -> PoseResult:
+        if not self._free_slots:
+            raise HTTPException(
+                status_code=503,
+                detail="Servicio saturado: cola de análisis llena. Reintentar en unos segundos.",
+                headers={"Retry-After": "1"},
+            )
+        loop = asyncio.get_running_loop()
+        slot = self._free_slots.pop()
+        self._cancel_flags[slot] = 0
+        t0 = time.perf_counter()
+        cf: Future = self._executor.submit(
+            pose_common.extract_pose_frames,
+            video_path,
+            target_frames,
+            settings,
+            POSE_SEEK_GAP_FRAMES if seek_gap is None else seek_gap,
+            slot,
+            POSE_DECODER_THREADS,
+        )
+        # el slot se libera recién cuando el worker termina, no cuando se cancela el request
+        cf.add_done_callback(lambda _: loop.call_soon_threadsafe(self._free_slots.append, slot))
+        try:
+            result, stats = await asyncio.wrap_future(cf)
+            metrics.record_extraction(stats, time.perf_counter() - t0)
+            return result
+        except asyncio.CancelledError:
+            self._cancel_flags[slot] = 1
+            cf.cancel()
+            raise
+        except PosePoolExhausted:
+            raise HTTPException(
+                status_code=503,
+                detail="Servicio saturado: no hay modelos de pose disponibles. Reintentar en unos segundos.",
+                headers={"Retry-After": "1"},
+            )
+        except VideoUnreadable:
+            raise HTTPException(status_code=400, detail="No se pudo abrir el video.")
+        except ExtractionCancelled:
+            raise asyncio.CancelledError()
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if self.mode != "process":
+            import pose_engine
+
+            pose_engine.close_engine()
+
+
+result_cache = ResultCache(
+    POSE_CACHE_MEM_ITEMS,
+    POSE_CACHE_DIR,
+    POSE_CACHE_DISK_MAX_BYTES,
+    encode=pose_format.pack_pose_result,
+    decode=pose_format.unpack_pose_result,
+    suffix=".pose",
+)
+single_flight = AsyncSingleFlight()
+http_client: httpx.AsyncClient = None  # type: ignore[assignment]
+pose_executor: PoseExecutor = None  # type: ignore[assignment]
+job_store: JobStore = None  # type: ignore[assignment]
+job_workers: JobWorkers = None  # type: ignore[assignment]
+predictor = None  # TCNPredictor si hay modelo configurado
+
 app = FastAPI()
 
 
-def download_video_to_temp(video_url: str) -> str:
-    resp = requests.get(video_url, timeout=30)
-    if resp.status_code != 200:
+@app.on_event("startup")
+async def startup():
+    global http_client, pose_executor, predictor, job_store, job_workers
+    http_client = httpx.AsyncClient(
+        timeout=httpx.Timeout(POSE_DOWNLOAD_READ_TIMEOUT_SEC, connect=POSE_DOWNLOAD_CONNECT_TIMEOUT_SEC),
+        limits=httpx.Limits(max_connections=POSE_HTTP_POOL_SIZE, max_keepalive_connections=POSE_HTTP_POOL_SIZE),
+        follow_redirects=True,
+    )
+    pose_executor = PoseExecutor(POSE_EXECUTOR, POSE_WORKERS, POSE_QUEUE_MAX)
+    metrics.bind_queue_depth(lambda: pose_executor.queue_depth)
+    # los workers arrancan y precalientan en paralelo con el resto del startup;
+    # uvicorn recién acepta conexiones (y /health responde) cuando esto termina
+    warmup = asyncio.ensure_future(pose_executor.warmup()) if POSE_POOL_WARMUP else None
+    await asyncio.sleep(0)  # que la tarea llegue a hacer los submit antes del trabajo sincrónico que sigue
+    job_store = JobStore(POSE_JOB_DB, POSE_JOB_QUEUE_MAX)
+    metrics.bind_job_queue_depth(job_store.depth)
+    job_workers = JobWorkers(
+        job_store,
+        _run_job,
+        _notify_job,
+        concurrency=POSE_JOB_WORKERS,
+        # el lease cubre el deadline del job: mientras el worker vive nadie más lo toma
+        lease_sec=POSE_JOB_DEADLINE_SEC + 60,
+        retry_base_sec=POSE_JOB_RETRY_BASE_SEC,
+        callback_attempts=POSE_JOB_CALLBACK_ATTEMPTS,
+        poll_sec=POSE_JOB_POLL_SEC,
+        ttl_sec=POSE_JOB_TTL_SEC,
+        on_event=lambda event: metrics.JOBS.labels(event).inc(),
+    )
+    if PREDICT_MODEL_PATH:
+        # onnxruntime solo se importa si hay modelo
+        from predictor import TCNPredictor
+
+        predictor = TCNPredictor(
+            PREDICT_MODEL_PATH,
+            intra_op_threads=PREDICT_INTRA_OP_THREADS,
+            inter_op_threads=PREDICT_INTER_OP_THREADS,
+            max_batch=PREDICT_MAX_BATCH,
+            window_ms=PREDICT_BATCH_WINDOW_MS,
+            label_names=PREDICT_LABELS,
+            target_names=PREDICT_TARGETS,
+        )
+        predictor.start()
+    if warmup is not None:
+        await warmup
+    # los jobs pendientes (de una instancia anterior) recién con los modelos listos
+    job_workers.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    # primero los jobs: los que estaban corriendo vuelven a la cola
+    await job_workers.close()
+    job_store.close()
+    await http_client.aclose()
+    pose_executor.shutdown()
+    if predictor is not None:
+        await predictor.close()
+
+
+def range_probe_bytes(settings: PoseSettings) -> int:
+    # el archivo disperso solo se puede leer con seek por muestra, y eso lo hace el backend pyav
+    return POSE_RANGE_PROBE_BYTES if POSE_RANGE_FETCH and settings.decoder == "pyav" else 0
+
+
+def _probe_range(probe_bytes: int) -> Optional[str]:
+    return f"bytes=0-{probe_bytes - 1}" if probe_bytes > 0 else None
+
+
+async def open_video_stream(
+    video_url: str, max_bytes: int = POSE_MAX_VIDEO_BYTES, range_header: Optional[str] = None, if_range: Optional[str] = None
+) -> httpx.Response:
+    """
+    Abre la descarga y valida headers sin leer el cuerpo todavía. Con `range_header`
+    ("bytes=a-b") la respuesta es 206 si el servidor soporta rangos o 200 con el
+    archivo entero.
+    """
+    from range_fetch import parse_content_range  # numpy: recién con el primer request
+
+    headers = {}
+    if range_header:
+        headers["Range"] = range_header
+        if if_range:
+            # si el objeto cambió el servidor manda 200 con el archivo nuevo completo
+            headers["If-Range"] = if_range
+    try:
+        with metrics.stage("connect"):
+            resp = await http_client.send(http_client.build_request("GET", video_url, headers=headers), stream=True)
+    except (httpx.HTTPError, httpx.InvalidURL):
         raise HTTPException(status_code=400, detail="No se pudo descargar el video.")
+
+    try:
+        if resp.status_code != 200 and not (range_header and resp.status_code == 206):
+            raise HTTPException(status_code=400, detail="No se pudo descargar el video.")
+
+        content_type = (resp.headers.get("Content-Type") or "").split(";")[0].strip().lower()
+        if content_type and not content_type.startswith(ALLOWED_VIDEO_CONTENT_TYPES):
+            raise HTTPException(status_code=415, detail=f"El recurso no es un video ({content_type}).")
+
+        if resp.status_code == 206:
+            size = str(parse_content_range(resp.headers.get("Content-Range")) or "")
+        else:
+            size = resp.headers.get("Content-Length", "")
+        if size.isdigit() and int(size) > max_bytes:
+            raise HTTPException(status_code=413, detail="El video excede el tamaño máximo permitido.")
+    except BaseException:
+        await resp.aclose()
+        raise
+    return resp
+
+
+async def save_stream_to_temp(resp: httpx.Response, max_bytes: int = POSE_MAX_VIDEO_BYTES, prefix: bytes = b"") -> tuple[str, str]:
+    # vuelca el cuerpo a un archivo temporal; devuelve (path, sha256 del contenido)
+    # `prefix`: principio del archivo ya descargado (resp trae el resto con Range)
     tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".mp4")
-    tmp.write(resp.content)
-    tmp.flush()
-    tmp.close()
-    return tmp.name
-
-
-def extract_pose_frames(video_path: str, target_frames: int) -> tuple[list, float]:
-    cap = cv2.VideoCapture(video_path)
-    if not cap.isOpened():
-        raise HTTPException(status_code=400, detail="No se pudo abrir el video.")
-
-    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
-    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
-    stride = max(1, int(total_frames / max(1, target_frames))) if total_frames > 0 else 1
-
-    mp_pose = mp.solutions.pose
-    pose = mp_pose.Pose(
-        static_image_mode=False,
-        model_complexity=0,
-        smooth_landmarks=True,
-        enable_segmentation=False,
-        min_detection_confidence=0.4,
-        min_tracking_confidence=0.4,
+    deadline = time.monotonic() + POSE_DOWNLOAD_DEADLINE_SEC
+    digest = hashlib.sha256(prefix)
+    written = len(prefix)
+    t0 = time.perf_counter()
+    try:
+        with tmp:
+            tmp.write(prefix)
+            async for chunk in resp.aiter_bytes(chunk_size=POSE_DOWNLOAD_CHUNK_BYTES):
+                written += len(chunk)
+                if written > max_bytes:
+                    raise HTTPException(status_code=413, detail="El video excede el tamaño máximo permitido.")
+                if time.monotonic() > deadline:
+                    raise HTTPException(status_code=504, detail="Tiempo de descarga del video agotado.")
+                digest.update(chunk)
+                tmp.write(chunk)
+    except BaseException as e:
+        _remove_quietly(tmp.name)
+        if isinstance(e, httpx.HTTPError):
+            raise HTTPException(status_code=400, detail="No se pudo descargar el video.")
+        raise
+    finally:
+        await resp.aclose()
+    metrics.record_download(written - len(prefix), time.perf_counter() - t0)
+    return tmp.name, digest.hexdigest()
+
+
+async def _save_ranges_to_temp(
+    video_url: str, resp: httpx.Response, target_frames: int, max_bytes: int
+) -> tuple[str, str, Optional[int]]:
+    # resp: 206 con el principio del archivo; se cierra acá
+    from range_fetch import RangeFetchUnsupported, fetch_partial, parse_content_range
+
+    t0 = time.perf_counter()
+    try:
+        total = parse_content_range(resp.headers.get("Content-Range"))
+        head = await resp.aread()
+    except httpx.HTTPError:
+        raise HTTPException(status_code=400, detail="No se pudo descargar el video.")
+    finally:
+        await resp.aclose()
+    etag = resp.headers.get("ETag")
+    if total is not None and len(head) >= total:
+        # el video entero entró en el primer rango
+        tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".mp4")
+        with tmp:
+            tmp.write(head)
+        metrics.record_download(len(head), time.perf_counter() - t0)
+        metrics.DOWNLOAD_MODE.labels("full").inc()
+        return tmp.name, f"sha256:{hashlib.sha256(head).hexdigest()}", None
+
+    async def fetch(start: int, end: int) -> bytes:
+        headers = {"Range": f"bytes={start}-{end - 1}"}
+        if etag:
+            # si el objeto cambió el servidor manda 200 y se baja completo
+            headers["If-Range"] = etag
+        r = await http_client.send(http_client.build_request("GET", video_url, headers=headers), stream=True)
+        try:
+            if r.status_code != 206:
+                raise RangeFetchUnsupported(f"Range request returned {r.status_code}")
+            data = await r.aread()
+        finally:
+            await r.aclose()
+        if len(data) != end - start:
+            raise RangeFetchUnsupported("Short range response")
+        return data
+
+    def sample_times(duration_sec: float, fps: float) -> list[float]:
+        return pose_common.sample_frame_times(duration_sec, fps, target_frames)
+
+    try:
+        if total is None:
+            raise RangeFetchUnsupported("Missing Content-Range total")
+        video = await asyncio.wait_for(
+            fetch_partial(
+                fetch,
+                head,
+                total,
+                sample_times,
+                margin=POSE_RANGE_MARGIN_FRAMES,
+                merge_gap=POSE_RANGE_MERGE_GAP_BYTES,
+                max_fraction=POSE_RANGE_MAX_FRACTION,
+                concurrency=POSE_RANGE_CONCURRENCY,
+            ),
+            timeout=POSE_DOWNLOAD_DEADLINE_SEC,
+        )
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Tiempo de descarga del video agotado.")
+    except httpx.HTTPError:
+        raise HTTPException(status_code=400, detail="No se pudo descargar el video.")
+    except RangeFetchUnsupported:
+        # completo: el resto del archivo a continuación del principio ya bajado
+        metrics.DOWNLOAD_MODE.labels("fallback").inc()
+        rest = await open_video_stream(video_url, max_bytes, f"bytes={len(head)}-", etag)
+        path, content_hash = await save_stream_to_temp(rest, max_bytes, head if rest.status_code == 206 else b"")
+        return path, f"sha256:{content_hash}", None
+    metrics.record_download(video.fetched_bytes, time.perf_counter() - t0)
+    metrics.DOWNLOAD_MODE.labels("range").inc()
+    # el extractor tiene que hacer seek en cada salto que el plan no bajó
+    return video.path, video.source, max(1, POSE_RANGE_MARGIN_FRAMES // 2)
+
+
+async def save_video(
+    video_url: str, resp: httpx.Response, target_frames: int, max_bytes: int = POSE_MAX_VIDEO_BYTES
+) -> tuple[str, str, Optional[int]]:
+    """
+    Baja el video de `resp` (ver open_video_stream) a un archivo temporal: parcial si
+    resp es un 206, completo si no (o si el parcial no aplica). Devuelve (path,
+    identidad del contenido para la cache, seek_gap para el extractor o None).
+    """
+    if resp.status_code == 206:
+        return await _save_ranges_to_temp(video_url, resp, target_frames, max_bytes)
+    path, content_hash = await save_stream_to_temp(resp, max_bytes)
+    metrics.DOWNLOAD_MODE.labels("full").inc()
+    return path, f"sha256:{content_hash}", None
+
+
+async def download_video(video_url: str, target_frames: int, probe_bytes: int = 0) -> tuple[str, str, Optional[int]]:
+    resp = await open_video_stream(video_url, range_header=_probe_range(probe_bytes))
+    return await save_video(video_url, resp, target_frames)
+
+
+def _remove_quietly(path: str) -> None:
+    try:
+        os.remove(path)
+    except Exception:
+        pass
+
+
+def _etag_source(video_url: str, etag: str) -> str:
+    # el query (p. ej. token de Firebase) no identifica el objeto; path + ETag sí
+    parts = urlsplit(video_url)
+    return f"etag:{parts.scheme}://{parts.netloc}{parts.path}:{etag}"
+
+
+async def _analyze_video_file(
+    video_path: str, target_frames: int, settings: PoseSettings, seek_gap: Optional[int] = None
+) -> PoseResult:
+    try:
+        return await pose_executor.run(video_path, target_frames, settings, seek_gap)
+    finally:
+        _remove_quietly(video_path)
+
+
+async def _compute_and_store(
+    video_path: str, target_frames: int, settings: PoseSettings, key: str, seek_gap: Optional[int] = None
+) -> PoseResult:
+    result = await _analyze_video_file(video_path, target_frames, settings, seek_gap)
+    await asyncio.to_thread(result_cache.put, key, result)
+    return result
+
+
+async def _cache_lookup(key: str) -> Optional[PoseResult]:
+    with metrics.stage("cache"):
+        cached = await asyncio.to_thread(result_cache.get, key)
+    metrics.CACHE_LOOKUPS.labels("hit" if cached is not None else "miss").inc()
+    return cached
+
+
+def request_settings(req) -> PoseSettings:
+    return PoseSettings(
+        max_long_side=POSE_MAX_LONG_SIDE if req.maxLongSide is None else req.maxLongSide,
+        roi=POSE_ROI if req.roi is None else req.roi,
+        decoder=POSE_DECODER,
     )
 
-    frames = []
-    frame_index = 0
-    collected = 0
-
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-        if frame_index % stride != 0:
-            frame_index += 1
-            continue
-
-        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        results = pose.process(rgb)
-
-        if results.pose_landmarks is not None:
-            landmarks = results.pose_landmarks.landmark
-            keypoints = []
-            for i, lm in enumerate(landmarks[: len(POSE_LANDMARK_NAMES)]):
-                x = float(np.clip(lm.x, 0.0, 1.0))
-                y = float(np.clip(lm.y, 0.0, 1.0))
-                v = float(np.clip(lm.visibility if lm.visibility is not None else 0.0, 0.0, 1.0))
-                name = POSE_LANDMARK_NAMES[i] if i < len(POSE_LANDMARK_NAMES) else f"kp_{i}"
-                keypoints.append({"name": name, "x": x, "y": y, "score": v})
-        else:
-            keypoints = [{"name": n, "x": 0.0, "y": 0.0, "score": 0.0} for n in POSE_LANDMARK_NAMES]
 
-        t_ms = int((frame_index / fps) * 1000)
-        frames.append({"tMs": t_ms, "keypoints": keypoints})
-        collected += 1
-        frame_index += 1
+async def compute_pose(video_url: str, target_frames: int, settings: PoseSettings = DEFAULT_POSE_SETTINGS) -> PoseResult:
+    probe_bytes = range_probe_bytes(settings)
+    if not POSE_CACHE_ENABLED:
+        video_path, _, seek_gap = await download_video(video_url, target_frames, probe_bytes)
+        return await _analyze_video_file(video_path, target_frames, settings, seek_gap)
 
-        if collected >= target_frames:
-            break
+    resp = await open_video_stream(video_url, range_header=_probe_range(probe_bytes))
+    # `owned`: resp (y luego el archivo temporal) pasa a ser responsabilidad de la
+    # ejecución compartida en cuanto este request la crea como líder del single-flight
+    owned = True
+    try:
+        etag = resp.headers.get("ETag")
+        if etag:
+            # con ETag se resuelve el hit antes de bajar el cuerpo
+            key = make_cache_key(_etag_source(video_url, etag), target_frames, settings)
+            cached = await _cache_lookup(key)
+            if cached is not None:
+                return cached
 
-    cap.release()
-    pose.close()
-    return frames, float(fps)
+            async def download_and_compute() -> PoseResult:
+                video_path, _, seek_gap = await save_video(video_url, resp, target_frames)
+                return await _compute_and_store(video_path, target_frames, settings, key, seek_gap)
 
+            def lead_download():
+                nonlocal owned
+                owned = False
+                return download_and_compute()
+
+            return await single_flight.do(key, lead_download)
+
+        owned = False  # save_video cierra resp
+        video_path, source, seek_gap = await save_video(video_url, resp, target_frames)
+    finally:
+        if owned:
+            await resp.aclose()
+
+    key = make_cache_key(source, target_frames, settings)
+    cached = await _cache_lookup(key)
+    if cached is not None:
+        _remove_quietly(video_path)
+        return cached
+
+    owned = True
+
+    def lead_compute():
+        nonlocal owned
+        owned = False
+        return _compute_and_store(video_path, target_frames, settings, key, seek_gap)
 
-@app.post("/pose", response_model=PoseResponse)
-def pose_endpoint(req: PoseRequest):
-    video_path = download_video_to_temp(req.videoUrl)
     try:
-        frames, fps = extract_pose_frames(video_path, req.targetFrames)
-        return {"frames": frames, "fps": fps}
+        return await single_flight.do(key, lead_compute)
     finally:
+        if owned:
+            _remove_quietly(video_path)
+
+
+async def run_guarded(request: Request, coro, deadline_sec: float = POSE_REQUEST_DEADLINE_SEC):
+    """Corre `coro` con deadline y la cancela si el cliente se desconecta."""
+    task = asyncio.ensure_future(asyncio.wait_for(coro, timeout=deadline_sec))
+
+    async def watch_disconnect() -> None:
+        while not await request.is_disconnected():
+            await asyncio.sleep(POSE_DISCONNECT_POLL_SEC)
+
+    watcher = asyncio.ensure_future(watch_disconnect())
+    try:
+        await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watcher.cancel()
+    if not task.done():
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+        raise HTTPException(status_code=499, detail="Cliente desconectado.")
+    try:
+        return task.result()
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Tiempo máximo de análisis agotado.")
+
+
+def _json_payload(result: PoseResult) -> dict:
+    return {"frames": pose_format.to_json_frames(result, POSE_LANDMARK_NAMES), "fps": result.fps}
+
+
+def render_pose_result(result: PoseResult, accept: str) -> Response:
+    with metrics.stage("serialize"):
+        return _render(result, pose_format.negotiate(accept))
+
+
+def _render(result: PoseResult, fmt: str) -> Response:
+    if fmt == "f32":
+        return Response(
+            pose_format.pack_pose_result(result),
+            media_type=pose_format.POSE_F32_MEDIA_TYPE,
+            headers=pose_format.binary_headers(result, POSE_LANDMARK_NAMES),
+        )
+    if fmt == "msgpack":
+        return Response(
+            pose_format.to_msgpack(result),
+            media_type=pose_format.MSGPACK_MEDIA_TYPES[0],
+            headers=pose_format.binary_headers(result, POSE_LANDMARK_NAMES),
+        )
+    return ORJSONResponse(_json_payload(result))
+
+
+def _with_server_timing(response: Response, timings: Optional[dict]) -> Response:
+    if timings:
+        response.headers["Server-Timing"] = metrics.server_timing_header(timings)
+    return response
+
+
+@app.middleware("http")
+async def request_metrics(request: Request, call_next):
+    t0 = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # template de la ruta (no el path concreto) para acotar la cardinalidad
+        route = request.scope.get("route")
+        endpoint = getattr(route, "path", "unmatched")
+        metrics.REQUEST_SECONDS.labels(endpoint, str(status)).observe(time.perf_counter() - t0)
+
+
+@app.post("/pose", response_model=PoseResponse)
+async def pose_endpoint(req: PoseRequest, request: Request):
+    timings = metrics.start_request_timing() if POSE_SERVER_TIMING else None
+    result = await run_guarded(request, compute_pose(req.videoUrl, req.targetFrames, request_settings(req)))
+    return _with_server_timing(render_pose_result(result, request.headers.get("accept", "")), timings)
+
+
+async def _batch_item(index: int, item: PoseRequest, semaphore: asyncio.Semaphore) -> dict:
+    async with semaphore:
         try:
-            os.remove(video_path)
+            result = await asyncio.wait_for(
+                compute_pose(item.videoUrl, item.targetFrames, request_settings(item)), POSE_REQUEST_DEADLINE_SEC
+            )
+            return {"index": index, "videoUrl": item.videoUrl, "ok": True, **_json_payload(result)}
+        except HTTPException as e:
+            return {"index": index, "videoUrl": item.videoUrl, "ok": False, "status": e.status_code, "error": e.detail}
+        except asyncio.TimeoutError:
+            error = "Tiempo máximo de análisis agotado."
+            return {"index": index, "videoUrl": item.videoUrl, "ok": False, "status": 504, "error": error}
         except Exception:
-            pass
+            error = "Error interno procesando el video."
+            return {"index": index, "videoUrl": item.videoUrl, "ok": False, "status": 500, "error": error}
+
+
+@app.post("/pose/batch")
+async def pose_batch_endpoint(req: PoseBatchRequest):
+    """
+    Procesa varios videos en paralelo y devuelve NDJSON: una línea por item en el
+    orden en que terminan (usar `index` para asociarlos). Un item fallido no corta el batch.
+    """
+    if not req.items:
+        raise HTTPException(status_code=400, detail="El batch no tiene items.")
+    if len(req.items) > POSE_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"El batch admite hasta {POSE_BATCH_MAX_ITEMS} items.")
+
+    semaphore = asyncio.Semaphore(POSE_BATCH_CONCURRENCY)
+
+    async def stream_results():
+        tasks = [asyncio.ensure_future(_batch_item(i, item, semaphore)) for i, item in enumerate(req.items)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield orjson.dumps(await next_done) + b"\n"
+        finally:
+            # si el cliente corta el stream se cancelan los items pendientes
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+
+# errores que pueden no repetirse (saturación, timeouts de descarga, errores internos)
+_RETRYABLE_STATUSES = (500, 502, 503, 504)
+
+
+async def _run_job(job: Job) -> bytes:
+    try:
+        # dentro del try: un payload guardado que ya no valida falla el job
+        req = PoseRequest(**job.request)
+        result = await asyncio.wait_for(
+            compute_pose(req.videoUrl, req.targetFrames, request_settings(req)), POSE_JOB_DEADLINE_SEC
+        )
+    except HTTPException as e:
+        raise JobFailed(e.status_code, e.detail, e.status_code in _RETRYABLE_STATUSES)
+    except asyncio.TimeoutError:
+        # otro intento tardaría lo mismo
+        raise JobFailed(504, "Tiempo máximo de análisis agotado.")
+    except ValidationError:
+        log.exception("Job %s has an invalid stored request", job.id)
+        raise JobFailed(400, "Request del job inválido.")
+    except Exception:
+        log.exception("Job %s failed", job.id)
+        raise JobFailed(500, "Error interno procesando el video.", retryable=True)
+    return pose_format.pack_pose_result(result)
+
+
+def _job_payload(job: Job, include_result: bool = True) -> dict:
+    out = {
+        "id": job.id,
+        "status": job.status,
+        "priority": job.priority,
+        "attempts": job.attempts,
+        "maxAttempts": job.max_attempts,
+        "createdAt": job.created_at,
+        "updatedAt": job.updated_at,
+        "videoUrl": job.request.get("videoUrl"),
+    }
+    if job.callback_url:
+        out["callback"] = job.callback_status
+    if job.status == job_queue.QUEUED and job.attempts:
+        out["retryAt"] = job.run_at
+    if job.error is not None:
+        out["error"] = job.error
+        out["errorStatus"] = job.error_status
+    if include_result and job.status == job_queue.DONE and job.result is not None:
+        out["result"] = _json_payload(pose_format.unpack_pose_result(job.result))
+    return out
+
+
+async def _notify_job(job: Job) -> None:
+    body = orjson.dumps(_job_payload(job))
+    headers = {"Content-Type": "application/json"}
+    if POSE_JOB_CALLBACK_SECRET:
+        signature = hmac.new(POSE_JOB_CALLBACK_SECRET.encode("utf-8"), body, hashlib.sha256).hexdigest()
+        headers["X-Pose-Signature"] = f"sha256={signature}"
+    resp = await http_client.post(job.callback_url, content=body, headers=headers, timeout=POSE_JOB_CALLBACK_TIMEOUT_SEC)
+    resp.raise_for_status()
+
+
+async def _get_job(job_id: str) -> Job:
+    job = await asyncio.to_thread(job_store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job inexistente o vencido.")
+    return job
+
+
+@app.post("/pose/jobs", status_code=202)
+async def create_pose_job(req: PoseJobRequest, response: Response):
+    """
+    Encola el análisis y responde enseguida con el id. El estado y el resultado se
+    consultan en GET /pose/jobs/{id}; con callbackUrl se recibe un POST con el
+    mismo JSON al terminar (al menos una vez).
+    """
+    request = {"videoUrl": req.videoUrl, "targetFrames": req.targetFrames, "maxLongSide": req.maxLongSide, "roi": req.roi}
+    try:
+        job = await asyncio.to_thread(job_store.enqueue, request, req.priority, req.callbackUrl, POSE_JOB_MAX_ATTEMPTS)
+    except JobQueueFull:
+        metrics.JOBS.labels("rejected").inc()
+        raise HTTPException(
+            status_code=503,
+            detail="Servicio saturado: cola de jobs llena. Reintentar más tarde.",
+            headers={"Retry-After": "30"},
+        )
+    metrics.JOBS.labels("enqueued").inc()
+    job_workers.wake()
+    response.headers["Location"] = f"/pose/jobs/{job.id}"
+    return _job_payload(job)
+
+
+@app.get("/pose/jobs/{job_id}")
+async def get_pose_job(job_id: str):
+    return ORJSONResponse(_job_payload(await _get_job(job_id)))
+
+
+@app.get("/pose/jobs/{job_id}/result")
+async def get_pose_job_result(job_id: str, request: Request):
+    """Solo el resultado, con la misma negociación de formato que /pose (JSON, msgpack o f32)."""
+    job = await _get_job(job_id)
+    if job.status == job_queue.FAILED:
+        raise HTTPException(status_code=job.error_status or 500, detail=job.error)
+    if job.status != job_queue.DONE:
+        raise HTTPException(status_code=409, detail="El job todavía no terminó.", headers={"Retry-After": "5"})
+    return render_pose_result(pose_format.unpack_pose_result(job.result), request.headers.get("accept", ""))
+
+
+async def _predict(req: PredictRequest) -> dict:
+    pose = None
+    if req.videoUrl is not None:
+        pose = await compute_pose(req.videoUrl, req.targetFrames, request_settings(req))
+        keypoints = pose.keypoints
+    else:
+        import numpy as np
+
+        try:
+            keypoints = np.asarray(req.keypoints, dtype=np.float32)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="keypoints debe tener forma [T, 33, 3].")
+
+    error = predictor.validate(keypoints)
+    if error:
+        raise HTTPException(status_code=400, detail=error)
+    with metrics.stage("predict"):
+        out = await predictor.predict(keypoints)
+    out["numFrames"] = int(keypoints.shape[0])
+    if pose is not None and req.includePose:
+        out["pose"] = _json_payload(pose)
+    return out
+
+
+@app.post("/predict")
+async def predict_endpoint(req: PredictRequest, request: Request):
+    """Predicción del TCN a partir de keypoints o de un video (un solo round trip: /pose + modelo)."""
+    if predictor is None:
+        raise HTTPException(status_code=503, detail="Modelo de predicción no disponible.")
+    if (req.keypoints is None) == (req.videoUrl is None):
+        raise HTTPException(status_code=400, detail="Enviar keypoints o videoUrl (uno de los dos).")
+    timings = metrics.start_request_timing() if POSE_SERVER_TIMING else None
+    out = await run_guarded(request, _predict(req))
+    with metrics.stage("serialize"):
+        response = ORJSONResponse(out)
+    return _with_server_timing(response, timings)
+
+
+@app.get("/cache/stats")
+def cache_stats():
+    return {**result_cache.snapshot(), "single_flight_shared": single_flight.shared}
+
+
+@app.get("/metrics")
+def metrics_endpoint():
+    body, content_type = metrics.render_latest()
+    return Response(body, media_type=content_type)
 
 
 @app.get("/health")
 def health_check():
-    return {"status": "ok"}
+    # ready: modelos precalentados (si POSE_POOL_WARMUP) y lugar en la cola
+    warmed = pose_executor is not None and (pose_executor.warmed or not POSE_POOL_WARMUP)
+    depth = pose_executor.queue_depth if pose_executor is not None else 0
+    capacity = pose_executor.capacity if pose_executor is not None else 0
+    ready = warmed and depth < capacity
+    return {
+        "status": "ok",
+        "ready": ready,
+        "warmed": warmed,
+        "queueDepth": depth,
+        "queueCapacity": capacity,
+        "predictor": predictor is not None,
+    }
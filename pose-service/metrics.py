@@ -0,0 +1,104 @@
+"""
+Métricas Prometheus de pose-service y tiempos por etapa de cada request.
+
+Las etapas medidas en el event loop (connect, download, cache, serialize) se
+registran con `stage(...)`; las que ocurren en el worker (open, pool_wait, decode,
+inference) vuelven en ExtractionStats y se cargan con `record_extraction(...)`.
+Ambas alimentan el histograma pose_stage_seconds y, si el request activó
+`start_request_timing()`, el header Server-Timing.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+from pose_common import ExtractionStats
+
+_STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+STAGE_SECONDS = Histogram("pose_stage_seconds", "Duración por etapa del análisis", ["stage"], buckets=_STAGE_BUCKETS)
+REQUEST_SECONDS = Histogram(
+    "pose_request_seconds", "Duración total por endpoint", ["endpoint", "status"], buckets=_STAGE_BUCKETS
+)
+DOWNLOAD_BYTES = Counter("pose_download_bytes", "Bytes de video descargados")
+DOWNLOAD_MODE = Counter(
+    "pose_download_mode", "Descargas por modo (range: parcial, full: completa, fallback: parcial no aplicable)", ["mode"]
+)
+DOWNLOAD_BYTES_PER_SECOND = Histogram(
+    "pose_download_bytes_per_second",
+    "Throughput de descarga por video",
+    buckets=tuple(2 ** i * 1024 for i in range(6, 18)),  # 64 KiB/s .. 128 MiB/s
+)
+FRAMES_DECODED = Counter("pose_frames_decoded", "Frames leídos del contenedor (incluye salteados)")
+FRAMES_PROCESSED = Counter("pose_frames_processed", "Frames procesados por MediaPipe")
+INFERENCE_MS_PER_FRAME = Histogram(
+    "pose_inference_ms_per_frame", "Inferencia MediaPipe por frame (ms)", buckets=(2, 5, 10, 15, 20, 30, 50, 75, 100, 200, 500)
+)
+CACHE_LOOKUPS = Counter("pose_cache_lookups", "Búsquedas en la cache de resultados", ["result"])
+QUEUE_DEPTH = Gauge("pose_queue_depth", "Trabajos en ejecución o en cola")
+JOBS = Counter("pose_jobs", "Eventos de /pose/jobs (enqueued, rejected, done, failed, retried, callback_failed)", ["event"])
+JOB_QUEUE_DEPTH = Gauge("pose_job_queue_depth", "Jobs en cola o en ejecución (todos los procesos)")
+
+_timings: ContextVar[Optional[dict]] = ContextVar("pose_timings", default=None)
+
+
+def start_request_timing() -> dict:
+    """Activa la acumulación de tiempos para el request actual (Server-Timing)."""
+    timings: dict = {}
+    _timings.set(timings)
+    return timings
+
+
+def observe_stage(name: str, seconds: float) -> None:
+    STAGE_SECONDS.labels(name).observe(seconds)
+    timings = _timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+@contextmanager
+def stage(name: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(name, time.perf_counter() - t0)
+
+
+def record_download(num_bytes: int, seconds: float) -> None:
+    observe_stage("download", seconds)
+    DOWNLOAD_BYTES.inc(num_bytes)
+    if seconds > 0:
+        DOWNLOAD_BYTES_PER_SECOND.observe(num_bytes / seconds)
+
+
+def record_extraction(stats: ExtractionStats, total_sec: float) -> None:
+    """`total_sec`: desde el submit al executor; la diferencia con el worker es cola + IPC."""
+    worker_sec = stats.open_sec + stats.pool_wait_sec + stats.decode_sec + stats.inference_sec
+    observe_stage("queue", max(0.0, total_sec - worker_sec))
+    observe_stage("open", stats.open_sec)
+    observe_stage("pool_wait", stats.pool_wait_sec)
+    observe_stage("decode", stats.decode_sec)
+    observe_stage("inference", stats.inference_sec)
+    FRAMES_DECODED.inc(stats.frames_decoded)
+    FRAMES_PROCESSED.inc(stats.frames_processed)
+    if stats.frames_processed:
+        INFERENCE_MS_PER_FRAME.observe(stats.inference_sec * 1000.0 / stats.frames_processed)
+
+
+def server_timing_header(timings: dict) -> str:
+    return ", ".join(f"{name};dur={seconds * 1000.0:.1f}" for name, seconds in timings.items())
+
+
+def bind_queue_depth(fn: Callable[[], float]) -> None:
+    QUEUE_DEPTH.set_function(fn)
+
+
+def bind_job_queue_depth(fn: Callable[[], float]) -> None:
+    JOB_QUEUE_DEPTH.set_function(fn)
+
+
+def render_latest() -> tuple[bytes, str]:
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,12 @@
+"""
+frame_preprocess, video_decoder y pose_normalize viven en ml/ y los usa también el servicio.
+En la imagen Docker se copian junto a los módulos del servicio (ver Dockerfile);
+corriendo desde el repo se agrega ml/ al path. Importar antes que a ellos.
+"""
+import os
+import sys
+
+ML_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "ml"))
+# al final del path: los módulos del servicio tienen prioridad ante un nombre repetido
+if os.path.isdir(ML_DIR) and ML_DIR not in sys.path:
+    sys.path.append(ML_DIR)
@@ -0,0 +1,135 @@
+"""
+Lo que el proceso del servidor necesita de pose_engine sin importarlo.
+
+pose_engine carga OpenCV, PyAV (vía video_decoder), numpy y, con el primer grafo,
+MediaPipe. En modo "process" nada de eso corre en el servidor: main y metrics
+importan solo este módulo (stdlib) y pose_engine se importa recién en los workers
+(`init_engine` / `extract_pose_frames` de acá abajo) o en el camino del modo "thread".
+"""
+import importlib.util
+from dataclasses import dataclass, replace
+from typing import Optional
+
+POSE_LANDMARK_NAMES = [
+    "nose",
+    "left_eye_inner",
+    "left_eye",
+    "left_eye_outer",
+    "right_eye_inner",
+    "right_eye",
+    "right_eye_outer",
+    "left_ear",
+    "right_ear",
+    "mouth_left",
+    "mouth_right",
+    "left_shoulder",
+    "right_shoulder",
+    "left_elbow",
+    "right_elbow",
+    "left_wrist",
+    "right_wrist",
+    "left_pinky",
+    "right_pinky",
+    "left_index",
+    "right_index",
+    "left_thumb",
+    "right_thumb",
+    "left_hip",
+    "right_hip",
+    "left_knee",
+    "right_knee",
+    "left_ankle",
+    "right_ankle",
+    "left_heel",
+    "right_heel",
+    "left_foot_index",
+    "right_foot_index",
+]
+
+DECODER_BACKENDS = ("auto", "pyav", "opencv")
+
+
+@dataclass(frozen=True)
+class PoseSettings:
+    model_complexity: int = 0
+    min_detection_confidence: float = 0.4
+    min_tracking_confidence: float = 0.4
+    # preprocesado (FramePreprocessor): no cambia el grafo, sí el resultado (y la key de cache)
+    max_long_side: int = 0
+    roi: bool = False
+    # backend de video_decoder ya resuelto ("pyav" u "opencv"): cambia tMs y el muestreo
+    decoder: str = "opencv"
+
+    def model_settings(self) -> "PoseSettings":
+        """Solo los parámetros del grafo: el pool comparte instancias entre preprocesados y decoders."""
+        return replace(self, max_long_side=0, roi=False, decoder="opencv")
+
+
+DEFAULT_POSE_SETTINGS = PoseSettings()
+
+
+@dataclass
+class ExtractionStats:
+    """Tiempos por etapa medidos dentro del worker (segundos)."""
+    frames_decoded: int = 0  # frames leídos del contenedor (grab), incluidos los salteados
+    frames_processed: int = 0  # frames que pasaron por MediaPipe
+    open_sec: float = 0.0
+    pool_wait_sec: float = 0.0
+    decode_sec: float = 0.0
+    inference_sec: float = 0.0
+
+
+class PosePoolExhausted(Exception):
+    pass
+
+
+class ExtractionCancelled(Exception):
+    pass
+
+
+class VideoUnreadable(Exception):
+    """video_decoder.VideoOpenError del lado del worker (esa clase vive junto a cv2/av)."""
+
+
+def resolve_decoder(backend: str) -> str:
+    # igual que video_decoder.resolve_backend, pero sin importar PyAV para saber si está
+    if backend not in DECODER_BACKENDS:
+        raise ValueError(f"Unknown decoder backend: {backend} (expected one of {DECODER_BACKENDS})")
+    has_av = importlib.util.find_spec("av") is not None
+    if backend == "auto":
+        return "pyav" if has_av else "opencv"
+    if backend == "pyav" and not has_av:
+        raise RuntimeError("PyAV is required for the pyav decoder. Please run: pip install av")
+    return backend
+
+
+def sample_frame_times(duration_sec: float, fps: float, target_frames: int) -> list[float]:
+    # tiempos repartidos uniformemente entre el primer y el último frame (como np.linspace)
+    if duration_sec <= 0 or target_frames <= 0:
+        return []
+    last = max(0.0, duration_sec - 1.0 / fps)
+    if target_frames == 1:
+        return [0.0]
+    step = last / (target_frames - 1)
+    return [i * step for i in range(target_frames - 1)] + [last]
+
+
+# Entradas del executor: el ProcessPoolExecutor las manda por nombre, así que el
+# worker importa pose_engine acá y el servidor no.
+
+def init_engine(pool_size: int, acquire_timeout: float, warmup_settings: Optional[PoseSettings], cancel_flags=None) -> None:
+    import pose_engine
+
+    pose_engine.init_engine(pool_size, acquire_timeout, warmup_settings, cancel_flags)
+
+
+def extract_pose_frames(*args):
+    import pose_engine
+
+    return pose_engine.extract_pose_frames(*args)
+
+
+def worker_ready() -> int:
+    import pose_engine
+
+    return pose_engine.worker_ready()
@@ -0,0 +1,251 @@
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+import cv2
+import numpy as np
+
+import ml_shared  # noqa: F401  (ml/ en el path: frame_preprocess, video_decoder)
+from frame_preprocess import FramePreprocessor
+from pose_common import (  # noqa: F401  (re-export: los tipos viven en pose_common)
+    DEFAULT_POSE_SETTINGS,
+    POSE_LANDMARK_NAMES,
+    ExtractionCancelled,
+    ExtractionStats,
+    PosePoolExhausted,
+    PoseSettings,
+    VideoUnreadable,
+    sample_frame_times,
+)
+from pose_format import PoseResult
+from video_decoder import VideoOpenError, open_video
+
+
+class PosePool:
+    """
+    Pool acotado y thread-safe de instancias mp.solutions.pose.Pose.
+    Mantiene hasta `size` instancias por cada PoseSettings; si no hay una libre
+    espera `acquire_timeout` segundos y luego lanza PosePoolExhausted.
+    """
+
+    def __init__(self, size: int, acquire_timeout: float):
+        self.size = max(1, size)
+        self.acquire_timeout = acquire_timeout
+        self._lock = threading.Lock()
+        self._idle: dict[PoseSettings, queue.LifoQueue] = {}
+        self._created: dict[PoseSettings, int] = {}
+
+    def _new_instance(self, settings: PoseSettings):
+        # mediapipe (~1 s de import) se carga con el primer grafo: en modo "process" el
+        # proceso del servidor no lo usa y arranca (y responde /health) sin importarlo
+        from mediapipe.python.solutions import pose as mp_pose
+
+        return mp_pose.Pose(
+            static_image_mode=False,
+            model_complexity=settings.model_complexity,
+            smooth_landmarks=True,
+            enable_segmentation=False,
+            min_detection_confidence=settings.min_detection_confidence,
+            min_tracking_confidence=settings.min_tracking_confidence,
+        )
+
+    def _reserve(self, settings: PoseSettings) -> tuple[queue.LifoQueue, bool]:
+        with self._lock:
+            idle = self._idle.setdefault(settings, queue.LifoQueue())
+            created = self._created.get(settings, 0)
+            can_create = idle.empty() and created < self.size
+            if can_create:
+                self._created[settings] = created + 1
+            return idle, can_create
+
+    def _unreserve(self, settings: PoseSettings) -> None:
+        with self._lock:
+            self._created[settings] = max(0, self._created.get(settings, 0) - 1)
+
+    def warmup(self, settings: PoseSettings) -> None:
+        # Crea el pool completo y corre una inferencia sobre un frame vacío
+        settings = settings.model_settings()
+        blank = np.zeros((256, 256, 3), dtype=np.uint8)
+        while True:
+            idle, can_create = self._reserve(settings)
+            if not can_create:
+                return
+            try:
+                pose = self._new_instance(settings)
+                pose.process(blank)
+            except Exception:
+                self._unreserve(settings)
+                raise
+            idle.put(pose)
+
+    def acquire(self, settings: PoseSettings):
+        settings = settings.model_settings()
+        idle, can_create = self._reserve(settings)
+        if can_create:
+            try:
+                return self._new_instance(settings)
+            except Exception:
+                self._unreserve(settings)
+                raise
+        try:
+            pose = idle.get(timeout=self.acquire_timeout)
+        except queue.Empty:
+            raise PosePoolExhausted(f"No hay instancias Pose libres ({self.size}) para {settings}")
+        try:
+            # limpiar el estado de tracking/suavizado del request anterior
+            pose.reset()
+        except Exception:
+            pose.close()
+            self._unreserve(settings)
+            raise
+        return pose
+
+    def release(self, settings: PoseSettings, pose) -> None:
+        self._idle[settings.model_settings()].put(pose)
+
+    @contextmanager
+    def checkout(self, settings: PoseSettings):
+        pose = self.acquire(settings)
+        try:
+            yield pose
+        finally:
+            self.release(settings, pose)
+
+    def close(self) -> None:
+        with self._lock:
+            for settings, idle in self._idle.items():
+                while not idle.empty():
+                    idle.get_nowait().close()
+                    self._created[settings] = max(0, self._created.get(settings, 0) - 1)
+
+
+# Estado por proceso: en modo "process" cada worker inicializa el suyo
+_pool: Optional[PosePool] = None
+_cancel_flags = None
+
+
+def init_engine(pool_size: int, acquire_timeout: float, warmup_settings: Optional[PoseSettings] = None, cancel_flags=None) -> None:
+    """
+    Inicializa el pool de Pose del proceso actual. `cancel_flags` es un buffer de
+    bytes compartido (multiprocessing.Array o bytearray): un 1 en el slot de un
+    trabajo indica que debe abortarse.
+    """
+    global _pool, _cancel_flags
+    _pool = PosePool(pool_size, acquire_timeout)
+    _cancel_flags = cancel_flags
+    if warmup_settings is not None:
+        _pool.warmup(warmup_settings)
+
+
+def close_engine() -> None:
+    if _pool is not None:
+        _pool.close()
+
+
+def get_pool() -> PosePool:
+    if _pool is None:
+        raise RuntimeError("pose_engine no inicializado (init_engine)")
+    return _pool
+
+
+def worker_ready() -> int:
+    """pid del worker ya inicializado (el warmup corre en init_engine)."""
+    if _pool is None:
+        raise RuntimeError("pose_engine no inicializado (init_engine)")
+    return os.getpid()
+
+
+def _is_cancelled(cancel_slot: Optional[int]) -> bool:
+    return cancel_slot is not None and _cancel_flags is not None and _cancel_flags[cancel_slot] != 0
+
+
+def sample_frame_indices(total_frames: int, target_frames: int) -> list[int]:
+    # índices repartidos uniformemente sobre todo el clip
+    if total_frames <= 0:
+        return []
+    if total_frames <= target_frames:
+        return list(range(total_frames))
+    picks = np.linspace(0, total_frames - 1, num=target_frames).round().astype(int)
+    return sorted(set(picks.tolist()))
+
+
+def extract_pose_frames(
+    video_path: str,
+    target_frames: int,
+    settings: PoseSettings = DEFAULT_POSE_SETTINGS,
+    seek_gap: int = 0,
+    cancel_slot: Optional[int] = None,
+    decoder_threads: int = 0,
+) -> tuple[PoseResult, ExtractionStats]:
+    stats = ExtractionStats()
+    t0 = time.perf_counter()
+    # con ROI el recorte se hace sobre el frame completo: el decoder no reduce
+    try:
+        decoder = open_video(video_path, settings.decoder, 0 if settings.roi else settings.max_long_side, decoder_threads)
+    except VideoOpenError as e:
+        raise VideoUnreadable(str(e)) from None
+    stats.open_sec = time.perf_counter() - t0
+    fps = decoder.info.fps
+
+    times = sample_frame_times(decoder.info.duration_sec, fps, target_frames) if decoder.accurate_timestamps else []
+    if times:
+        # por tiempo (PTS): no depende del conteo de frames del header (frame rate variable)
+        sampled = decoder.frames_at(times, seek_gap)
+        slots = len(times)
+    else:
+        indices = sample_frame_indices(decoder.info.frame_count, target_frames)
+        if not indices:
+            # sin conteo de frames confiable: primeros `target_frames` frames consecutivos
+            indices = range(target_frames)
+        sampled = decoder.frames(indices, seek_gap)
+        slots = len(indices)
+
+    J = len(POSE_LANDMARK_NAMES)
+    # frames sin detección quedan en 0 (x, y, score)
+    keypoints = np.zeros((slots, J, 3), dtype=np.float32)
+    t_ms = np.zeros(slots, dtype=np.int64)
+    collected = 0
+    pre = FramePreprocessor(settings.max_long_side, settings.roi)
+
+    try:
+        t0 = time.perf_counter()
+        with get_pool().checkout(settings) as pose:
+            stats.pool_wait_sec = time.perf_counter() - t0
+            while True:
+                t0 = time.perf_counter()
+                item = next(sampled, None)
+                t1 = time.perf_counter()
+                stats.decode_sec += t1 - t0
+                stats.frames_decoded = decoder.frames_decoded
+                if item is None:
+                    break
+                _, t_sec, frame = item
+                if _is_cancelled(cancel_slot):
+                    raise ExtractionCancelled()
+                if pre.active:
+                    results = pose.process(pre.prepare(frame))
+                else:
+                    results = pose.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+                stats.inference_sec += time.perf_counter() - t1
+
+                if results.pose_landmarks is not None:
+                    landmarks = results.pose_landmarks.landmark[:J]
+                    keypoints[collected, : len(landmarks)] = [(lm.x, lm.y, lm.visibility) for lm in landmarks]
+                    if pre.active:
+                        keypoints[collected] = pre.to_frame(keypoints[collected])
+                if pre.active and pre.update(keypoints[collected] if results.pose_landmarks is not None else None):
+                    # la caja cambió: el tracking/suavizado interno estaba en coordenadas del recorte anterior
+                    pose.reset()
+
+                t_ms[collected] = int(t_sec * 1000)
+                collected += 1
+    finally:
+        decoder.close()
+
+    keypoints = keypoints[:collected]
+    np.clip(keypoints, 0.0, 1.0, out=keypoints)
+    stats.frames_processed = collected
+    return PoseResult(t_ms=t_ms[:collected], keypoints=keypoints, fps=float(fps)), stats
@@ -0,0 +1,96 @@
+"""
+Formatos de respuesta de /pose.
+
+- JSON (default): {"frames": [{"tMs", "keypoints": [{"name", "x", "y", "score"}]}], "fps"}
+- application/x-pose-f32: binario little-endian
+      header  <4s I I I d : magic b"POS1", T, J, C, fps
+      tMs     int64[T]
+      kps     float32[T, J, C]   (C = x, y, score)
+- application/msgpack: {"fps", "shape": [T, J, C], "tMs": [...], "keypoints": bin float32}
+
+En los dos binarios los nombres de landmarks van una sola vez en el header
+X-Pose-Landmarks (separados por coma) y la forma en X-Pose-Shape.
+
+numpy se importa dentro de las funciones: main carga este módulo al arrancar y
+en modo "process" el servidor no lo necesita hasta el primer resultado.
+"""
+import struct
+from dataclasses import dataclass
+
+POSE_F32_MEDIA_TYPE = "application/x-pose-f32"
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+
+_HEADER = struct.Struct("<4sIIId")
+_MAGIC = b"POS1"
+
+
+@dataclass(frozen=True)
+class PoseResult:
+    t_ms: "np.ndarray"  # int64 [T]
+    keypoints: "np.ndarray"  # float32 [T, J, 3] (x, y, score)
+    fps: float
+
+
+def pack_pose_result(result: PoseResult) -> bytes:
+    import numpy as np
+
+    T, J, C = result.keypoints.shape
+    return b"".join([
+        _HEADER.pack(_MAGIC, T, J, C, float(result.fps)),
+        np.ascontiguousarray(result.t_ms, dtype="<i8").tobytes(),
+        np.ascontiguousarray(result.keypoints, dtype="<f4").tobytes(),
+    ])
+
+
+def unpack_pose_result(data: bytes) -> PoseResult:
+    import numpy as np
+
+    magic, T, J, C, fps = _HEADER.unpack_from(data, 0)
+    if magic != _MAGIC:
+        raise ValueError("Formato de pose desconocido")
+    offset = _HEADER.size
+    t_ms = np.frombuffer(data, dtype="<i8", count=T, offset=offset)
+    offset += T * 8
+    keypoints = np.frombuffer(data, dtype="<f4", count=T * J * C, offset=offset).reshape(T, J, C)
+    return PoseResult(t_ms=t_ms, keypoints=keypoints, fps=fps)
+
+
+def to_json_frames(result: PoseResult, names: list[str]) -> list:
+    # tolist() convierte todo el bloque de una vez; el loop solo arma los dicts
+    frames = []
+    for t_ms, kps in zip(result.t_ms.tolist(), result.keypoints.tolist()):
+        frames.append({
+            "tMs": t_ms,
+            "keypoints": [{"name": n, "x": x, "y": y, "score": s} for n, (x, y, s) in zip(names, kps)],
+        })
+    return frames
+
+
+def to_msgpack(result: PoseResult) -> bytes:
+    import msgpack
+    import numpy as np
+
+    return msgpack.packb({
+        "fps": float(result.fps),
+        "shape": list(result.keypoints.shape),
+        "tMs": result.t_ms.tolist(),
+        "keypoints": np.ascontiguousarray(result.keypoints, dtype="<f4").tobytes(),
+    })
+
+
+def binary_headers(result: PoseResult, names: list[str]) -> dict:
+    return {
+        "X-Pose-Landmarks": ",".join(names),
+        "X-Pose-Shape": ",".join(str(d) for d in result.keypoints.shape),
+        "X-Pose-Fps": repr(float(result.fps)),
+    }
+
+
+def negotiate(accept: str) -> str:
+    """Devuelve "f32", "msgpack" o "json" según el header Accept."""
+    accept = (accept or "").lower()
+    if POSE_F32_MEDIA_TYPE in accept:
+        return "f32"
+    if any(t in accept for t in MSGPACK_MEDIA_TYPES):
+        return "msgpack"
+    return "json"
@@ -0,0 +1,155 @@
+"""
+Inferencia del TCN exportado (ml/export_onnx.py) con ONNX Runtime.
+
+El modelo se carga una sola vez; los requests concurrentes se juntan en una
+ventana corta (micro-batching) y los de igual T se apilan en un solo run.
+Si el modelo se exportó con batch estático, cada item se corre por separado
+(igual se serializan en el mismo thread, sin bloquear el event loop).
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import suppress
+from dataclasses import dataclass, field
+from typing import Optional
+
+import numpy as np
+import onnxruntime as ort
+
+import ml_shared  # noqa: F401  (ml/ en el path: pose_normalize)
+from pose_normalize import normalize_sequence_xy
+
+
+def prepare_input(keypoints: np.ndarray) -> np.ndarray:
+    """keypoints [T, J, 3] (x, y, score) en [0, 1] -> entrada del modelo [T, J, 3] (igual que datasets.py)."""
+    return normalize_sequence_xy(np.asarray(keypoints, dtype=np.float32))
+
+
+def _sigmoid(x: np.ndarray) -> np.ndarray:
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+@dataclass
+class _Pending:
+    x: np.ndarray  # [T, J, C]
+    future: asyncio.Future = field(repr=False)
+
+
+class TCNPredictor:
+    def __init__(
+        self,
+        model_path: str,
+        intra_op_threads: int = 1,
+        inter_op_threads: int = 1,
+        max_batch: int = 16,
+        window_ms: float = 5.0,
+        label_names: Optional[list[str]] = None,
+        target_names: Optional[list[str]] = None,
+    ):
+        opts = ort.SessionOptions()
+        opts.intra_op_num_threads = max(1, intra_op_threads)
+        opts.inter_op_num_threads = max(1, inter_op_threads)
+        opts.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(model_path, sess_options=opts, providers=["CPUExecutionProvider"])
+
+        inp = self.session.get_inputs()[0]
+        self.input_name = inp.name
+        self.output_names = [o.name for o in self.session.get_outputs()]
+        batch_dim, time_dim = inp.shape[0], inp.shape[1]
+        # dims simbólicas (str/None) son dinámicas; int = fijas en el export
+        self.dynamic_batch = not isinstance(batch_dim, int)
+        self.fixed_T = time_dim if isinstance(time_dim, int) else None
+        self.num_joints = inp.shape[2] if isinstance(inp.shape[2], int) else 33
+
+        self.max_batch = max_batch if self.dynamic_batch else 1
+        self.window_sec = window_ms / 1000.0 if self.dynamic_batch else 0.0
+        self.label_names = label_names or []
+        self.target_names = target_names or []
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        # un solo thread: los runs se serializan y cada uno usa intra_op_threads
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="onnx")
+        self.batches = 0
+        self.items = 0
+
+    def start(self) -> None:
+        self._queue = asyncio.Queue()
+        self._task = asyncio.get_running_loop().create_task(self._batch_loop())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def validate(self, keypoints: np.ndarray) -> Optional[str]:
+        if keypoints.ndim != 3 or keypoints.shape[1] != self.num_joints or keypoints.shape[2] != 3:
+            return f"keypoints debe tener forma [T, {self.num_joints}, 3]."
+        if keypoints.shape[0] == 0:
+            return "keypoints no tiene frames."
+        if self.fixed_T is not None and keypoints.shape[0] != self.fixed_T:
+            return f"El modelo requiere exactamente {self.fixed_T} frames."
+        if not np.isfinite(keypoints).all():
+            return "keypoints contiene valores no finitos."
+        return None
+
+    async def predict(self, keypoints: np.ndarray) -> dict:
+        """keypoints [T, J, 3] (x, y, score) como los devuelve /pose."""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(_Pending(prepare_input(keypoints), future))
+        outputs = await future
+        return self._format(outputs)
+
+    def _format(self, outputs: dict) -> dict:
+        out: dict = {}
+        logits = outputs.get("logits")
+        if logits is not None:
+            probs = _sigmoid(logits)
+            out["logits"] = logits.tolist()
+            out["probabilities"] = probs.tolist()
+            if len(self.label_names) == len(probs):
+                out["labels"] = dict(zip(self.label_names, probs.tolist()))
+        preds = outputs.get("preds")
+        if preds is not None:
+            out["preds"] = preds.tolist()
+            if len(self.target_names) == len(preds):
+                out["targets"] = dict(zip(self.target_names, preds.tolist()))
+        return out
+
+    def _run(self, batch: np.ndarray) -> list:
+        return self.session.run(self.output_names, {self.input_name: batch})
+
+    async def _collect(self) -> list[_Pending]:
+        items = [await self._queue.get()]
+        if self.window_sec > 0 and len(items) < self.max_batch and self._queue.empty():
+            # ventana fija para que lleguen requests concurrentes
+            await asyncio.sleep(self.window_sec)
+        while len(items) < self.max_batch and not self._queue.empty():
+            items.append(self._queue.get_nowait())
+        return items
+
+    async def _batch_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            items = [p for p in await self._collect() if not p.future.done()]
+            # solo se apilan secuencias de igual T (el modelo no recibe máscara)
+            groups: dict[int, list[_Pending]] = {}
+            for p in items:
+                groups.setdefault(p.x.shape[0], []).append(p)
+            for group in groups.values():
+                batch = np.stack([p.x for p in group])
+                try:
+                    results = await loop.run_in_executor(self._executor, self._run, batch)
+                except Exception as e:
+                    for p in group:
+                        if not p.future.done():
+                            p.future.set_exception(e)
+                    continue
+                self.batches += 1
+                self.items += len(group)
+                for i, p in enumerate(group):
+                    if not p.future.done():
+                        p.future.set_result({name: r[i] for name, r in zip(self.output_names, results)})
+
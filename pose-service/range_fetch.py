@@ -0,0 +1,376 @@
+"""
+Descarga parcial de MP4/MOV con HTTP Range para análisis muestreado.
+
+1. Se recorren los boxes de primer nivel (el primer chunk ya vino en el GET
+   inicial con Range) hasta encontrar `moov`, esté al principio (faststart) o
+   al final del archivo.
+2. De la tabla de samples del track de video (stts/ctts/stss/stsc/stsz/stco)
+   salen tiempo, keyframe, offset y tamaño de cada frame.
+3. Para cada tiempo muestreado se baja desde el keyframe anterior hasta el
+   frame pedido más `margin` frames (reordenamiento de B-frames y lectura
+   adelantada del decoder). Los rangos cercanos se unen.
+4. Se arma un archivo disperso del tamaño original con los boxes de primer
+   nivel, el moov y esos rangos; el resto queda en cero. El decoder tiene que
+   hacer seek a cada muestra (ver `seek_gap` en main) en vez de leer de corrido.
+
+Si algo no cierra (no es MP4, MP4 fragmentado, tablas inconsistentes o el plan
+no ahorra lo suficiente) se lanza RangeFetchUnsupported y el llamador baja el
+archivo completo.
+"""
+import asyncio
+import hashlib
+import struct
+import tempfile
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional
+
+import numpy as np
+
+# boxes que pueden aparecer al principio de un MP4/MOV
+_TOP_LEVEL_FIRST = {b"ftyp", b"moov", b"mdat", b"free", b"skip", b"wide", b"pnot"}
+_MAX_TOP_LEVEL_BOXES = 64
+_MAX_MOOV_BYTES = 64 * 1024 * 1024
+
+FetchRange = Callable[[int, int], Awaitable[bytes]]
+
+
+class RangeFetchUnsupported(Exception):
+    pass
+
+
+@dataclass
+class Mp4Index:
+    """Samples del track de video en orden de decodificación."""
+    offsets: np.ndarray  # int64, offset en el archivo
+    sizes: np.ndarray  # int64
+    t_sec: np.ndarray  # float64, tiempo de presentación relativo al primer frame
+    sync: np.ndarray  # int64, índices de keyframes (crecientes)
+    duration_sec: float
+    fps: float
+
+
+@dataclass
+class PartialVideo:
+    path: str
+    source: str  # identidad del contenido para la cache: sha256 del moov + tamaño
+    total_bytes: int
+    fetched_bytes: int
+    requests: int  # requests de rango, incluidos los del índice
+
+
+def parse_content_range(value: Optional[str]) -> Optional[int]:
+    """Tamaño total de "bytes a-b/total"; None si falta o es "*"."""
+    if not value or "/" not in value:
+        return None
+    total = value.rsplit("/", 1)[1].strip()
+    return int(total) if total.isdigit() else None
+
+
+def _box_header(buf: bytes, pos: int, limit: int) -> Optional[tuple[bytes, int, int]]:
+    """
+    (tipo, tamaño total, tamaño del header) del box en `pos`, o None si el header no
+    está en `buf`. `limit` es el fin del contenedor (un tamaño 0 llega hasta ahí).
+    """
+    available = min(len(buf), limit)
+    if pos + 8 > available:
+        return None
+    size, kind = struct.unpack_from(">I4s", buf, pos)
+    header = 8
+    if size == 1:
+        if pos + 16 > available:
+            return None
+        size = struct.unpack_from(">Q", buf, pos + 8)[0]
+        header = 16
+    elif size == 0:
+        size = limit - pos
+    if size < header:
+        raise RangeFetchUnsupported(f"Invalid MP4 box size at {pos}")
+    return kind, size, header
+
+
+def _children(buf: bytes, start: int, end: int) -> dict:
+    out: dict = {}
+    pos = start
+    while pos + 8 <= end:
+        box = _box_header(buf, pos, end)
+        if box is None:
+            break
+        kind, size, header = box
+        out.setdefault(kind, []).append((pos + header, min(end, pos + size)))
+        pos += size
+    return out
+
+
+def _full_box(buf: bytes, start: int) -> tuple[int, int]:
+    """(version, inicio del payload) de un full box."""
+    return buf[start], start + 4
+
+
+def _table(buf: bytes, start: int, fmt: str, fields: int) -> np.ndarray:
+    """Tabla de un full box con entry_count: [count, fields] en big endian."""
+    _, pos = _full_box(buf, start)
+    count = struct.unpack_from(">I", buf, pos)[0]
+    dtype = np.dtype(fmt).newbyteorder(">")
+    end = pos + 4 + count * fields * dtype.itemsize
+    if end > len(buf):
+        raise RangeFetchUnsupported("Truncated MP4 sample table")
+    return np.frombuffer(buf, dtype=dtype, count=count * fields, offset=pos + 4).astype(np.int64).reshape(count, fields)
+
+
+def _video_trak(buf: bytes, moov: tuple[int, int]) -> tuple[dict, dict, int, int]:
+    boxes = _children(buf, *moov)
+    if b"mvex" in boxes:
+        raise RangeFetchUnsupported("Fragmented MP4 is not supported")
+    for trak in boxes.get(b"trak", []):
+        tb = _children(buf, *trak)
+        if b"mdia" not in tb:
+            continue
+        mdia = _children(buf, *tb[b"mdia"][0])
+        if b"hdlr" not in mdia or b"mdhd" not in mdia or b"minf" not in mdia:
+            continue
+        _, pos = _full_box(buf, mdia[b"hdlr"][0][0])
+        if buf[pos + 4:pos + 8] != b"vide":
+            continue
+        version, pos = _full_box(buf, mdia[b"mdhd"][0][0])
+        if version == 1:
+            timescale, duration = struct.unpack_from(">IQ", buf, pos + 16)
+        else:
+            timescale, duration = struct.unpack_from(">II", buf, pos + 8)
+        minf = _children(buf, *mdia[b"minf"][0])
+        if b"stbl" not in minf:
+            continue
+        return tb, _children(buf, *minf[b"stbl"][0]), timescale, duration
+    raise RangeFetchUnsupported("No video track in MP4")
+
+
+def _edit_media_time(buf: bytes, trak: dict) -> int:
+    # primer edit no vacío del elst: desde dónde empieza la presentación del track
+    if b"edts" not in trak:
+        return 0
+    edts = _children(buf, *trak[b"edts"][0])
+    if b"elst" not in edts:
+        return 0
+    version, pos = _full_box(buf, edts[b"elst"][0][0])
+    count = struct.unpack_from(">I", buf, pos)[0]
+    pos += 4
+    for _ in range(count):
+        if version == 1:
+            _, media_time = struct.unpack_from(">Qq", buf, pos)
+            pos += 20
+        else:
+            _, media_time = struct.unpack_from(">Ii", buf, pos)
+            pos += 12
+        if media_time >= 0:
+            return media_time
+    return 0
+
+
+def parse_moov(moov: bytes) -> Mp4Index:
+    """Tabla de samples del primer track de video del box moov (con su header)."""
+    try:
+        return _parse_moov(moov)
+    except (struct.error, ValueError, IndexError) as e:
+        raise RangeFetchUnsupported(f"Malformed moov box: {e}") from e
+
+
+def _parse_moov(moov: bytes) -> Mp4Index:
+    box = _box_header(moov, 0, len(moov))
+    if box is None:
+        raise RangeFetchUnsupported("Truncated moov box")
+    kind, _, header = box
+    if kind != b"moov":
+        raise RangeFetchUnsupported("Not a moov box")
+    trak, stbl, timescale, duration = _video_trak(moov, (header, len(moov)))
+    for required in (b"stts", b"stsc", b"stsz"):
+        if required not in stbl:
+            raise RangeFetchUnsupported(f"Missing {required.decode()} box")
+    if timescale <= 0:
+        raise RangeFetchUnsupported("Invalid MP4 timescale")
+
+    # tamaños
+    _, pos = _full_box(moov, stbl[b"stsz"][0][0])
+    sample_size, count = struct.unpack_from(">II", moov, pos)
+    if count == 0:
+        raise RangeFetchUnsupported("Empty video track")
+    if sample_size:
+        sizes = np.full(count, sample_size, dtype=np.int64)
+    else:
+        if pos + 8 + 4 * count > len(moov):
+            raise RangeFetchUnsupported("Truncated stsz box")
+        sizes = np.frombuffer(moov, dtype=">u4", count=count, offset=pos + 8).astype(np.int64)
+
+    # offsets: chunk -> samples por chunk (stsc) -> offset dentro del chunk
+    if b"stco" in stbl:
+        chunk_offsets = _table(moov, stbl[b"stco"][0][0], "u4", 1)[:, 0]
+    elif b"co64" in stbl:
+        chunk_offsets = _table(moov, stbl[b"co64"][0][0], "u8", 1)[:, 0]
+    else:
+        raise RangeFetchUnsupported("Missing chunk offsets")
+    stsc = _table(moov, stbl[b"stsc"][0][0], "u4", 3)
+    if len(stsc) == 0 or len(chunk_offsets) == 0:
+        raise RangeFetchUnsupported("Empty stsc/stco")
+    first_chunks = np.append(stsc[:, 0] - 1, len(chunk_offsets))
+    per_chunk = np.repeat(stsc[:, 1], np.maximum(0, np.diff(first_chunks)))[: len(chunk_offsets)]
+    if per_chunk.sum() < count:
+        raise RangeFetchUnsupported("Inconsistent stsc/stsz")
+    chunk_of_sample = np.repeat(np.arange(len(per_chunk)), per_chunk)[:count]
+    before = np.cumsum(sizes) - sizes  # bytes de los samples anteriores (global)
+    chunk_first = (np.cumsum(per_chunk) - per_chunk)[chunk_of_sample]
+    offsets = chunk_offsets[chunk_of_sample] + before - before[chunk_first]
+
+    # tiempos: dts (stts) + composition offset (ctts) - inicio del edit list
+    stts = _table(moov, stbl[b"stts"][0][0], "u4", 2)
+    deltas = np.repeat(stts[:, 1], stts[:, 0])
+    if len(deltas) < count:
+        raise RangeFetchUnsupported("Inconsistent stts/stsz")
+    dts = np.cumsum(deltas[:count]) - deltas[:count]
+    pts = dts
+    if b"ctts" in stbl:
+        ctts = _table(moov, stbl[b"ctts"][0][0], "i4", 2)
+        comp = np.repeat(ctts[:, 1], ctts[:, 0])
+        if len(comp) >= count:
+            pts = dts + comp[:count]
+    pts = pts - _edit_media_time(moov, trak)
+    t_sec = (pts - pts.min()) / timescale
+
+    if b"stss" in stbl:
+        sync = np.unique(_table(moov, stbl[b"stss"][0][0], "u4", 1)[:, 0] - 1)
+        sync = sync[(sync >= 0) & (sync < count)]
+        if len(sync) == 0 or sync[0] != 0:
+            sync = np.append(0, sync)
+    else:
+        sync = np.arange(count)  # sin stss todos los samples son keyframes
+
+    duration_sec = duration / timescale if duration else float(t_sec.max() + deltas[count - 1] / timescale)
+    if duration_sec <= 0:
+        raise RangeFetchUnsupported("Invalid MP4 duration")
+    return Mp4Index(offsets, sizes, t_sec, sync, duration_sec, count / duration_sec)
+
+
+def plan_ranges(index: Mp4Index, times: list[float], margin: int, merge_gap: int) -> list[tuple[int, int]]:
+    """Rangos [inicio, fin) de bytes para decodificar los frames más cercanos a `times`."""
+    n = len(index.sizes)
+    order = np.argsort(index.t_sec, kind="stable")  # orden de presentación -> sample
+    t_sorted = index.t_sec[order]
+    half = 0.5 / index.fps
+    spans = [(0, min(n - 1, margin))]  # primeros frames: apertura y probe del decoder
+    for target in times:
+        k = int(np.searchsorted(t_sorted, target - half, side="left"))
+        # el frame elegido y sus vecinos en presentación (diferencias de redondeo con el decoder)
+        near = order[max(0, k - 1): min(n, k + 2)]
+        if len(near) == 0:
+            continue
+        first, last = int(near.min()), int(near.max())
+        key = int(index.sync[max(0, np.searchsorted(index.sync, first, side="right") - 1)])
+        spans.append((key, min(n - 1, last + margin)))
+
+    # samples -> bytes; unir rangos cercanos (p. ej. audio intercalado)
+    ranges = []
+    for a, b in spans:
+        starts = index.offsets[a:b + 1]
+        ends = starts + index.sizes[a:b + 1]
+        ranges.extend(zip(starts.tolist(), ends.tolist()))
+    ranges.sort()
+    merged: list[list[int]] = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1] + merge_gap:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [(a, b) for a, b in merged]
+
+
+async def fetch_partial(
+    fetch: FetchRange,
+    head: bytes,
+    total_size: int,
+    sample_times: Callable[[float, float], list[float]],
+    margin: int = 8,
+    merge_gap: int = 64 * 1024,
+    max_fraction: float = 0.5,
+    concurrency: int = 4,
+) -> PartialVideo:
+    """
+    `fetch(inicio, fin)` baja [inicio, fin) con Range; `head` son los primeros bytes
+    del archivo (GET inicial) y `sample_times(duration_sec, fps)` los tiempos que va
+    a pedir el extractor. Devuelve el archivo disperso listo para decodificar.
+    """
+    pieces: list[tuple[int, bytes]] = [(0, head)]
+    fetched = len(head)
+    requests = 0
+
+    # 1. boxes de primer nivel hasta el moov
+    moov: Optional[bytes] = None
+    pos = 0
+    for i in range(_MAX_TOP_LEVEL_BOXES):
+        if pos >= total_size:
+            break
+        if pos + 16 <= len(head) or total_size <= len(head):
+            buf, base = head, 0
+        else:
+            buf = await fetch(pos, min(total_size, pos + 16))
+            base = pos
+            fetched += len(buf)
+            requests += 1
+            pieces.append((pos, buf))
+        header = _box_header(buf, pos - base, total_size - base)
+        if header is None:
+            raise RangeFetchUnsupported("Truncated MP4 box header")
+        kind, size, _ = header
+        if i == 0 and kind not in _TOP_LEVEL_FIRST:
+            raise RangeFetchUnsupported("Not an MP4/MOV file")
+        if kind == b"moof":
+            raise RangeFetchUnsupported("Fragmented MP4 is not supported")
+        if kind == b"moov":
+            if size > _MAX_MOOV_BYTES:
+                raise RangeFetchUnsupported("moov box too large")
+            if pos + size <= len(head):
+                moov = head[pos:pos + size]
+            else:
+                moov = await fetch(pos, pos + size)
+                fetched += len(moov)
+                requests += 1
+                pieces.append((pos, moov))
+            break
+        pos += size
+    if moov is None:
+        raise RangeFetchUnsupported("moov box not found")
+
+    # 2-3. índice y plan
+    index = parse_moov(moov)
+    planned = plan_ranges(index, sample_times(index.duration_sec, index.fps), margin, merge_gap)
+    have = len(head)
+    planned = [(max(a, have), b) for a, b in planned if b > have]
+    planned_bytes = sum(b - a for a, b in planned)
+    if fetched + planned_bytes > max_fraction * total_size:
+        raise RangeFetchUnsupported(f"Partial fetch would read {fetched + planned_bytes} of {total_size} bytes")
+
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def one(start: int, end: int) -> tuple[int, bytes]:
+        async with semaphore:
+            return start, await fetch(start, end)
+
+    tasks = [asyncio.ensure_future(one(a, b)) for a, b in planned]
+    try:
+        results = await asyncio.gather(*tasks)
+    except BaseException:
+        # un rango falló: no dejar los demás requests corriendo
+        for task in tasks:
+            task.cancel()
+        raise
+    for start, data in results:
+        pieces.append((start, data))
+        fetched += len(data)
+        requests += 1
+
+    # 4. archivo disperso del tamaño original
+    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".mp4")
+    with tmp:
+        tmp.truncate(total_size)
+        for start, data in pieces:
+            tmp.seek(start)
+            tmp.write(data)
+
+    source = f"moov:{hashlib.sha256(moov).hexdigest()}:{total_size}"
+    return PartialVideo(tmp.name, source, total_size, fetched, requests)
@@ -0,0 +1,184 @@
+import asyncio
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional
+
+import orjson
+
+
+def make_cache_key(source: str, *params: Any) -> str:
+    """source: identidad del video (hash de contenido o URL + ETag); params: settings del análisis."""
+    raw = "|".join([source, *(repr(p) for p in params)])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    Cache de resultados en dos niveles:
+    - memoria: LRU acotado por cantidad de entradas
+    - disco: un archivo por key (serializado con `encode`/`decode`, JSON por default),
+      acotado por bytes totales (se desaloja el menos usado)
+    """
+
+    def __init__(
+        self,
+        mem_items: int,
+        disk_dir: Optional[str],
+        disk_max_bytes: int,
+        encode: Callable[[Any], bytes] = orjson.dumps,
+        decode: Callable[[bytes], Any] = orjson.loads,
+        suffix: str = ".json",
+    ):
+        self.mem_items = max(0, mem_items)
+        self.disk_dir = disk_dir if disk_dir and disk_max_bytes > 0 else None
+        self.disk_max_bytes = disk_max_bytes
+        self.encode = encode
+        self.decode = decode
+        self.suffix = suffix
+        self._lock = threading.Lock()
+        self._mem: OrderedDict[str, Any] = OrderedDict()
+        self._disk_sizes: dict[str, int] = {}
+        self._disk_bytes = 0
+        self.stats = {"mem_hits": 0, "disk_hits": 0, "misses": 0, "puts": 0, "mem_evictions": 0, "disk_evictions": 0}
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            # reconstruir el índice del disco ordenado por último uso
+            entries = []
+            for name in os.listdir(self.disk_dir):
+                if not name.endswith(suffix):
+                    continue
+                st = os.stat(os.path.join(self.disk_dir, name))
+                entries.append((st.st_mtime, name[: -len(suffix)], st.st_size))
+            for _, key, size in sorted(entries):
+                self._disk_sizes[key] = size
+                self._disk_bytes += size
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key + self.suffix)
+
+    def _remember(self, key: str, value: Any) -> None:
+        if self.mem_items == 0:
+            return
+        self._mem[key] = value
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.mem_items:
+            self._mem.popitem(last=False)
+            self.stats["mem_evictions"] += 1
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            if key in self._mem:
+                self._mem.move_to_end(key)
+                self.stats["mem_hits"] += 1
+                return self._mem[key]
+            on_disk = self.disk_dir is not None and key in self._disk_sizes
+
+        if on_disk:
+            path = self._disk_path(key)
+            try:
+                with open(path, "rb") as f:
+                    value = self.decode(f.read())
+                os.utime(path)
+            except (OSError, ValueError):
+                value = None
+            with self._lock:
+                if value is not None:
+                    self._disk_sizes[key] = self._disk_sizes.pop(key, 0)
+                    self._remember(key, value)
+                    self.stats["disk_hits"] += 1
+                    return value
+                self._disk_bytes -= self._disk_sizes.pop(key, 0)
+
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+
+    def put(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._remember(key, value)
+            self.stats["puts"] += 1
+        if self.disk_dir is None:
+            return
+
+        data = self.encode(value)
+        if len(data) > self.disk_max_bytes:
+            return
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        evict = []
+        with self._lock:
+            self._disk_bytes += len(data) - self._disk_sizes.pop(key, 0)
+            self._disk_sizes[key] = len(data)
+            # dict conserva orden de inserción/uso: los primeros son los menos recientes
+            while self._disk_bytes > self.disk_max_bytes and self._disk_sizes:
+                old_key = next(iter(self._disk_sizes))
+                self._disk_bytes -= self._disk_sizes.pop(old_key)
+                self.stats["disk_evictions"] += 1
+                evict.append(old_key)
+        for old_key in evict:
+            try:
+                os.remove(self._disk_path(old_key))
+            except OSError:
+                pass
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            lookups = self.stats["mem_hits"] + self.stats["disk_hits"] + self.stats["misses"]
+            hits = self.stats["mem_hits"] + self.stats["disk_hits"]
+            return {
+                **self.stats,
+                "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+                "mem_entries": len(self._mem),
+                "disk_entries": len(self._disk_sizes),
+                "disk_bytes": self._disk_bytes,
+            }
+
+
+class _Flight:
+    def __init__(self, task: "asyncio.Task"):
+        self.task = task
+        self.waiters = 0
+        self.abandoned = False
+
+
+class AsyncSingleFlight:
+    """
+    Llamadas concurrentes con la misma key comparten una única ejecución de `fn`.
+    La ejecución compartida solo se cancela cuando se cancelan todos los que la esperan.
+    """
+
+    def __init__(self):
+        self._calls: dict[str, _Flight] = {}
+        self.shared = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        flight = self._calls.get(key)
+        if flight is None or flight.abandoned:
+            flight = _Flight(asyncio.ensure_future(fn()))
+            self._calls[key] = flight
+
+            def forget(_task, key=key, flight=flight) -> None:
+                if self._calls.get(key) is flight:
+                    del self._calls[key]
+
+            flight.task.add_done_callback(forget)
+        else:
+            self.shared += 1
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if flight.waiters == 1 and not flight.task.done():
+                flight.abandoned = True
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
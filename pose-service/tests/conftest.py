@@ -0,0 +1,5 @@
+import os
+import sys
+
+# los módulos del servicio se importan planos (como desde main.py)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
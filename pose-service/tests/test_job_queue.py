@@ -0,0 +1,113 @@
+import asyncio
+import time
+
+import pytest
+
+from job_queue import DONE, FAILED, QUEUED, RUNNING, JobFailed, JobQueueFull, JobStore, JobWorkers
+
+
+@pytest.fixture
+def store(tmp_path):
+    s = JobStore(str(tmp_path / "jobs.sqlite3"), max_depth=4)
+    yield s
+    s.close()
+
+
+def test_claim_complete(store):
+    job = store.enqueue({"videoUrl": "http://x/a.mp4"})
+    assert store.get(job.id).status == QUEUED
+
+    claimed = store.claim(lease_sec=60)
+    assert (claimed.id, claimed.status, claimed.attempts) == (job.id, RUNNING, 1)
+    assert store.claim(lease_sec=60) is None  # con lease vigente nadie más lo toma
+
+    store.complete(job.id, b"result")
+    done = store.get(job.id)
+    assert (done.status, done.result, done.error) == (DONE, b"result", None)
+    assert store.depth() == 0
+
+
+def test_claim_by_priority_then_age(store):
+    low = store.enqueue({"n": 1}, priority=0)
+    high = store.enqueue({"n": 2}, priority=5)
+    low2 = store.enqueue({"n": 3}, priority=0)
+    assert [store.claim(60).id for _ in range(3)] == [high.id, low.id, low2.id]
+
+
+def test_fail_retryable_requeues_until_attempts_run_out(store):
+    job = store.enqueue({}, max_attempts=2)
+    first = store.claim(60)
+    assert store.fail(first, 503, "busy", retry_delay_sec=60) == QUEUED
+    assert store.get(job.id).status == QUEUED
+    assert store.claim(60) is None  # todavía no es su run_at
+
+    store.fail(first, 503, "busy", retry_delay_sec=0)  # run_at = ahora
+    second = store.claim(60)
+    assert second.attempts == 2
+    assert store.fail(second, 503, "busy", retry_delay_sec=0) == FAILED
+    failed = store.get(job.id)
+    assert (failed.status, failed.error_status, failed.error) == (FAILED, 503, "busy")
+
+
+def test_fail_not_retryable(store):
+    store.enqueue({})
+    job = store.claim(60)
+    assert store.fail(job, 400, "bad video", retry_delay_sec=None) == FAILED
+
+
+def test_expired_lease_is_retaken_then_failed(store):
+    job = store.enqueue({}, max_attempts=2)
+    assert store.claim(lease_sec=0).attempts == 1  # worker perdido
+    retaken = store.claim(lease_sec=0)
+    assert (retaken.id, retaken.status, retaken.attempts) == (job.id, RUNNING, 2)
+    lost = store.claim(lease_sec=0)
+    assert (lost.status, lost.error_status) == (FAILED, 500)
+    assert store.get(job.id).status == FAILED
+
+
+def test_release_keeps_attempt(store):
+    store.enqueue({})
+    job = store.claim(60)
+    store.release(job)
+    again = store.claim(60)
+    assert (again.id, again.attempts) == (job.id, 1)
+
+
+def test_queue_full_and_purge(store):
+    for i in range(4):
+        store.enqueue({"n": i})
+    with pytest.raises(JobQueueFull):
+        store.enqueue({})
+    claimed = store.claim(60)
+    store.complete(claimed.id, b"")
+    store.enqueue({})  # el terminado ya no cuenta
+    time.sleep(0.01)
+    assert store.purge(ttl_sec=0) == 1
+    assert store.get(claimed.id) is None
+
+
+def test_workers_retry_then_complete(store):
+    calls = []
+
+    async def handler(job):
+        calls.append(job.attempts)
+        if job.attempts == 1:
+            raise JobFailed(503, "busy", retryable=True)
+        return b"ok"
+
+    async def scenario():
+        workers = JobWorkers(store, handler, retry_base_sec=0.0, poll_sec=0.01)
+        job = store.enqueue({})
+        workers.start()
+        try:
+            for _ in range(500):
+                if store.get(job.id).status == DONE:
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            await workers.close()
+        return store.get(job.id)
+
+    job = asyncio.run(scenario())
+    assert (job.status, job.attempts, job.result) == (DONE, 2, b"ok")
+    assert calls == [1, 2]
@@ -0,0 +1,146 @@
+import asyncio
+import os
+import struct
+
+import numpy as np
+import pytest
+
+from range_fetch import RangeFetchUnsupported, _box_header, fetch_partial, parse_content_range, parse_moov
+
+cv2 = pytest.importorskip("cv2")
+
+FPS, FRAMES = 30.0, 60
+
+
+def _top_level(data: bytes) -> list:
+    boxes, pos = [], 0
+    while pos < len(data):
+        kind, size, _ = _box_header(data, pos, len(data))
+        boxes.append((kind, pos, size))
+        pos += size
+    return boxes
+
+
+@pytest.fixture(scope="module")
+def mp4(tmp_path_factory) -> bytes:
+    # OpenCV escribe el moov al final (sin faststart)
+    path = str(tmp_path_factory.mktemp("clip") / "clip.mp4")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), FPS, (96, 64))
+    rng = np.random.default_rng(0)
+    for _ in range(FRAMES):
+        writer.write(rng.integers(0, 255, (64, 96, 3), dtype=np.uint8))
+    writer.release()
+    with open(path, "rb") as f:
+        data = f.read()
+    kinds = [k for k, _, _ in _top_level(data)]
+    assert kinds.index(b"moov") > kinds.index(b"mdat")
+    return data
+
+
+def _moov(data: bytes) -> bytes:
+    (_, pos, size), = [b for b in _top_level(data) if b[0] == b"moov"]
+    return data[pos:pos + size]
+
+
+def _stco_to_co64(buf: bytes, start: int, end: int) -> bytes:
+    # reescribe los boxes de [start, end) cambiando stco por co64 (ajusta los tamaños de los padres)
+    out, pos = b"", start
+    while pos < end:
+        kind, size, header = _box_header(buf, pos, end)
+        payload = buf[pos + header:pos + size]
+        if kind in (b"moov", b"trak", b"mdia", b"minf", b"stbl"):
+            payload = _stco_to_co64(buf, pos + header, pos + size)
+        elif kind == b"stco":
+            count = struct.unpack_from(">I", payload, 4)[0]
+            entries = struct.unpack_from(f">{count}I", payload, 8)
+            kind, payload = b"co64", payload[:8] + struct.pack(f">{count}Q", *entries)
+        out += struct.pack(">I4s", 8 + len(payload), kind) + payload
+        pos += size
+    return out
+
+
+def _check_index(index, data: bytes) -> None:
+    assert len(index.sizes) == FRAMES
+    assert index.fps == pytest.approx(FPS)
+    assert index.duration_sec == pytest.approx(FRAMES / FPS)
+    assert index.sync[0] == 0 and np.all(np.diff(index.sync) > 0)
+    np.testing.assert_allclose(np.sort(index.t_sec), np.arange(FRAMES) / FPS, atol=1e-6)
+    (_, mdat, mdat_size), = [b for b in _top_level(data) if b[0] == b"mdat"]
+    assert np.all(index.offsets >= mdat) and np.all(index.offsets + index.sizes <= mdat + mdat_size)
+    assert np.all(np.diff(index.offsets) == index.sizes[:-1])  # un solo track: samples contiguos
+    for off in index.offsets[:5].tolist():
+        assert data[off:off + 3] == b"\x00\x00\x01"  # start code MPEG-4
+
+
+def test_parse_moov_at_end(mp4):
+    _check_index(parse_moov(_moov(mp4)), mp4)
+
+
+def test_parse_moov_co64(mp4):
+    moov = _moov(mp4)
+    co64 = _stco_to_co64(moov, 0, len(moov))
+    assert b"co64" in co64 and b"stco" not in co64
+    np.testing.assert_array_equal(parse_moov(co64).offsets, parse_moov(moov).offsets)
+
+
+def test_parse_moov_rejects_garbage():
+    with pytest.raises(RangeFetchUnsupported):
+        parse_moov(b"\x00\x00\x00\x10free" + b"\x00" * 8)
+
+
+def test_parse_content_range():
+    assert parse_content_range("bytes 0-99/1234") == 1234
+    assert parse_content_range("bytes 0-99/*") is None
+    assert parse_content_range(None) is None
+
+
+def _run_fetch(data: bytes, head_bytes: int, times: list, **kwargs):
+    calls = []
+
+    async def fetch(start: int, end: int) -> bytes:
+        calls.append((start, end))
+        return data[start:end]
+
+    result = asyncio.run(fetch_partial(fetch, data[:head_bytes], len(data), lambda d, fps: times, **kwargs))
+    return result, calls
+
+
+def test_fetch_partial_builds_sparse_file(mp4):
+    result, calls = _run_fetch(mp4, 64, [1.0], margin=1, merge_gap=0, max_fraction=1.0)
+    try:
+        with open(result.path, "rb") as f:
+            sparse = f.read()
+    finally:
+        os.remove(result.path)
+
+    assert len(sparse) == result.total_bytes == len(mp4)
+    assert result.requests == len(calls)
+    assert result.fetched_bytes == 64 + sum(b - a for a, b in calls)
+    assert result.fetched_bytes < len(mp4)
+    assert result.source.startswith("moov:")
+
+    fetched = np.zeros(len(mp4), dtype=bool)
+    fetched[:64] = True
+    for a, b in calls:
+        fetched[a:b] = True
+    buf, orig = np.frombuffer(sparse, dtype=np.uint8), np.frombuffer(mp4, dtype=np.uint8)
+    np.testing.assert_array_equal(buf[fetched], orig[fetched])
+    assert not buf[~fetched].any()  # lo que no se bajó queda en cero
+
+    # moov completo y el frame pedido (t=1 s) bajado
+    (_, pos, size), = [b for b in _top_level(mp4) if b[0] == b"moov"]
+    assert fetched[pos:pos + size].all()
+    index = parse_moov(_moov(mp4))
+    k = int(np.argmin(np.abs(index.t_sec - 1.0)))
+    assert fetched[index.offsets[k]:index.offsets[k] + index.sizes[k]].all()
+
+
+def test_fetch_partial_over_budget(mp4):
+    with pytest.raises(RangeFetchUnsupported):
+        _run_fetch(mp4, 64, [i / FPS for i in range(FRAMES)], max_fraction=0.1)
+
+
+def test_fetch_partial_not_mp4():
+    data = b"<html>" + b"x" * 1000
+    with pytest.raises(RangeFetchUnsupported):
+        _run_fetch(data, 64, [0.0])
@@ -0,0 +1,61 @@
+import asyncio
+
+from result_cache import AsyncSingleFlight, ResultCache, make_cache_key
+
+
+def test_make_cache_key_depends_on_params():
+    assert make_cache_key("sha256:a", 16) == make_cache_key("sha256:a", 16)
+    assert make_cache_key("sha256:a", 16) != make_cache_key("sha256:a", 32)
+
+
+def test_memory_lru_evicts_least_recent():
+    cache = ResultCache(2, None, 0)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1  # "b" queda como el menos usado
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.stats["mem_evictions"] == 1
+
+
+def test_disk_tier_survives_restart_and_respects_budget(tmp_path):
+    value = {"frames": list(range(20))}
+    size = len(ResultCache(0, None, 0).encode(value))
+    cache = ResultCache(0, str(tmp_path), disk_max_bytes=2 * size)
+    cache.put("a", value)
+    cache.put("b", value)
+    assert cache.get("a") == value  # "b" queda como el menos usado
+    cache.put("c", value)
+    assert cache.get("b") is None
+    assert cache.snapshot()["disk_entries"] == 2
+
+    reopened = ResultCache(1, str(tmp_path), disk_max_bytes=2 * size)
+    assert reopened.get("c") == value
+    assert reopened.stats["disk_hits"] == 1
+    assert reopened.get("c") == value
+    assert reopened.stats["mem_hits"] == 1
+
+
+def test_corrupt_disk_entry_is_a_miss(tmp_path):
+    cache = ResultCache(0, str(tmp_path), disk_max_bytes=1024)
+    cache.put("a", {"x": 1})
+    (tmp_path / "a.json").write_bytes(b"{not json")
+    assert cache.get("a") is None
+    assert cache.snapshot()["disk_bytes"] == 0
+
+
+def test_single_flight_runs_once():
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return 42
+
+    async def scenario():
+        flight = AsyncSingleFlight()
+        return await asyncio.gather(*(flight.do("k", compute) for _ in range(5)))
+
+    assert asyncio.run(scenario()) == [42] * 5
+    assert calls == [1]